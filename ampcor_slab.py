@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+u"""
+ampcor_slab.py
+
+Run an AMPCOR chunk on SLC slabs staged to node-local scratch. The
+reference and secondary azimuth slabs of the chunk are copied from the
+shared storage with one sequential read each, AMPCOR runs in the staging
+directory, and its output is converted to full scene coordinates and
+appended to the chunk output file (next to the chunk .in file) while
+AMPCOR runs - so that the progress monitor keeps working.
+
+The command line is the AMPCOR command line prefixed by the wrapper:
+    ampcor_slab.py [options] <ampcor binary> <chunk .in file> old
+
+Staging directories left by killed wrappers are removed by the next
+wrapper started on the same node.
+
+usage: ampcor_slab.py [-h] [--scratch SCRATCH] [--pad PAD] [--poll POLL]
+    ampcor in_file [flag]
+
+Run an AMPCOR chunk on SLC slabs staged to local scratch.
+
+positional arguments:
+  ampcor                AMPCOR binary.
+  in_file               Chunk AMPCOR input parameter file (.in).
+  flag                  AMPCOR flag.
+
+options:
+  -h, --help            show this help message and exit
+  --scratch SCRATCH     Node-local scratch directory - Def: $TMPDIR.
+  --pad PAD             Slab padding [lines] - Def: window + search height.
+  --poll POLL           Output conversion interval [s].
+
+PYTHON DEPENDENCIES:
+    argparse: Parser for command-line options, arguments and sub-commands
+           https://docs.python.org/3/library/argparse.html
+"""
+# - Python Dependencies
+from __future__ import print_function
+import os
+import sys
+import time
+import glob
+import ctypes
+import shutil
+import signal
+import socket
+import argparse
+import tempfile
+import subprocess
+# - Package Dependencies
+from utils.ampcor_chunks import read_ampcor_in
+from utils.slc_staging import stage_chunk, unstage_lines
+
+# - Staging directories prefix
+STAGE_PREFIX = 'ampcor_slab_'
+
+
+def kill_with_parent() -> None:
+    """
+    Linux: kill the AMPCOR process if the wrapper dies (PR_SET_PDEATHSIG)
+    :return: None
+    """
+    try:
+        ctypes.CDLL('libc.so.6').prctl(1, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def clean_stale(scratch: str) -> None:
+    """
+    Remove the staging directories of the dead wrappers of this node
+    :param scratch: scratch directory
+    :return: None
+    """
+    host = socket.gethostname()
+    for stage_dir in glob.glob(os.path.join(scratch,
+                                            f'{STAGE_PREFIX}{host}_*')):
+        pid = int(stage_dir.rsplit('_', 1)[1])
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+        except PermissionError:
+            continue
+
+
+def run_staged(ampcor: str, in_path: str, flag: str = 'old',
+               scratch: str = None, pad: int = None,
+               poll: float = 5.) -> int:
+    """
+    Stage the chunk slabs, run AMPCOR and convert its output
+    :param ampcor: AMPCOR binary
+    :param in_path: absolute path to the chunk .in file
+    :param flag: AMPCOR flag
+    :param scratch: node-local scratch directory
+    :param pad: slab padding [lines]
+    :param poll: output conversion interval [s]
+    :return: AMPCOR exit status
+    """
+    scratch = scratch if scratch else tempfile.gettempdir()
+    clean_stale(scratch)
+    out_path = os.path.join(os.path.dirname(in_path),
+                            read_ampcor_in(in_path)['out_name'])
+    stage_dir = os.path.join(
+        scratch, f'{STAGE_PREFIX}{socket.gethostname()}_{os.getpid()}')
+    os.makedirs(stage_dir)
+    try:
+        t_start = time.monotonic()
+        staged = stage_chunk(in_path, stage_dir, pad=pad)
+        print(f"# - Slabs staged: {staged['bytes'] / 2 ** 20:.1f} MB in "
+              f"{time.monotonic() - t_start:.1f} s - reference/secondary "
+              f"first lines: {staged['ref_start']}/{staged['sec_start']}",
+              flush=True)
+        proc = subprocess.Popen([ampcor, os.path.basename(staged['in_path']),
+                                 flag], cwd=stage_dir,
+                                preexec_fn=kill_with_parent)
+        f_pos = 0
+        partial = ''
+        with open(out_path, 'w', encoding='utf8') as w_fid:
+            while True:
+                # - Wake up as soon as AMPCOR exits - or after poll seconds
+                try:
+                    returncode = proc.wait(timeout=poll)
+                except subprocess.TimeoutExpired:
+                    returncode = None
+                # - Convert the complete lines written since the last pass
+                if os.path.isfile(staged['out_path']):
+                    with open(staged['out_path'], 'r',
+                              encoding='utf8') as r_fid:
+                        r_fid.seek(f_pos)
+                        lines = (partial + r_fid.read()).split('\n')
+                        f_pos = r_fid.tell()
+                    partial = lines.pop()
+                    for line in unstage_lines(lines, staged['ref_start'],
+                                              staged['sec_start']):
+                        w_fid.write(line + '\n')
+                    w_fid.flush()
+                if returncode is not None:
+                    break
+            if partial:
+                w_fid.write(unstage_lines([partial], staged['ref_start'],
+                                          staged['sec_start'])[0])
+    finally:
+        shutil.rmtree(stage_dir, ignore_errors=True)
+    return returncode
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""Run an AMPCOR chunk on SLC slabs staged to local
+        scratch."""
+    )
+    parser.add_argument('ampcor', type=str, help='AMPCOR binary.')
+    parser.add_argument('in_file', type=str,
+                        help='Chunk AMPCOR input parameter file (.in).')
+    parser.add_argument('flag', type=str, nargs='?', default='old',
+                        help='AMPCOR flag.')
+    parser.add_argument('--scratch', type=str, default=None,
+                        help='Node-local scratch directory - Def: $TMPDIR.')
+    parser.add_argument('--pad', type=int, default=None,
+                        help='Slab padding [lines] - Def: window + search '
+                             'height.')
+    parser.add_argument('--poll', type=float, default=5.,
+                        help='Output conversion interval [s].')
+    args = parser.parse_args()
+
+    sys.exit(run_staged(args.ampcor, os.path.abspath(args.in_file),
+                        flag=args.flag, scratch=args.scratch, pad=args.pad,
+                        poll=args.poll))
+
+
+# - run main program
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+u"""
+ampcor_worker.py
+
+Drain a shared-filesystem job queue filled by c_ampcor_iceye.py
+(--queue_dir). Any number of workers can be started on any node that
+mounts the queue directory. Each worker leases one chunk at a time per
+process slot and renews its leases while the chunks run; the chunks of
+crashed workers are returned to the queue when their lease expires.
+
+usage: ampcor_worker.py [-h] [--n_proc N_PROC] [--timeout TIMEOUT]
+    [--poll POLL] [--exit_when_idle] [--affinity] queue_dir
+
+Run the AMPCOR chunks of a shared job queue.
+
+positional arguments:
+  queue_dir             Queue directory.
+
+options:
+  -h, --help            show this help message and exit
+  --n_proc N_PROC, -N N_PROC
+                        Number of Parallel Processes.
+  --timeout TIMEOUT     Chunk wall-time limit [s].
+  --poll POLL           Queue polling interval [s].
+  --exit_when_idle      Exit when no chunk is pending instead of waiting
+                        for the queue to complete.
+  --affinity            Pin the processes to cores spread across NUMA
+                        nodes.
+
+PYTHON DEPENDENCIES:
+    argparse: Parser for command-line options, arguments and sub-commands
+           https://docs.python.org/3/library/argparse.html
+"""
+# - Python Dependencies
+from __future__ import print_function
+import os
+import argparse
+import datetime
+# - Package Dependencies
+from utils.job_queue import queue_worker, queue_status, QUEUE_POLL
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""Run the AMPCOR chunks of a shared job queue."""
+    )
+    parser.add_argument('queue_dir', type=str, help='Queue directory.')
+    parser.add_argument('--n_proc', '-N', type=int, default=os.cpu_count(),
+                        help='Number of Parallel Processes.')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Chunk wall-time limit [s].')
+    parser.add_argument('--poll', type=float, default=QUEUE_POLL,
+                        help='Queue polling interval [s].')
+    parser.add_argument('--exit_when_idle', action='store_true',
+                        help='Exit when no chunk is pending instead of '
+                             'waiting for the queue to complete.')
+    parser.add_argument('--affinity', action='store_true',
+                        help='Pin the processes to cores spread across '
+                             'NUMA nodes.')
+    args = parser.parse_args()
+
+    queue_dir = os.path.abspath(args.queue_dir)
+    results = queue_worker(queue_dir, n_proc=args.n_proc,
+                           timeout=args.timeout, poll=args.poll,
+                           exit_when_idle=args.exit_when_idle,
+                           affinity=args.affinity)
+    n_failed = sum(res['returncode'] != 0 for res in results.values())
+    print(f'# - Chunks run: {len(results)} - failed attempts: {n_failed}')
+    print(f'# - Queue status: {queue_status(queue_dir)}')
+
+
+# - run main program
+if __name__ == '__main__':
+    start_time = datetime.datetime.now()
+    main()
+    end_time = datetime.datetime.now()
+    print(f"# - Computation Time: {end_time - start_time}")
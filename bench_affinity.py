@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+u"""
+bench_affinity.py
+
+Measure the throughput of parallel memory-bandwidth bound workers run by
+the managed executor with and without CPU affinity/NUMA placement.
+Each worker runs a STREAM-like triad (a = b + s * c) on arrays larger than
+the CPU caches - the access pattern of the AMPCOR/native tracker workers
+reading their SLC chunks.
+
+usage: bench_affinity.py [-h] [--n_workers N_WORKERS] [--n_jobs N_JOBS]
+    [--size SIZE] [--reps REPS] [--rounds ROUNDS]
+
+Benchmark CPU affinity/NUMA placement of parallel workers.
+
+options:
+  -h, --help            show this help message and exit
+  --n_workers N_WORKERS, -N N_WORKERS
+                        Number of concurrent workers - Def: number of CPUs.
+  --n_jobs N_JOBS, -J N_JOBS
+                        Number of jobs - Def: 2 x number of workers.
+  --size SIZE, -S SIZE  Array size of each worker [MB].
+  --reps REPS, -R REPS  Number of triad repetitions of each job.
+  --rounds ROUNDS       Number of benchmark rounds per placement mode.
+
+PYTHON DEPENDENCIES:
+    numpy: Fundamental package for scientific computing with Python
+           https://numpy.org
+"""
+# - Python Dependencies
+from __future__ import print_function
+import os
+import sys
+import time
+import argparse
+import datetime
+import numpy as np
+# - Package Dependencies
+from utils.executor import run_jobs
+from utils.cpu_affinity import numa_nodes, affinity_supported
+
+
+def triad_worker(size: int, reps: int) -> None:
+    """
+    STREAM-like triad kernel
+    :param size: array size [MB]
+    :param reps: number of repetitions
+    :return: None
+    """
+    n_elem = size * 2 ** 20 // 8
+    a_arr = np.zeros(n_elem)
+    b_arr = np.ones(n_elem)
+    c_arr = np.full(n_elem, 2.)
+    for _ in range(reps):
+        np.multiply(c_arr, 3., out=a_arr)
+        np.add(a_arr, b_arr, out=a_arr)
+
+
+def run_benchmark(n_workers: int, n_jobs: int, size: int, reps: int,
+                  affinity: bool) -> float:
+    """
+    Run the triad jobs through the executor
+    :param n_workers: number of concurrent workers
+    :param n_jobs: number of jobs
+    :param size: array size of each job [MB]
+    :param reps: number of triad repetitions of each job
+    :param affinity: enable CPU affinity/NUMA placement
+    :return: aggregate throughput [GB/s]
+    """
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker',
+           '--size', str(size), '--reps', str(reps)]
+    jobs = [{'name': f'triad_{i}', 'cmd': cmd} for i in range(n_jobs)]
+    t_start = time.monotonic()
+    results = run_jobs(jobs, max_workers=n_workers, affinity=affinity,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall_time = time.monotonic() - t_start
+    if any(res['returncode'] != 0 for res in results.values()):
+        raise RuntimeError('# - Benchmark worker failed.')
+    # - Triad traffic: 2 reads + 1 write per element and operation pair
+    n_bytes = n_jobs * reps * 3 * size * 2 ** 20 * 2
+    return n_bytes / wall_time / 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""Benchmark CPU affinity/NUMA placement of parallel
+        workers."""
+    )
+    parser.add_argument('--n_workers', '-N', type=int,
+                        default=os.cpu_count(),
+                        help='Number of concurrent workers - '
+                             'Def: number of CPUs.')
+    parser.add_argument('--n_jobs', '-J', type=int, default=None,
+                        help='Number of jobs - Def: 2 x number of workers.')
+    parser.add_argument('--size', '-S', type=int, default=256,
+                        help='Array size of each worker [MB].')
+    parser.add_argument('--reps', '-R', type=int, default=20,
+                        help='Number of triad repetitions of each job.')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='Number of benchmark rounds per placement '
+                             'mode.')
+    parser.add_argument('--worker', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        triad_worker(args.size, args.reps)
+        return
+
+    if not affinity_supported():
+        print('# - CPU affinity not supported on this platform.')
+        return
+    n_jobs = args.n_jobs if args.n_jobs else 2 * args.n_workers
+    nodes = numa_nodes()
+    print(f'# - NUMA nodes: {len(nodes)} - CPUs: '
+          f'{sum(len(n) for n in nodes)}')
+    print(f'# - Workers: {args.n_workers} - Jobs: {n_jobs} - '
+          f'Array Size: {args.size} MB\n')
+
+    throughput = {False: [], True: []}
+    # - Alternate the placement modes to average out system noise
+    for _ in range(args.rounds):
+        for affinity in (False, True):
+            throughput[affinity].append(
+                run_benchmark(args.n_workers, n_jobs, args.size,
+                              args.reps, affinity))
+    for affinity, label in ((False, 'unpinned'), (True, 'pinned')):
+        print(f'# - {label:8}: {np.median(throughput[affinity]):7.2f} GB/s '
+              f'(median of {args.rounds})')
+    speedup = np.median(throughput[True]) / np.median(throughput[False])
+    print(f'# - Speedup: {speedup:.2f}x')
+
+
+# - run main program
+if __name__ == '__main__':
+    start_time = datetime.datetime.now()
+    main()
+    end_time = datetime.datetime.now()
+    print(f"# - Computation Time: {end_time - start_time}")
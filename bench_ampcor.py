@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+u"""
+bench_ampcor.py
+
+Benchmark the AMPCOR orchestration with the mock AMPCOR binary
+(mock_ampcor.py) on a synthetic offsets grid. For each scheduler mode and
+number of parallel processes, the chunks are planned, written and run as
+in interf_proc.py, and the following metrics are reported:
+    - wall: run wall time [s]
+    - util: busy fraction of the worker slots - sum of the chunks wall
+      times over (wall x n_proc)
+    - cpu: CPU utilization - sum of the chunks CPU times over
+      (wall x n_proc). Meaningful with --mock_mode cpu.
+    - tail: straggler tail - time from the first worker slot left without
+      chunks to run to the end of the run [s]
+    - valid: number of chunks whose output passed validation
+
+Scheduler modes:
+    - static: one chunk per process (chunk_factor = 1)
+    - dynamic: chunk_factor chunks per process pulled by idle workers
+    - history: dynamic, chunks sized with the runtime history recorded by
+      an untimed warm-up run
+    - queue: dynamic, chunks run through the shared-filesystem job queue
+    - speculate: dynamic, with backup copies of the straggling chunks
+
+usage: bench_ampcor.py [-h]
+    [--modes {static,dynamic,history,queue,speculate} [...]]
+    [--n_proc N_PROC [N_PROC ...]] [--chunk_factor CHUNK_FACTOR]
+    [--n_lines N_LINES] [--n_samples N_SAMPLES] [--rate RATE] [--skew SKEW]
+    [--jitter JITTER] [--mock_mode {sleep,cpu}] [--repeats REPEATS]
+    [--work_dir WORK_DIR] [--output OUTPUT]
+
+Benchmark the AMPCOR scheduling with a mock AMPCOR binary.
+
+options:
+  -h, --help            show this help message and exit
+  --modes {static,dynamic,history,queue,speculate} [...]
+                        Scheduler modes.
+  --n_proc N_PROC [N_PROC ...], -N N_PROC [N_PROC ...]
+                        Numbers of Parallel Processes.
+  --chunk_factor CHUNK_FACTOR, -C CHUNK_FACTOR
+                        Number of AMPCOR chunks per process.
+  --n_lines N_LINES     Scene azimuth lines.
+  --n_samples N_SAMPLES
+                        Scene range samples.
+  --rate RATE           Mock AMPCOR cost per offset [s].
+  --skew SKEW           Mock AMPCOR cost increase at the last scene line.
+  --jitter JITTER       Mock AMPCOR per-block cost jitter (sigma).
+  --mock_mode {sleep,cpu}
+                        Mock AMPCOR sleeps or burns CPU.
+  --repeats REPEATS     Number of runs of each configuration.
+  --work_dir WORK_DIR   Working directory - Def: temporary directory.
+  --output OUTPUT       Save the benchmark results (JSON).
+
+PYTHON DEPENDENCIES:
+    argparse: Parser for command-line options, arguments and sub-commands
+           https://docs.python.org/3/library/argparse.html
+    numpy: Fundamental package for scientific computing with Python
+           https://numpy.org
+"""
+# - Python Dependencies
+from __future__ import print_function
+import os
+import json
+import shutil
+import argparse
+import datetime
+import tempfile
+import numpy as np
+# - Package Dependencies
+from utils.ampcor_chunks import (plan_chunks, write_ampcor_chunks,
+                                 ampcor_jobs, validate_chunk)
+from utils.ampcor_history import (write_chunk_plan, record_runtimes,
+                                  load_history, cost_profile)
+from utils.executor import run_jobs
+from utils.ampcor_monitor import AmpcorMonitor
+from utils.ampcor_speculate import AmpcorSpeculator
+from utils.job_queue import (init_queue, submit_jobs, queue_worker,
+                             queue_results)
+
+# - Mock AMPCOR binary
+MOCK_AMPCOR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'mock_ampcor.py')
+# - Offsets spacing [lines/samples]
+SPACING = 30
+# - Scheduler modes
+SCHED_MODES = ('static', 'dynamic', 'history', 'queue', 'speculate')
+
+
+def plan_run(run_dir: str, n_lines: int, n_samples: int, n_chunks: int,
+             profile: np.ndarray = None) -> str:
+    """
+    Plan the chunks of a synthetic scene and write their .in files
+    :param run_dir: run directory
+    :param n_lines: scene azimuth lines
+    :param n_samples: scene range samples
+    :param n_chunks: number of chunks
+    :param profile: azimuth cost profile - see ampcor_history.cost_profile
+    :return: absolute path to the bat file
+    """
+    os.makedirs(run_dir, exist_ok=True)
+    chunks = plan_chunks(SPACING, n_lines - SPACING, SPACING, n_chunks,
+                         x_start=1, x_end=n_samples, range_spacing=SPACING,
+                         profile=profile)
+    bat_path = write_ampcor_chunks(run_dir, 'ref', 'sec', chunks,
+                                   MOCK_AMPCOR, n_samples, n_samples,
+                                   SPACING, SPACING)
+    write_chunk_plan(os.path.join(run_dir, 'chunks_ref-sec.json'), chunks,
+                     int((n_lines - SPACING) / SPACING),
+                     history_key='bench', line_spacing=SPACING,
+                     range_spacing=SPACING, window=[64, 64])
+    return bat_path
+
+
+def run_chunks(bat_path: str, n_proc: int, use_queue: bool = False,
+               speculate: bool = False) -> dict:
+    """
+    Run the chunks of a bat file
+    :param bat_path: absolute path to the bat file
+    :param n_proc: number of parallel processes
+    :param use_queue: run the chunks through the shared job queue
+    :param speculate: run backup copies of the straggling chunks
+    :return: result of each chunk - see executor.run_jobs
+    """
+    jobs = ampcor_jobs(bat_path)
+    run_dir = os.path.dirname(bat_path)
+    if speculate:
+        monitor = AmpcorMonitor([job['in_path'] for job in jobs])
+        speculator = AmpcorSpeculator(monitor, jobs, min_runtime=1.,
+                                      interval=0.5)
+
+        def promote(name: str, result: dict) -> None:
+            if not result['cancelled']:
+                speculator.promote(name, result)
+
+        return run_jobs(jobs, max_workers=n_proc, cwd=run_dir,
+                        speculate=speculator, callback=promote)
+    if not use_queue:
+        return run_jobs(jobs, max_workers=n_proc, cwd=run_dir)
+    queue_dir = os.path.join(run_dir, 'queue')
+    init_queue(queue_dir)
+    submit_jobs(queue_dir, jobs)
+    queue_worker(queue_dir, n_proc=n_proc, poll=0.5)
+    return queue_results(queue_dir)
+
+
+def run_metrics(bat_path: str, results: dict, wall: float,
+                n_proc: int) -> dict:
+    """
+    Compute the metrics of a run
+    :param bat_path: absolute path to the bat file
+    :param results: result of each chunk - see executor.run_jobs
+    :param wall: run wall time [s]
+    :param n_proc: number of parallel processes
+    :return: Python dictionary containing the run metrics
+    """
+    ends = np.sort([res['end_time'] for res in results.values()])
+    # - After the (n_chunks - n_proc + 1)-th chunk ends, no chunk is left
+    # - to start and worker slots become idle.
+    first_idle = ends[max(len(ends) - n_proc, 0)]
+    n_valid = sum(validate_chunk(job['in_path'])['status'] == 'done'
+                  for job in ampcor_jobs(bat_path))
+    return {
+        'wall': wall,
+        'util': sum(r['wall_time'] for r in results.values())
+        / (wall * n_proc),
+        'cpu': sum(r['cpu_time'] for r in results.values())
+        / (wall * n_proc),
+        'tail': ends[-1] - first_idle,
+        'valid': n_valid,
+        'n_chunks': len(results),
+    }
+
+
+def run_mode(mode: str, n_proc: int, args: argparse.Namespace,
+             run_dir: str) -> dict:
+    """
+    Benchmark a scheduler mode
+    :param mode: scheduler mode - see SCHED_MODES
+    :param n_proc: number of parallel processes
+    :param args: benchmark parameters
+    :param run_dir: run directory
+    :return: Python dictionary containing the run metrics
+    """
+    chunk_factor = 1 if mode == 'static' else args.chunk_factor
+    n_chunks = chunk_factor * n_proc
+    profile = None
+    if mode == 'history':
+        # - Untimed warm-up run recording the chunks runtimes
+        hist_path = os.path.join(run_dir, 'history.json')
+        bat_path = plan_run(os.path.join(run_dir, 'warmup'), args.n_lines,
+                            args.n_samples, n_chunks)
+        results = run_chunks(bat_path, n_proc)
+        with open(os.path.join(os.path.dirname(bat_path),
+                               'chunks_ref-sec.json'), 'r') as r_fid:
+            record_runtimes(hist_path, json.load(r_fid),
+                            {job['chunk']: results[job['name']]['wall_time']
+                             for job in ampcor_jobs(bat_path)})
+        profile = cost_profile(load_history(hist_path, 'bench'))
+
+    bat_path = plan_run(os.path.join(run_dir, mode), args.n_lines,
+                        args.n_samples, n_chunks, profile=profile)
+    t_start = datetime.datetime.now()
+    results = run_chunks(bat_path, n_proc, use_queue=mode == 'queue',
+                         speculate=mode == 'speculate')
+    wall = (datetime.datetime.now() - t_start).total_seconds()
+    return run_metrics(bat_path, results, wall, n_proc)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""Benchmark the AMPCOR scheduling with a mock AMPCOR
+        binary."""
+    )
+    parser.add_argument('--modes', type=str, nargs='+',
+                        default=list(SCHED_MODES), choices=SCHED_MODES,
+                        help='Scheduler modes.')
+    parser.add_argument('--n_proc', '-N', type=int, nargs='+',
+                        default=[2, 4],
+                        help='Numbers of Parallel Processes.')
+    parser.add_argument('--chunk_factor', '-C', type=int, default=6,
+                        help='Number of AMPCOR chunks per process.')
+    parser.add_argument('--n_lines', type=int, default=6000,
+                        help='Scene azimuth lines.')
+    parser.add_argument('--n_samples', type=int, default=3000,
+                        help='Scene range samples.')
+    parser.add_argument('--rate', type=float, default=1e-3,
+                        help='Mock AMPCOR cost per offset [s].')
+    parser.add_argument('--skew', type=float, default=3.,
+                        help='Mock AMPCOR cost increase at the last scene '
+                             'line.')
+    parser.add_argument('--jitter', type=float, default=0.2,
+                        help='Mock AMPCOR per-block cost jitter (sigma).')
+    parser.add_argument('--mock_mode', type=str, default='sleep',
+                        choices=['sleep', 'cpu'],
+                        help='Mock AMPCOR sleeps or burns CPU.')
+    parser.add_argument('--repeats', type=int, default=1,
+                        help='Number of runs of each configuration.')
+    parser.add_argument('--work_dir', type=str, default=None,
+                        help='Working directory - Def: temporary '
+                             'directory.')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Save the benchmark results (JSON).')
+    args = parser.parse_args()
+
+    # - Mock AMPCOR cost parameters - inherited by the chunk processes
+    os.environ.update({'MOCK_AMPCOR_RATE': str(args.rate),
+                       'MOCK_AMPCOR_SKEW': str(args.skew),
+                       'MOCK_AMPCOR_JITTER': str(args.jitter),
+                       'MOCK_AMPCOR_SCENE_LINES': str(args.n_lines),
+                       'MOCK_AMPCOR_MODE': args.mock_mode})
+    work_dir = args.work_dir if args.work_dir \
+        else tempfile.mkdtemp(prefix='bench_ampcor_')
+
+    bench = []
+    print(f"{'mode':>8} {'n_proc':>6} {'wall':>8} {'util':>6} {'cpu':>6} "
+          f"{'tail':>8} {'valid':>7}")
+    for n_proc in args.n_proc:
+        for mode in args.modes:
+            for i_r in range(args.repeats):
+                run_dir = os.path.join(work_dir, f'{mode}_{n_proc}_{i_r}')
+                metrics = run_mode(mode, n_proc, args, run_dir)
+                bench.append({'mode': mode, 'n_proc': n_proc, **metrics})
+                print(f"{mode:>8} {n_proc:6d} {metrics['wall']:8.2f} "
+                      f"{metrics['util']:6.2f} {metrics['cpu']:6.2f} "
+                      f"{metrics['tail']:8.2f} "
+                      f"{metrics['valid']:3d}/{metrics['n_chunks']:<3d}")
+                shutil.rmtree(run_dir)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as w_fid:
+            json.dump({'parameters': vars(args), 'runs': bench}, w_fid,
+                      indent=1)
+    if not args.work_dir:
+        shutil.rmtree(work_dir)
+
+
+# - run main program
+if __name__ == '__main__':
+    start_time = datetime.datetime.now()
+    main()
+    end_time = datetime.datetime.now()
+    print(f"# - Computation Time: {end_time - start_time}")
@@ -10,6 +10,9 @@ NOTE: Before Running this script, a preliminary constant offset between the
       must have been calculated.
 
 usage: c_ampcor_iceye.py [-h] [--directory DIRECTORY] [--n_proc N_PROC]
+    [--chunk_factor CHUNK_FACTOR] [--n_rn_tiles N_RN_TILES]
+    [--history_key HISTORY_KEY] [--queue_dir QUEUE_DIR] [--stage_slabs]
+    [--scratch SCRATCH]
     [--ampcor {ampcor_large,ampcor_large2,ampcor_superlarge2}] ref_slc sec_slc
 
 Create the bat file to run AMPCOR.
@@ -25,6 +28,19 @@ COMMAND LINE OPTIONS:
                             Data directory.
       --n_proc N_PROC, -N N_PROC
                             Number of Parallel Processes.
+      --chunk_factor CHUNK_FACTOR, -C CHUNK_FACTOR
+                            Number of AMPCOR chunks per process.
+      --n_rn_tiles N_RN_TILES, -R N_RN_TILES
+                            Number of AMPCOR range tiles.
+      --history_key HISTORY_KEY
+                            AMPCOR runtime history key (e.g. track/frame)
+                            - size chunks by predicted runtime.
+      --queue_dir QUEUE_DIR
+                            Shared job queue directory - chunks are run by
+                            ampcor_worker.py processes.
+      --stage_slabs         Queued chunks run on SLC slabs staged to
+                            node-local scratch (ampcor_slab.py).
+      --scratch SCRATCH     Node-local scratch directory - Def: $TMPDIR.
       --ampcor {ampcor_large,ampcor_large2,ampcor_
 
 PYTHON DEPENDENCIES:
@@ -38,6 +54,12 @@ UPDATE HISTORY:
     06/22/2022 - Directory parameter converted to positional argument.
         By default, the current directory is used as working directory.
     02/10/2023 - c_ampcor_iceye - converted to callable function.
+    10/2026 - Split the offsets into chunk_factor x n_proc chunks. The
+        remainder of the offset lines is no longer dropped.
+    10/2026 - --n_rn_tiles - split the offsets in range x azimuth tiles.
+    10/2026 - --history_key - size chunks using the AMPCOR runtime history.
+    10/2026 - --queue_dir - submit the chunks to a shared job queue.
+    10/2026 - --stage_slabs - queued chunks run on staged SLC slabs.
 """
 # - Python dependencies
 from __future__ import print_function
@@ -47,13 +69,24 @@ import argparse
 from datetime import datetime
 import numpy as np
 from utils.path_to_ampcor import path_to_ampcor
+from utils.ampcor_chunks import (plan_chunks, write_ampcor_chunks,
+                                 ampcor_jobs)
+from utils.ampcor_history import (HISTORY_PATH, load_history, cost_profile,
+                                  write_chunk_plan)
+from utils.job_queue import init_queue, submit_jobs
+from utils.slc_staging import staged_job
 # - GAMMA's Python integration with the py_gamma module
 import py_gamma as pg
 
 
 def c_ampcor_iceye(ref_slc: str, sec_slc: str,
                    data_dir: str = os.getcwd(), out_dir: str = os.getcwd(),
-                   ampcor: str = 'ampcor_large', n_proc: int = 15) -> None:
+                   ampcor: str = 'ampcor_large', n_proc: int = 15,
+                   chunk_factor: int = 6, n_rn_tiles: int = 1,
+                   history_key: str = None,
+                   history_path: str = HISTORY_PATH,
+                   queue_dir: str = None, stage_slabs: bool = False,
+                   scratch: str = None) -> None:
     """
     Create the bat file to run AMPCOR between the considered pair of SLCs
     :param ref_slc: reference Single Look Complex (SLC) file name
@@ -62,6 +95,17 @@ def c_ampcor_iceye(ref_slc: str, sec_slc: str,
     :param out_dir: output directory  [default: current directory]
     :param ampcor: ampcor version to use [default: ampcor_large]
     :param n_proc: number of parallel processes [default: 15]
+    :param chunk_factor: number of chunks per process [default: 6]
+    :param n_rn_tiles: number of range tiles [default: 1]
+    :param history_key: AMPCOR runtime history key - e.g. track/frame.
+                        If provided, chunks are sized to have equal
+                        predicted runtimes [default: None]
+    :param history_path: AMPCOR runtime history store
+    :param queue_dir: shared job queue directory - if provided, the chunks
+                      are submitted to the queue [default: None]
+    :param stage_slabs: queued chunks run on SLC slabs staged to node-local
+                        scratch - see ampcor_slab.py [default: False]
+    :param scratch: node-local scratch directory [default: None - $TMPDIR]
     :return: None
     """
     ref_slc_path = os.path.join(data_dir, ref_slc + '.slc')
@@ -91,9 +135,6 @@ def c_ampcor_iceye(ref_slc: str, sec_slc: str,
     range_spacing = 30
     line_spacing = 30
 
-    # - bat file name
-    bat_id = os.path.join(out_dir, f'bat_{ref_slc}-{sec_slc}')
-
     # - read offset parameter file
     off_param_dict = pg.ParFile(off_par_path).par_dict
 
@@ -146,85 +187,47 @@ def c_ampcor_iceye(ref_slc: str, sec_slc: str,
     print(f'# - Secondary Azimuth Res: {sec_pixel_sp}')
     print(f'# - Computed y_slope: {y_slope}\n')
     print(f'# - Number of record of ref. SLC : {n_rec}')
-    print(f'# - Divide offsets into {n_proc} chunks')
-
-    # - Number of offset lines per chunk
-    nn = int(n_rec / line_spacing / n_proc)
-    print(f'# - Number of number of lines per chunk : {int(n_rec / n_proc)}')
-    print(f'# - Number of offset lines per chunk : {nn}')
-
-    # - write input parameters files for each chunk
-    # - considered by AMPCOR
-    y_curr = int(y_start)  # - chunk specific y_start
-
-    # - open bat_id file
-    with open(bat_id, 'w', encoding='utf8') as fid_1:
-        for i in range(n_proc):
-            # - Open specific chunk parameter file
-            s_file = os.path.join(out_dir,
-                                  f'{ref_slc}-{sec_slc}.offmap_{i + 1}.in')
-            with open(s_file, 'w', encoding='utf8') as fid_2:
-                # - Add Reference and Secondary SLC o=to the parameter file
-                print(f'{ref_slc}.slc', file=fid_2)
-                print(f'{sec_slc}.slc', file=fid_2)
-
-                # - Output offset map file name
-                print(f'{ref_slc}-{sec_slc}.offmap_{i + 1}', file=fid_2)
-
-                print(os.path.join(path_to_ampcor(), ampcor)
-                      + f' {ref_slc}-{sec_slc}.offmap_{i + 1}' + '.in old &',
-                      file=fid_1)
-
-                # - range_samples of the 2 slc
-                print('{:5} {:5}'.format(n_pix_ref, n_pix_sec), file=fid_2)
-                # - azimuth-direction processing spacing [see -> line_spacing]
-                if (y_curr - 2 * line_spacing) > 0:
-                    print('{:6} {:8} {:3}'
-                          .format((y_curr - 2 * line_spacing),
-                                  y_curr + line_spacing * (nn - 1),
-                                  line_spacing), file=fid_2)
-                else:
-                    print('{:6} {:8} {:3}'
-                          .format(0, y_curr + line_spacing * (nn - 1),
-                                  line_spacing), file=fid_2)
-
-                # - range-direction processing spacing [see -> range_spacing]
-                print('{:4} {:5} {:5}'.format(x_start, x_end,
-                                              range_spacing), file=fid_2)
-                # - Define "Search Window" and "Chip" size
-                print('64 64', file=fid_2)
-                print('32 32', file=fid_2)
-                print('1 1', file=fid_2)
-
-                # - i-th chunk initial offset
-                x_off_c = x_off
-                yoff_c = int(np.fix(yoff + y_slope
-                                    * (2. * y_curr
-                                       + line_spacing * (nn - 1)) / 2. + 0.5))
-
-                print('{:5} {:6}'.format(x_off_c, yoff_c), file=fid_2)
-
-                # - Other Input parameters for AMPCOR
-                # - threshold SNR = 0
-                # - threshold covariance matrix = 1.e10
-                # - > With this threshold values, all the offset are
-                # -   calculated.
-                print('0. 1.e10', file=fid_2)
-                # - Offsets expressed as floating point real numbers
-                print('f f', file=fid_2)
-
-                # - print on std-output
-                # print(f'# - {ref_slc}-{sec_slc}.offmap_{i + 1}.in '
-                #       f'- y-boundaries ->' + str(y_curr).rjust(10)
-                #       + str(y_curr + line_spacing * (nn - 1)).rjust(10))
-                # print(f'# - Chunk {i + 1} offsets :'
-                #       f' yoff={yoff_c}, x_off={x_off_c}\n')
-
-                # - update y_curr value
-                y_curr += int(line_spacing * nn)
-            # - Change Output file permissions
-            os.chmod(s_file, 0o0755)
-    os.chmod(bat_id, 0o0755)
+
+    # - Split the offsets grid into chunk_factor x n_proc chunks.
+    # - Chunks are pulled by n_proc AMPCOR workers one at a time, so that
+    # - slow chunks do not leave the other workers idle.
+    n_chunks = chunk_factor * n_proc
+    profile = None
+    if history_key is not None:
+        profile = cost_profile(load_history(history_path, history_key))
+        if profile is not None:
+            print(f'# - Chunks sized using the runtime history '
+                  f'of: {history_key}')
+    chunks = plan_chunks(y_start, n_rec, line_spacing, n_chunks,
+                         y_off=yoff, y_slope=y_slope,
+                         x_start=x_start, x_end=x_end, x_off=x_off,
+                         range_spacing=range_spacing, n_rn_tiles=n_rn_tiles,
+                         profile=profile)
+    print(f'# - Divide offsets into {len(chunks)} chunks '
+          f'({n_rn_tiles} range tiles)')
+    print(f'# - Number of offset lines per chunk : '
+          f'{int(n_rec / line_spacing / len(chunks) * n_rn_tiles)}')
+
+    # - write input parameters files for each chunk considered by AMPCOR
+    # - and the bat file
+    bat_path = write_ampcor_chunks(out_dir, ref_slc, sec_slc, chunks,
+                                   os.path.join(path_to_ampcor(), ampcor),
+                                   n_pix_ref, n_pix_sec, line_spacing,
+                                   range_spacing)
+    # - Save the chunks plan - used to record the chunks runtimes
+    write_chunk_plan(os.path.join(out_dir, f'chunks_{ref_slc}-{sec_slc}.json'),
+                     chunks, int(n_rec / line_spacing),
+                     history_key=history_key, line_spacing=line_spacing,
+                     range_spacing=range_spacing, window=[64, 64])
+
+    # - Submit the chunks to the shared job queue
+    if queue_dir is not None:
+        init_queue(queue_dir)
+        jobs = ampcor_jobs(bat_path)
+        if stage_slabs:
+            jobs = [staged_job(job, scratch=scratch) for job in jobs]
+        submit_jobs(queue_dir, jobs)
+        print(f'# - {len(chunks)} chunks submitted to: {queue_dir}')
 
     print('# - AMPCOR Calculation Parameters set.')
 
@@ -250,6 +253,33 @@ def main() -> None:
                         type=int, default=14,
                         help='Number of Parallel Processes.')
 
+    # - Number of AMPCOR chunks per process
+    parser.add_argument('--chunk_factor', '-C',
+                        type=int, default=6,
+                        help='Number of AMPCOR chunks per process.')
+
+    # - Number of AMPCOR range tiles
+    parser.add_argument('--n_rn_tiles', '-R',
+                        type=int, default=1,
+                        help='Number of AMPCOR range tiles.')
+
+    # - AMPCOR runtime history key
+    parser.add_argument('--history_key', type=str, default=None,
+                        help='AMPCOR runtime history key (e.g. track/frame)'
+                             ' - size chunks by predicted runtime.')
+
+    # - Shared job queue directory
+    parser.add_argument('--queue_dir', type=str, default=None,
+                        help='Shared job queue directory - chunks are run '
+                             'by ampcor_worker.py processes.')
+
+    # - Stage SLC slabs to node-local scratch
+    parser.add_argument('--stage_slabs', action='store_true',
+                        help='Queued chunks run on SLC slabs staged to '
+                             'node-local scratch (ampcor_slab.py).')
+    parser.add_argument('--scratch', type=str, default=None,
+                        help='Node-local scratch directory - Def: $TMPDIR.')
+
     # - Compute preliminary dense offsets field to register SLCs
     parser.add_argument('--pdoff', '-p',
                         help='Compute preliminary dense offsets field.',
@@ -267,7 +297,13 @@ def main() -> None:
     # - Reference and Secondary SLCs
     c_ampcor_iceye(args.ref_slc, args.sec_slc,
                    data_dir=args.directory, out_dir=args.directory,
-                   n_proc=args.n_proc, ampcor=args.ampcor)
+                   n_proc=args.n_proc, ampcor=args.ampcor,
+                   chunk_factor=args.chunk_factor,
+                   n_rn_tiles=args.n_rn_tiles,
+                   history_key=args.history_key,
+                   queue_dir=None if args.queue_dir is None
+                   else os.path.abspath(args.queue_dir),
+                   stage_slabs=args.stage_slabs, scratch=args.scratch)
 
 
 # - run main program
@@ -32,6 +32,7 @@ import datetime
 import py_gamma as pg
 import py_gamma2019 as pg9
 from utils.make_dir import make_dir
+from utils.executor import bat_commands, run_jobs
 
 
 def main():
@@ -85,8 +86,14 @@ def main():
     print('# - Compute Interferogram (./bat_inter_ref_slc-sec_scl).')
     # - Change the current working directory
     os.chdir(data_dir)
-    # - Calculate Interferogram
-    os.system(os.path.join('.', f'bat_inter.{ref_slc}-{sec_slc}'))
+    # - Calculate Interferogram - the bat file commands are run in order
+    bat_inter = f'bat_inter.{ref_slc}-{sec_slc}'
+    for i, cmd in enumerate(bat_commands(bat_inter)):
+        result = run_jobs([{'name': f'{bat_inter}_{i + 1}', 'cmd': cmd}],
+                          log_dir='.', cwd='.')[f'{bat_inter}_{i + 1}']
+        if result['returncode'] != 0:
+            raise RuntimeError(f'# - {cmd[0]} failed with exit status '
+                               f'{result["returncode"]} - see {result["log"]}')
     print('# - Interferogram Calculation Completed.')
     # - read interferogram parameter file
     igram_par_path = os.path.join('.',
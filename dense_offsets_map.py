@@ -10,8 +10,11 @@ For more details, see: GAMMA - dense_offsets_map
 
 usage: dense_offsets_map.py [-h] [--directory DIRECTORY]
     [--out_directory OUT_DIRECTORY] [--search_w SEARCH_W] [--skip SKIP]
-    [--interp_off] [--out_off_spacing OUT_OFF_SPACING] [--off_weight {ccp,snr}]
+    [--interp_off] [--out_off_spacing OUT_OFF_SPACING [OUT_OFF_SPACING ...]]
+    [--native_tracker] [--n_threads N_THREADS] [--affinity]
+    [--off_weight {ccp,snr,sigma}] [--off_fit {wls,huber,tukey,ransac}]
     [--off_filter {1,2}] [--off_smooth] [--off_fill] [--normalize] [--intf]
+    [--force STEP [STEP ...]]
     reference secondary
 
 Compute Dense Offset Map - AMPCOR.
@@ -30,15 +33,34 @@ options:
                         Search Window.
   --skip SKIP, -S SKIP  Skip - Def: Search Window/2.
   --interp_off          Interpolate Offset Map to a different resolution.
-  --out_off_spacing OUT_OFF_SPACING
-                        Offset Map Range/Azimuth Spacing.
-  --off_weight {ccp,snr}
-                        Offsets polynomial weight.
+  --out_off_spacing OUT_OFF_SPACING [OUT_OFF_SPACING ...]
+                        Offset Map Range/Azimuth Spacing. Multiple values
+                        generate one interpolated map per spacing.
+                        Requires --interp_off.
+  --native_tracker      Use the native amplitude tracker and its quality
+                        surfaces to reject outliers.
+  --n_threads N_THREADS
+                        Native tracker threads - Def: number of CPUs.
+  --affinity            Pin native tracker threads to cores spread across
+                        NUMA nodes.
+  --off_weight {ccp,snr,sigma}
+                        Offsets polynomial weight. sigma: inverse offsets
+                        variance (native tracker).
+  --off_fit {wls,huber,tukey,ransac}
+                        Offsets polynomial fit method.
   --off_filter {1,2}    Offsets filtering strategy.
   --off_smooth          Smooth offsets map.
   --off_fill            Fill offsets map.
   --normalize           Normalize Secondary Azimuth Res.
   --intf                Setup Interferogram Calcualation.
+  --force STEP [STEP ...]
+                        Rerun the selected pipeline steps even if up to
+                        date - all: rerun every step.
+
+NOTE: The processing runs as cached pipeline steps (see utils/pipeline.py):
+      offsets (tracking and polynomial fit), filter, interp_<spacing> and
+      intf. Changing e.g. the filtering or the output spacings reruns only
+      the affected steps - the offset tracking is not repeated.
 
 
 
@@ -54,7 +76,13 @@ PYTHON DEPENDENCIES:
     py_gamma: GAMMA's Python integration with the py_gamma module
 
 UPDATE HISTORY:
-
+    10/2026 - --interp_off/--out_off_spacing - interpolate the filtered
+        offsets map to one or more output spacings.
+    10/2026 - --native_tracker - native amplitude tracker with per-node
+        quality surfaces used for weighting and outliers rejection.
+    10/2026 - --n_threads - tiled multi-threaded native tracker.
+    10/2026 - --affinity - NUMA-aware placement of the tracker threads.
+    10/2026 - Processing split into cached pipeline steps - --force.
 
 """
 # - Python Dependencies
@@ -73,10 +101,152 @@ from st_release.madian_filter_off import median_filter_off
 from st_release.congrid2d import congrid2d
 from st_release.fill_nodata import fill_nodata
 from st_release.resample_slc import resample_slc_azimuth, resample_slc_prf
+from utils.resample_offsets import resample_grid, resample_offsets
+from utils.offset_fit import offset_fit_par
+from utils.pipeline import Pipeline
+from utils.offset_tracker import (slc_memmap, track_offsets, quality_mask,
+                                  QUALITY_BANDS)
+
+
+def interp_offsets(off_map: np.ndarray, off_param: pg.ParFile,
+                   rn_min: int, az_min: int,
+                   rn_spacing: int, az_spacing: int,
+                   out_spacing: int, out_map_path: str,
+                   out_par_path: str) -> int:
+    """
+    Interpolate the Offsets Map to a different range/azimuth spacing
+    and update the offsets parameter file geometry accordingly.
+    :param off_map: offsets map [numpy ndarray - complex]
+    :param off_param: offsets parameter file [py_gamma ParFile]
+    :param rn_min: offsets starting range [pixels]
+    :param az_min: offsets starting azimuth [pixels]
+    :param rn_spacing: offsets range spacing [pixels]
+    :param az_spacing: offsets azimuth spacing [pixels]
+    :param out_spacing: output range/azimuth spacing [pixels]
+    :param out_map_path: absolute path to the output offsets map
+    :param out_par_path: absolute path to the output parameter file
+    :return: output offsets map width
+    """
+    az_smp, rn_smp = off_map.shape
+    # - Output grid - same starting range/azimuth, new posting
+    rn_smp_out, x_ind = resample_grid(rn_smp, rn_spacing, out_spacing)
+    az_smp_out, y_ind = resample_grid(az_smp, az_spacing, out_spacing)
+    print(f'# - Interpolating Offsets Map to {out_spacing} pixels spacing.')
+    print(f'# - Input Offsets Grid Shape: [{az_smp},{rn_smp}]')
+    print(f'# - Output Offsets Grid Shape: [{az_smp_out},{rn_smp_out}]')
+    off_interp = resample_offsets(off_map, y_ind, x_ind, nodata=0)
+
+    # - Update Offsets Parameter file geometry
+    off_param.set_value('offset_estimation_ending_range',
+                        rn_min + (rn_smp_out - 1) * out_spacing)
+    off_param.set_value('offset_estimation_ending_azimuth',
+                        az_min + (az_smp_out - 1) * out_spacing)
+    off_param.set_value('offset_estimation_range_samples', rn_smp_out)
+    off_param.set_value('offset_estimation_azimuth_samples', az_smp_out)
+    off_param.set_value('offset_estimation_range_spacing', out_spacing)
+    off_param.set_value('offset_estimation_azimuth_spacing', out_spacing)
+    off_param.write_par(out_par_path)
+
+    # - Save Interpolated Offsets as a complex array
+    off_interp.byteswap().tofile(out_map_path)
+
+    return rn_smp_out
+
+
+def native_offset_tracking(data_dir: str, out_dir: str, ref: str, sec: str,
+                           pair_name: str, search_w: int,
+                           skip: int, n_threads: int = None,
+                           affinity: bool = False) -> dict:
+    """
+    Estimate the range and azimuth offset fields with the native amplitude
+    tracker. Save the offsets map, the cross-correlation peak and the
+    quality surfaces as GAMMA float images, and update the offsets
+    parameter file geometry.
+    :param data_dir: data directory
+    :param out_dir: output directory
+    :param ref: reference SLC
+    :param sec: secondary SLC
+    :param pair_name: pair name
+    :param search_w: search window [pixels]
+    :param skip: offsets spacing [pixels]
+    :param n_threads: number of tracker threads [def. os.cpu_count()]
+    :param affinity: pin the tracker threads to cores
+    :return: tracker quality surfaces - see track_offsets
+    """
+    ref_param = pg.ParFile(os.path.join(data_dir, f'{ref}.par'))
+    sec_param = pg.ParFile(os.path.join(data_dir, f'{sec}.par'))
+    off_param = pg.ParFile(os.path.join(out_dir, f'{pair_name}.par'))
+    ref_slc = slc_memmap(os.path.join(data_dir, f'{ref}.slc'),
+                         int(ref_param.par_dict['range_samples'][0]),
+                         ref_param.par_dict['image_format'][0])
+    sec_slc = slc_memmap(os.path.join(data_dir, f'{sec}.slc'),
+                         int(sec_param.par_dict['range_samples'][0]),
+                         sec_param.par_dict['image_format'][0])
+    x_off = int(round(float(off_param.par_dict['initial_range_offset'][0])))
+    y_off = int(round(float(off_param.par_dict['initial_azimuth_offset'][0])))
+
+    # - Offsets grid - nodes at the center of the correlation windows
+    rn_min = az_min = search_w // 2
+    rn_smp = (ref_slc.shape[1] - search_w) // skip + 1
+    az_smp = (ref_slc.shape[0] - search_w) // skip + 1
+    print(f'# - Native tracker - Offsets Grid Shape: [{az_smp},{rn_smp}]')
+    off_quality = track_offsets(ref_slc, sec_slc, search_w, skip,
+                                rn_smp, az_smp, x_start=rn_min,
+                                y_start=az_min, x_off=x_off, y_off=y_off,
+                                n_threads=n_threads, affinity=affinity)
+
+    # - Update Offsets Parameter file
+    off_param.set_value('offset_estimation_starting_range', rn_min)
+    off_param.set_value('offset_estimation_ending_range',
+                        rn_min + (rn_smp - 1) * skip)
+    off_param.set_value('offset_estimation_starting_azimuth', az_min)
+    off_param.set_value('offset_estimation_ending_azimuth',
+                        az_min + (az_smp - 1) * skip)
+    off_param.set_value('offset_estimation_range_samples', rn_smp)
+    off_param.set_value('offset_estimation_azimuth_samples', az_smp)
+    off_param.set_value('offset_estimation_range_spacing', skip)
+    off_param.set_value('offset_estimation_azimuth_spacing', skip)
+    off_param.set_value('offset_estimation_window_width', search_w)
+    off_param.set_value('offset_estimation_window_height', search_w)
+    off_param.write_par(os.path.join(out_dir, f'{pair_name}.par'))
+
+    # - Save offsets map, cross-correlation and quality surfaces
+    off_path = os.path.join(out_dir, f'{pair_name}.offmap')
+    off_quality['off_map'].byteswap().tofile(off_path)
+    off_quality['ccp'].byteswap().tofile(off_path + '.ccp')
+    for band, key in zip(QUALITY_BANDS, ('ptsr', 'sig_x', 'sig_y', 'vfrac')):
+        off_quality[key].byteswap().tofile(f'{off_path}.{band}')
+
+    return off_quality
+
+
+def offsets_grid(off_param: pg.ParFile) -> tuple:
+    """
+    Offsets grid geometry from the offsets parameter file
+    :param off_param: offsets parameter file [py_gamma ParFile]
+    :return: range samples, azimuth samples, starting range, starting
+             azimuth, range spacing, azimuth spacing [pixels]
+    """
+    keys = ('range_samples', 'azimuth_samples', 'starting_range',
+            'starting_azimuth', 'range_spacing', 'azimuth_spacing')
+    return tuple(int(off_param.par_dict[f'offset_estimation_{key}'][0])
+                 for key in keys)
+
+
+def read_quality(off_path: str, width: int) -> dict:
+    """
+    Read the native tracker quality surfaces saved next to the offsets map
+    :param off_path: absolute path to the offsets map
+    :param width: offsets map width
+    :return: quality surfaces - see track_offsets
+    """
+    quality = {'ccp': pg.read_image(f'{off_path}.ccp', width=width,
+                                    dtype='float')}
+    for band, key in zip(QUALITY_BANDS, ('ptsr', 'sig_x', 'sig_y', 'vfrac')):
+        quality[key] = pg.read_image(f'{off_path}.{band}', width=width,
+                                     dtype='float')
+    return quality
 
-#TODO: Add support for the following options:
-# - --interp_off         Interpolate Offset Map to a different resolution.
-# - --out_off_spacing    Offset Map Range/Azimuth Spacing.
 
 def setup_intf(data_dir: str, ref: str, sec: str,
                offsets: str, offsets_par: str,
@@ -142,10 +312,28 @@ def main() -> None:
 
     parser.add_argument('--out_off_spacing',
                         help='Offset Map Range/Azimuth Spacing.',
-                        default=None, type=int)
+                        default=None, type=int, nargs='+')
+
+    parser.add_argument('--native_tracker',
+                        help='Use the native amplitude tracker and its '
+                             'quality surfaces to reject outliers.',
+                        action='store_true')
 
-    parser.add_argument('--off_weight', help='Offsets polynomial weight.',
-                        type=str, default='ccp', choices=['ccp', 'snr'])
+    parser.add_argument('--n_threads', help='Native tracker threads - '
+                        'Def: number of CPUs.', type=int, default=None)
+
+    parser.add_argument('--affinity', help='Pin native tracker threads to '
+                        'cores spread across NUMA nodes.',
+                        action='store_true')
+
+    parser.add_argument('--off_weight', help='Offsets polynomial weight. '
+                        'sigma: inverse offsets variance (native tracker).',
+                        type=str, default='ccp',
+                        choices=['ccp', 'snr', 'sigma'])
+
+    parser.add_argument('--off_fit', help='Offsets polynomial fit method.',
+                        type=str, default='wls',
+                        choices=['wls', 'huber', 'tukey', 'ransac'])
 
     parser.add_argument('--off_filter', help='Offsets filtering strategy.',
                         type=int, default=1, choices=[1, 2])
@@ -167,7 +355,13 @@ def main() -> None:
     parser.add_argument('--intf', help='Setup Interferogram Calculation.',
                         action='store_true')
 
+    parser.add_argument('--force', nargs='+', default=[], metavar='STEP',
+                        help='Rerun the selected pipeline steps even if up '
+                             'to date - all: rerun every step.')
+
     args = parser.parse_args()
+    if args.out_off_spacing is not None and not args.interp_off:
+        parser.error('--out_off_spacing requires --interp_off.')
 
     # - Path to Test directory
     data_dir = args.directory       # - Path to data directory
@@ -176,250 +370,366 @@ def main() -> None:
     # - Processing Parameters
     ref = args.reference            # - Reference SLC
     sec = args.secondary            # - Secondary SLC
-    pair_name = f'{ref}-{sec}'        # - Pair name
     poly_order = 3      # - Polynomial order for offset estimation
 
-    # - Generate new offset file
-    algorithm = 1       # - offset estimation algorithm
-    rlks = 1  # - number of interferogram range looks (enter -  for default: 1)
-    azlks = 1  # - number of interferogram azimuth looks (enter-for default: 1)
-    iflg = 0  # -  interactive mode flag (enter -  for default)
-
-    # - Create Offset Parameter File
-    print('#  - Create Offset Parameter File')
-    pg.create_offset(
-        os.path.join(data_dir, f'{ref}.par'),
-        os.path.join(data_dir, f'{sec}.par'),
-        os.path.join(data_dir, f'{ref}-{sec}.par'),
-        algorithm, rlks, azlks, iflg
-    )
-
-    # - Initial SLC image offset estimation from orbit state-vectors
-    # - and image parameters
-    pg.init_offset_orbit(
-        os.path.join(data_dir, f'{ref}.par'),
-        os.path.join(data_dir, f'{sec}.par'),
-        os.path.join(data_dir, f'{ref}-{sec}.par')
-    )
-
     # - Normalize SLCs Azimuth Resolution
     if args.resample_azimuth and args.resample_slc_prf:
         raise ValueError('Select a single resampling method.')
-
-    if args.resample_azimuth:
-        print('#  - Resample Secondary SLCs')
-        print('#  - Update SLCs Azimuth Resolution')
-        resample_slc_azimuth(data_dir, ref, sec, multi_look=False)
-        sec = args.secondary+'_r'   # - Secondary SLC
-        pair_name = f'{ref}-{sec}'  # - Pair name
-
-    if args.resample_slc_prf:
-        print('#  - Resample Secondary SLCs')
-        print('#  - Update SLCs PRF')
-        resample_slc_prf(data_dir, ref, sec, multi_look=False)
-        sec = args.secondary+'_r'   # - Secondary SLC
-        pair_name = f'{ref}-{sec}'  # - Pair name
+    if args.resample_azimuth or args.resample_slc_prf:
+        sec = args.secondary + '_r'     # - Resampled Secondary SLC
+    pair_name = f'{ref}-{sec}'          # - Pair name
 
     # - Set Skip Value equal to half of Search Window
     if args.skip is None:
         args.skip = args.search_w // 2
+    if args.interp_off and args.out_off_spacing is None:
+        raise ValueError('# - Select the output offsets spacing '
+                         'with --out_off_spacing.')
 
     # - Offsets Processing Parameters
     filter_strategy = args.off_filter       # - Offsets Filtering Strategy
     smooth_off = args.off_smooth            # - Smooth Offsets Map
     fill_off = args.off_fill                # - Fill Offsets Map
 
-    # - Estimates the range and azimuth registration offset fields
-    # - on a preliminary coarse resolution grid
-    print('#  - Estimate the range and azimuth offset fields.')
-    c_search_w = args.search_w
-    c_skip = args.skip
-    print(f'#  - Search Window: {c_search_w}, Skip: {c_skip}\n')
-    pg.offset_pwr_tracking(
-        os.path.join(data_dir, f'{ref}.slc'),
-        os.path.join(data_dir, f'{sec}.slc'),
-        os.path.join(data_dir, f'{ref}.par'),
-        os.path.join(data_dir, f'{sec}.par'),
-        os.path.join(data_dir, f'{pair_name}.par'),
-        os.path.join(out_dir, f'{pair_name}.offmap'),
-        os.path.join(out_dir, f'{pair_name}.offmap.ccp'),
-        c_search_w, c_search_w,
-        os.path.join(out_dir, f'{pair_name}.offmap.txt'),
-        '-', '-', c_skip, c_skip, '-', '-', '-', '-', '-', '-',
-    )
-
-    # - Read the offset parameter file
-    off_param = pg.ParFile(os.path.join(out_dir, f'{pair_name}.par'))
-    rn_min = int(off_param.par_dict['offset_estimation_starting_range'][0])
-    rn_max = int(off_param.par_dict['offset_estimation_ending_range'][0])
-    az_min = int(off_param.par_dict['offset_estimation_starting_azimuth'][0])
-    az_max = int(off_param.par_dict['offset_estimation_ending_azimuth'][0])
-    rn_smp = int(off_param.par_dict['offset_estimation_range_samples'][0])
-    az_smp = int(off_param.par_dict['offset_estimation_azimuth_samples'][0])
-    rn_spacing = int(off_param.par_dict['offset_estimation_range_spacing'][0])
-    az_spacing = int(off_param.par_dict['offset_estimation_azimuth_spacing'][0])
-
-    # - Verify that offsets parameter file has been modified
-    # - by offset_pwr_tracking
-    if rn_max == 0:
-        # - Read Secondary Parameter file
-        sec_param = pg.ParFile(os.path.join(data_dir, f'{ref}.par'))
-        rn_smp_sec = int(sec_param.par_dict['range_samples'][0])
-        az_smp_sec = int(sec_param.par_dict['azimuth_lines'][0])
-        rn_smp = int(rn_smp_sec / c_skip)
-        az_smp = int(az_smp_sec / c_skip)
-
-        if rn_smp * c_skip > rn_smp_sec:
-            rn_smp -= 1
-        if az_smp * c_skip > az_smp_sec:
-            az_smp -= 1
-        rn_max = rn_smp * c_skip - 1
-        az_max = az_smp * c_skip - 1
-        print(f'# - Range Sample: {rn_smp}')
-        print(f'# - Azimuth Sample: {az_smp}')
-        print(f'# - Ending Range: {rn_max}')
-        print(f'# - Ending Azimuth: {az_max}')
-
-        # - Update Offsets Parameter file
-        off_param.set_value('offset_estimation_ending_range', rn_max)
-        off_param.set_value('offset_estimation_ending_azimuth', az_max)
-        off_param.set_value('offset_estimation_range_samples', rn_smp)
-        off_param.set_value('offset_estimation_azimuth_samples', az_smp)
-        off_param.set_value('offset_estimation_range_spacing', c_skip)
-        off_param.set_value('offset_estimation_azimuth_spacing', c_skip)
-        off_param.set_value('offset_estimation_window_width', c_search_w)
-        off_param.set_value('offset_estimation_window_height', c_search_w)
-        off_param.write_par(os.path.join(out_dir, f'{pair_name}.par'))
-
-    # - Unpack Offsets Map
-    o_rn, o_az, _, _, _, snr, \
-        = np.loadtxt(os.path.join(out_dir, f'{pair_name}.offmap.txt'),
-                     unpack=True)
-    o_rn = np.array(o_rn/rn_spacing, dtype=int)
-    o_az = np.array(o_az/az_spacing, dtype=int)
-
-    # - Initialize SNR Array
-    snr_array = np.zeros((az_smp, rn_smp))
-    snr_array[o_az, o_rn] = snr
-    snr_array.byteswap() \
-        .tofile(os.path.join(out_dir, f'{pair_name}.offmap.snr'))
-
-    # - Run Gamma offset_fit: Range and azimuth offset polynomial estimation
-    # - Note: Cross-correlation coefficients of SNR values can be set as
-    # -       Linear Fit weights.
-    pg.offset_fit(
-        os.path.join(out_dir, f'{pair_name}.offmap'),
-        os.path.join(out_dir, f'{pair_name}.offmap.{args.off_weight}'),
-        os.path.join(out_dir, f'{pair_name}.par'),
-        '-', '-', '-', poly_order, 0
-    )
-
-    # - Run Gamma offset_sub: Subtraction of polynomial
-    # - from range and azimuth offset estimates
-    pg.offset_sub(
-        os.path.join(out_dir, f'{pair_name}.offmap'),
-        os.path.join(out_dir, f'{pair_name}.par'),
-        os.path.join(out_dir, f'{pair_name}.offmap.res'),
-    )
-
-    # - Run GAMMA rasmph: Generate 8-bit raster graphics image of the phase
-    # - and intensity of complex data - Show Interpolated Offsets Map
-    pg9.rasmph(os.path.join(out_dir, f'{pair_name}.offmap.res'),
-               rn_smp,  '-', '-', '-', '-', '-', '-', '-',
-               os.path.join(out_dir, f'{pair_name}.offmap.res.bmp'))
+    # - Pipeline products
+    off_path = os.path.join(out_dir, f'{pair_name}.offmap')
+    off_par_path = os.path.join(out_dir, f'{pair_name}.par')
+
+    # - Pipeline - steps whose inputs and parameters did not change since
+    # - their last successful run are skipped. The offsets parameter file
+    # - is rewritten in place from its creation to the polynomial fit, so
+    # - these operations form a single step.
+    pipe = Pipeline(os.path.join(out_dir,
+                                 f'.dense_offsets_map_{pair_name}.json'))
+
+    def offsets() -> None:
+        # - Generate new offset file
+        algorithm = 1   # - offset estimation algorithm
+        rlks = 1    # - number of interferogram range looks (def: 1)
+        azlks = 1   # - number of interferogram azimuth looks (def: 1)
+        iflg = 0    # - interactive mode flag (enter -  for default)
+
+        # - Create Offset Parameter File
+        print('#  - Create Offset Parameter File')
+        pg.create_offset(
+            os.path.join(data_dir, f'{ref}.par'),
+            os.path.join(data_dir, f'{args.secondary}.par'),
+            os.path.join(data_dir, f'{ref}-{args.secondary}.par'),
+            algorithm, rlks, azlks, iflg
+        )
+
+        # - Initial SLC image offset estimation from orbit state-vectors
+        # - and image parameters
+        pg.init_offset_orbit(
+            os.path.join(data_dir, f'{ref}.par'),
+            os.path.join(data_dir, f'{args.secondary}.par'),
+            os.path.join(data_dir, f'{ref}-{args.secondary}.par')
+        )
+
+        if args.resample_azimuth:
+            print('#  - Resample Secondary SLCs')
+            print('#  - Update SLCs Azimuth Resolution')
+            resample_slc_azimuth(data_dir, ref, args.secondary,
+                                 multi_look=False)
+
+        if args.resample_slc_prf:
+            print('#  - Resample Secondary SLCs')
+            print('#  - Update SLCs PRF')
+            resample_slc_prf(data_dir, ref, args.secondary,
+                             multi_look=False)
+
+        # - Estimates the range and azimuth registration offset fields
+        # - on a preliminary coarse resolution grid
+        print('#  - Estimate the range and azimuth offset fields.')
+        c_search_w = args.search_w
+        c_skip = args.skip
+        print(f'#  - Search Window: {c_search_w}, Skip: {c_skip}\n')
+        off_quality = None
+        if args.native_tracker:
+            off_quality = native_offset_tracking(data_dir, out_dir, ref,
+                                                 sec, pair_name, c_search_w,
+                                                 c_skip,
+                                                 n_threads=args.n_threads,
+                                                 affinity=args.affinity)
+        else:
+            pg.offset_pwr_tracking(
+                os.path.join(data_dir, f'{ref}.slc'),
+                os.path.join(data_dir, f'{sec}.slc'),
+                os.path.join(data_dir, f'{ref}.par'),
+                os.path.join(data_dir, f'{sec}.par'),
+                os.path.join(data_dir, f'{pair_name}.par'),
+                off_path, f'{off_path}.ccp',
+                c_search_w, c_search_w,
+                f'{off_path}.txt',
+                '-', '-', c_skip, c_skip, '-', '-', '-', '-', '-', '-',
+            )
+
+        # - Read the offset parameter file
+        off_param = pg.ParFile(off_par_path)
+        rn_max = int(off_param.par_dict['offset_estimation_ending_range'][0])
+        rn_smp, az_smp, _, _, rn_spacing, az_spacing \
+            = offsets_grid(off_param)
+
+        # - Verify that offsets parameter file has been modified
+        # - by offset_pwr_tracking
+        if rn_max == 0:
+            # - Read Secondary Parameter file
+            sec_param = pg.ParFile(os.path.join(data_dir, f'{ref}.par'))
+            rn_smp_sec = int(sec_param.par_dict['range_samples'][0])
+            az_smp_sec = int(sec_param.par_dict['azimuth_lines'][0])
+            rn_smp = int(rn_smp_sec / c_skip)
+            az_smp = int(az_smp_sec / c_skip)
+
+            if rn_smp * c_skip > rn_smp_sec:
+                rn_smp -= 1
+            if az_smp * c_skip > az_smp_sec:
+                az_smp -= 1
+            rn_max = rn_smp * c_skip - 1
+            az_max = az_smp * c_skip - 1
+            print(f'# - Range Sample: {rn_smp}')
+            print(f'# - Azimuth Sample: {az_smp}')
+            print(f'# - Ending Range: {rn_max}')
+            print(f'# - Ending Azimuth: {az_max}')
+
+            # - Update Offsets Parameter file
+            off_param.set_value('offset_estimation_ending_range', rn_max)
+            off_param.set_value('offset_estimation_ending_azimuth', az_max)
+            off_param.set_value('offset_estimation_range_samples', rn_smp)
+            off_param.set_value('offset_estimation_azimuth_samples', az_smp)
+            off_param.set_value('offset_estimation_range_spacing', c_skip)
+            off_param.set_value('offset_estimation_azimuth_spacing', c_skip)
+            off_param.set_value('offset_estimation_window_width',
+                                c_search_w)
+            off_param.set_value('offset_estimation_window_height',
+                                c_search_w)
+            off_param.write_par(off_par_path)
+            rn_spacing = c_skip
+            az_spacing = c_skip
+
+        if off_quality is not None:
+            snr_array = off_quality['snr']
+            # - One-pass outliers mask from the tracker quality surfaces
+            q_mask = quality_mask(off_quality)
+        else:
+            # - Unpack Offsets Map
+            o_rn, o_az, _, _, _, snr, \
+                = np.loadtxt(f'{off_path}.txt', unpack=True)
+            o_rn = np.array(o_rn/rn_spacing, dtype=int)
+            o_az = np.array(o_az/az_spacing, dtype=int)
+
+            # - Initialize SNR Array
+            snr_array = np.zeros((az_smp, rn_smp), dtype=np.float32)
+            snr_array[o_az, o_rn] = snr
+            q_mask = None
+        snr_array.byteswap().tofile(f'{off_path}.snr')
+
+        # - Range and azimuth offset polynomial estimation and subtraction
+        # - of the polynomial from the offsets - native offset_fit/offset_sub.
+        # - Note: Cross-correlation coefficients of SNR values can be set as
+        # -       Linear Fit weights.
+        off_map = pg.read_image(off_path, width=rn_smp, dtype='fcomplex')
+        if args.off_weight == 'snr':
+            off_wgt = snr_array
+        elif args.off_weight == 'sigma':
+            if off_quality is None:
+                raise ValueError('# - sigma weights require '
+                                 '--native_tracker.')
+            off_wgt = 1. / np.maximum(off_quality['sig_x'] ** 2
+                                      + off_quality['sig_y'] ** 2, 1e-6)
+        else:
+            off_wgt = pg.read_image(f'{off_path}.ccp', width=rn_smp,
+                                    dtype='float')
+        if q_mask is not None:
+            off_wgt = np.where(q_mask, 0., off_wgt)
+        off_map = offset_fit_par(off_map, off_wgt, off_param,
+                                 npoly=poly_order, method=args.off_fit)
+        off_param.write_par(off_par_path)
+        off_map.byteswap().tofile(f'{off_path}.res')
+
+        # - Run GAMMA rasmph: Generate 8-bit raster graphics image of the
+        # - phase and intensity of complex data - Show Offsets Map
+        pg9.rasmph(f'{off_path}.res',
+                   rn_smp,  '-', '-', '-', '-', '-', '-', '-',
+                   f'{off_path}.res.bmp')
+    off_outputs = [off_par_path, off_path, f'{off_path}.ccp',
+                   f'{off_path}.snr', f'{off_path}.res']
+    if args.native_tracker:
+        off_outputs += [f'{off_path}.{band}' for band in QUALITY_BANDS]
+    else:
+        off_outputs.append(f'{off_path}.txt')
+    pipe.add('offsets', offsets,
+             inputs=[os.path.join(data_dir, f'{ref}.slc'),
+                     os.path.join(data_dir, f'{ref}.par'),
+                     os.path.join(data_dir, f'{args.secondary}.slc'),
+                     os.path.join(data_dir, f'{args.secondary}.par')],
+             outputs=off_outputs,
+             params={'search_w': args.search_w, 'skip': args.skip,
+                     'native_tracker': args.native_tracker,
+                     'off_weight': args.off_weight, 'off_fit': args.off_fit,
+                     'resample_azimuth': args.resample_azimuth,
+                     'resample_slc_prf': args.resample_slc_prf},
+             cores=(os.cpu_count() if args.n_threads is None
+                    else args.n_threads) if args.native_tracker else 1,
+             io=1)
 
     # - Process Offsets Map
     # - > Remove Outliers
     # - > Apply Smoothing Filter
     # - > Fill in Nodata [Optional]
-    off_map \
-        = pg.read_image(os.path.join(out_dir, f'{pair_name}.offmap.res'),
-                        width=rn_smp, dtype='fcomplex')
-
-    # - Remove Erroneous Offsets s by apply Median Filter.
-    if filter_strategy == 1:
-        # - Filtering strategy 1 - see c_off4intf.py
-        med_filt_size = 9   # - Median filter Kernel Size
-        med_thresh = 1      # - Median filter Threshold
-    elif filter_strategy == 2:
-        # - Filtering Strategy 2 - see c_off3intf.pro
-        med_filt_size = 15   # - Median filter Kernel Size
-        med_thresh = 0.5     # - Median filter Threshold
-    else:
-        raise ValueError('# - Unknown filtering strategy selected.')
-    # - Compute outlier Mask
-    mask = median_filter_off(off_map, size=med_filt_size, thre=med_thresh)
-
-    # - Set Outliers Mask borders equal to 1
-    mask[:, 0:2] = 1
-    mask[:, rn_smp - 2:] = 1
-    mask[0:2, :] = 1
-    mask[az_smp - 2:, :] = 1
-
-    # - Apply Outliers Mask to Offsets Map
-    xoff_masked = off_map.real.copy()
-    yoff_masked = off_map.imag.copy()
-    xoff_masked[mask] = 0
-    yoff_masked[mask] = 0
-
-    # - Run as 5x5 median filter to locate isolated offsets values - offsets
-    # - surrounded by zeros and set them to zero.
-    # - Find more details in step2 of off_filter.pro
-    g_mask = (mask | (medfilt(xoff_masked, 5) == 0)
-              | (medfilt(yoff_masked, 5) == 0))
-    xoff_masked[g_mask] = np.nan
-    yoff_masked[g_mask] = np.nan
-
-    # - Smooth Offsets Map using a 3x3 Median Filter
-    xoff_masked = medfilt(xoff_masked, 3)
-    yoff_masked = medfilt(yoff_masked, 3)
-
-    # - Smooth Offsets using 7x7 Boxcar Filter
-    smth_kernel_size = 7
-    kernel = Box2DKernel(smth_kernel_size)
-    if smooth_off:
-        xoff_masked \
-            = convolve(xoff_masked, kernel, boundary='extend')
-        yoff_masked \
-            = convolve(yoff_masked, kernel, boundary='extend')
-
-    # - Set to NaN offsets pixels that have a zero value in
-    # - either of the two directions.
-    ind_zero = np.where((xoff_masked == 0) | (yoff_masked == 0))
-    xoff_masked[ind_zero] = np.nan
-    yoff_masked[ind_zero] = np.nan
-
-    # - Fill Offsets Map Nodata
-    if fill_off:
-        print('# - Filling Gaps Offsets Map by interpolation.')
-        x_mask = np.ones(np.shape(xoff_masked))
-        x_mask[np.where(np.isnan(xoff_masked))] = 0
-        xoff_masked = fill_nodata(xoff_masked, x_mask,
-                                  max_search_dist=1000, smth_iter=10)
-        y_mask = np.ones(np.shape(yoff_masked))
-        y_mask[np.where(np.isnan(yoff_masked))] = 0
-        yoff_masked = fill_nodata(yoff_masked, y_mask,
-                                  max_search_dist=1000, smth_iter=10)
-
-    # - Set to NaN offsets pixels to Zero
-    xoff_masked[np.isnan(xoff_masked)] = 0
-    yoff_masked[np.isnan(yoff_masked)] = 0
-
-    # - Save Offsets as a complex array
-    off_masked = xoff_masked + 1j * yoff_masked
-
-    off_masked.byteswap() \
-        .tofile(os.path.join(out_dir, f'{pair_name}.offmap.res.filt'))
-
-    # - Show Smoothed Offsets Map
-    pg9.rasmph(os.path.join(out_dir, f'{pair_name}.offmap.res.filt'), rn_smp)
+    def filter_offsets() -> None:
+        off_param = pg.ParFile(off_par_path)
+        rn_smp, az_smp, _, _, _, _ = offsets_grid(off_param)
+        off_map = pg.read_image(f'{off_path}.res', width=rn_smp,
+                                dtype='fcomplex')
+        # - One-pass outliers mask from the tracker quality surfaces
+        q_mask = quality_mask(read_quality(off_path, rn_smp)) \
+            if args.native_tracker else None
+
+        # - Remove Erroneous Offsets s by apply Median Filter.
+        if filter_strategy == 1:
+            # - Filtering strategy 1 - see c_off4intf.py
+            med_filt_size = 9   # - Median filter Kernel Size
+            med_thresh = 1      # - Median filter Threshold
+        elif filter_strategy == 2:
+            # - Filtering Strategy 2 - see c_off3intf.pro
+            med_filt_size = 15   # - Median filter Kernel Size
+            med_thresh = 0.5     # - Median filter Threshold
+        else:
+            raise ValueError('# - Unknown filtering strategy selected.')
+        # - Compute outlier Mask
+        if q_mask is not None:
+            mask = q_mask | (off_map.real == 0) | (off_map.imag == 0)
+        else:
+            mask = median_filter_off(off_map, size=med_filt_size,
+                                     thre=med_thresh)
+
+        # - Set Outliers Mask borders equal to 1
+        mask[:, 0:2] = 1
+        mask[:, rn_smp - 2:] = 1
+        mask[0:2, :] = 1
+        mask[az_smp - 2:, :] = 1
+
+        # - Apply Outliers Mask to Offsets Map
+        xoff_masked = off_map.real.copy()
+        yoff_masked = off_map.imag.copy()
+        xoff_masked[mask] = 0
+        yoff_masked[mask] = 0
+
+        # - Run as 5x5 median filter to locate isolated offsets values -
+        # - offsets surrounded by zeros and set them to zero.
+        # - Find more details in step2 of off_filter.pro
+        # - Not needed with the tracker quality mask.
+        if q_mask is not None:
+            g_mask = mask
+        else:
+            g_mask = (mask | (medfilt(xoff_masked, 5) == 0)
+                      | (medfilt(yoff_masked, 5) == 0))
+        xoff_masked[g_mask] = np.nan
+        yoff_masked[g_mask] = np.nan
+
+        # - Smooth Offsets Map using a 3x3 Median Filter
+        xoff_masked = medfilt(xoff_masked, 3)
+        yoff_masked = medfilt(yoff_masked, 3)
+
+        # - Smooth Offsets using 7x7 Boxcar Filter
+        smth_kernel_size = 7
+        kernel = Box2DKernel(smth_kernel_size)
+        if smooth_off:
+            xoff_masked \
+                = convolve(xoff_masked, kernel, boundary='extend')
+            yoff_masked \
+                = convolve(yoff_masked, kernel, boundary='extend')
+
+        # - Set to NaN offsets pixels that have a zero value in
+        # - either of the two directions.
+        ind_zero = np.where((xoff_masked == 0) | (yoff_masked == 0))
+        xoff_masked[ind_zero] = np.nan
+        yoff_masked[ind_zero] = np.nan
+
+        # - Fill Offsets Map Nodata
+        if fill_off:
+            print('# - Filling Gaps Offsets Map by interpolation.')
+            x_mask = np.ones(np.shape(xoff_masked))
+            x_mask[np.where(np.isnan(xoff_masked))] = 0
+            xoff_masked = fill_nodata(xoff_masked, x_mask,
+                                      max_search_dist=1000, smth_iter=10)
+            y_mask = np.ones(np.shape(yoff_masked))
+            y_mask[np.where(np.isnan(yoff_masked))] = 0
+            yoff_masked = fill_nodata(yoff_masked, y_mask,
+                                      max_search_dist=1000, smth_iter=10)
+
+        # - Set to NaN offsets pixels to Zero
+        xoff_masked[np.isnan(xoff_masked)] = 0
+        yoff_masked[np.isnan(yoff_masked)] = 0
+
+        # - Save Offsets as a complex array - fcomplex: the smoothing and
+        # - the gap filling return float64 arrays
+        off_masked = (xoff_masked + 1j * yoff_masked).astype(np.complex64)
+
+        off_masked.byteswap().tofile(f'{off_path}.res.filt')
+
+        # - Show Smoothed Offsets Map
+        pg9.rasmph(f'{off_path}.res.filt', rn_smp)
+    filt_inputs = [off_par_path, f'{off_path}.res']
+    if args.native_tracker:
+        filt_inputs += [f'{off_path}.ccp'] \
+            + [f'{off_path}.{band}' for band in QUALITY_BANDS]
+    pipe.add('filter', filter_offsets, inputs=filt_inputs,
+             outputs=[f'{off_path}.res.filt'],
+             params={'off_filter': filter_strategy, 'off_smooth': smooth_off,
+                     'off_fill': fill_off})
+
+    # - Interpolate Offsets Map to the selected output spacing(s).
+    # - A single tracking run can serve several output spacings - one
+    # - step per spacing.
+    offsets_map = os.path.join(out_dir, f'{pair_name}_doffs_noramp_smooth')
+    offsets_par = off_par_path
+    intf_spacing = args.skip
+    if args.interp_off:
+        for out_spacing in args.out_off_spacing:
+            interp_map = f'{off_path}.res.filt.interp_{out_spacing}'
+            interp_par = os.path.join(
+                out_dir, f'{pair_name}.interp_{out_spacing}.par'
+            )
+
+            def interp_step(out_spacing: int = out_spacing,
+                            interp_map: str = interp_map,
+                            interp_par: str = interp_par) -> None:
+                off_param = pg.ParFile(off_par_path)
+                rn_smp, _, rn_min, az_min, rn_spacing, az_spacing \
+                    = offsets_grid(off_param)
+                off_masked = pg.read_image(f'{off_path}.res.filt',
+                                           width=rn_smp, dtype='fcomplex')
+                rn_smp_out = interp_offsets(off_masked, off_param,
+                                            rn_min, az_min,
+                                            rn_spacing, az_spacing,
+                                            out_spacing, interp_map,
+                                            interp_par)
+                # - Show Interpolated Offsets Map
+                pg9.rasmph(interp_map, rn_smp_out)
+            pipe.add(f'interp_{out_spacing}', interp_step,
+                     inputs=[off_par_path, f'{off_path}.res.filt'],
+                     outputs=[interp_map, interp_par],
+                     params={'out_spacing': out_spacing})
+
+        # - Setup the interferogram using the first output spacing
+        intf_spacing = args.out_off_spacing[0]
+        offsets_map = f'{off_path}.res.filt.interp_{intf_spacing}'
+        offsets_par = os.path.join(
+            out_dir, f'{pair_name}.interp_{intf_spacing}.par'
+        )
 
     if args.intf:
-        offsets = os.path.join(out_dir, f'{pair_name}_doffs_noramp_smooth')
-        offsets_par = os.path.join(out_dir, f'{pair_name}.par')
-        setup_intf(data_dir, ref, sec, offsets, offsets_par,
-                   args.skip, args.skip)
-
+        pipe.add('intf', lambda: setup_intf(data_dir, ref, sec, offsets_map,
+                                            offsets_par, intf_spacing,
+                                            intf_spacing),
+                 inputs=[offsets_par],
+                 outputs=[os.path.join(data_dir,
+                                       f'bat_inter.{ref}-{sec}')],
+                 params={'offsets': offsets_map, 'spacing': intf_spacing})
+
+    # - Run the pipeline
+    pipe.run(force=args.force)
 
 # - run main program
 if __name__ == '__main__':
@@ -6,6 +6,10 @@ Compute Interferogram for the selected pair - GAMMA calculation Approach.
 
 usage: interf_gamma.py [-h] [--directory DIRECTORY]
     [--out_directory OUT_DIRECTORY] [--filter] [--keep]
+    [--force STEP [STEP ...]] [--n_cores N_CORES] [--geo_cache GEO_CACHE]
+    [--mli_cache MLI_CACHE] [--profile {batch,quicklooks,full}]
+    [--products STEP [STEP ...]] [--resource_pool RESOURCE_POOL]
+    [--stage] [--scratch SCRATCH] [--stage_budget STAGE_BUDGET]
     reference secondary {gis,gimp,greenland,ais,antarctica,bedmap2}
 
 Compute Interferogram Differential Interferogram using GAMMA Software.
@@ -27,6 +31,69 @@ options:
   --filter, -F          Use ADF filter to smooth interferogram phase.
   --keep, -K            Keep intermediate processing outputs.
   --pdoff, -p           Compute preliminary dense offsets field.
+  --force STEP [STEP ...]
+                        Rerun the selected pipeline steps even if up to
+                        date - all: rerun every step.
+  --n_cores N_CORES     Core budget - independent steps run concurrently.
+                        Def: number of CPUs.
+  --geo_cache GEO_CACHE
+                        Geocoding products cache directory - shared by the
+                        pairs with the same reference geometry.
+  --mli_cache MLI_CACHE
+                        Multi-looked intensity cache directory - shared by
+                        the pairs of a stack.
+  --profile {batch,quicklooks,full}
+                        Optional products profile - batch: none,
+                        quicklooks: 8-bit quicklooks, full: quicklooks,
+                        incidence angle map and inverted lookup table.
+  --products STEP [STEP ...]
+                        Optional products (lazy pipeline steps) computed in
+                        addition to the profile - e.g. incidence.
+  --resource_pool RESOURCE_POOL
+                        Node-level resource pool shared with the other
+                        pairs processed on the node - see pair_scheduler.py.
+  --stage               Process the pair in node-local scratch - only the
+                        final products are copied to the data directory.
+  --scratch SCRATCH     Node-local scratch directory (NVMe, /dev/shm) -
+                        Def: $TMPDIR.
+  --stage_budget STAGE_BUDGET
+                        Space budget of the staging area [GB] - Def: half
+                        of the scratch file system.
+
+NOTE: The processing steps are cached - a step is skipped if its inputs
+      and parameters did not change since its last successful run (see
+      utils/pipeline.py). The cache is saved in .interf_gamma_<ref>-<sec>.json.
+      Intermediate outputs removed at the end of the run (no --keep) are
+      recomputed by the next run.
+      Independent steps (e.g. DEM geocoding products, MLI, interferogram
+      and baseline) run concurrently within the --n_cores core budget.
+      The geocoding products with fixed names (DEMice_gc, hgt_icemap,
+      sim_phase, ...) are written to the pair workspace
+      <out_directory>/work_<ref>-<sec> - gc_icemap and DEM_gc_par are
+      published to the output directory, so that pairs sharing the data
+      directory do not overwrite each other.
+      With --geo_cache, the DEM-derived products (gc_map, geocode,
+      incidence, gc_map_inversion) are linked from the cache when the
+      reference geometry, the DEM and the oversampling factor match a
+      previous run - see utils/geo_cache.py. Use a directory on the same
+      file system.
+      With --mli_cache, the reference MLI is linked from the cache when
+      the same SLC was multi-looked with the same looks by another pair -
+      see utils/mli_cache.py.
+      Optional products (quicklooks, incidence angle map, inverted
+      lookup table) are computed only when requested with --profile or
+      --products - see utils/interf_steps.py.
+      With --resource_pool, every step waits for its cores, memory and
+      disk-bandwidth tokens to be granted by the node-level pool shared by
+      the pairs launched by pair_scheduler.py - see
+      utils/resource_pool.py.
+      With --stage, the input SLCs and parameter files are copied to the
+      node-local staging area and the pair is processed there - the
+      intermediates never reach the shared storage. The products left at
+      the end of the run are copied back to the data directory. The
+      least recently used staged files are evicted to respect the space
+      budget - see utils/scratch_area.py. If the inputs do not fit the
+      budget, the pair is processed in the data directory.
 """
 # - Python Dependencies
 from __future__ import print_function
@@ -34,6 +101,8 @@ import os
 import argparse
 import datetime
 import shutil
+import tempfile
+from functools import partial
 import numpy as np
 # - GAMMA's Python integration with the py_gamma module
 import py_gamma as pg
@@ -43,8 +112,14 @@ from scipy.signal import medfilt
 from astropy.convolution import convolve, Box2DKernel
 from st_release.madian_filter_off import median_filter_off
 from st_release.fill_nodata import fill_nodata
-from utils.path_to_dem import path_to_dem
 from utils.make_dir import make_dir
+from utils.offset_fit import offset_fit_par
+from utils.pipeline import Pipeline
+from utils.interf_steps import (add_interf_steps, gamma_threads, slc_ram,
+                                PROFILES, profile_targets)
+from utils.workspace import pair_workspace
+from utils.resource_pool import ResourcePool
+from utils.scratch_area import ScratchArea, copy_back
 
 
 def create_isp_par(data_dir: str, ref: str, sec: str,
@@ -182,28 +257,27 @@ def compute_dense_offsets(data_dir: str, out_dir: str,
     o_az = np.array(o_az / az_spacing, dtype=int)
 
     # - Initialize SNR Array
-    snr_array = np.zeros((az_smp, rn_smp))
+    snr_array = np.zeros((az_smp, rn_smp), dtype=np.float32)
     snr_array[o_az, o_rn] = snr
     snr_array.byteswap() \
         .tofile(os.path.join(out_dir, f'{pair_name}.offmap.snr'))
 
-    # - Run Gamma offset_fit: Range and azimuth offset polynomial estimation
+    # - Range and azimuth offset polynomial estimation and subtraction
+    # - of the polynomial from the offsets - native offset_fit/offset_sub.
     # - Note: Cross-correlation coefficients of SNR values can be set as
     # -       Linear Fit weights.
-    pg.offset_fit(
-        os.path.join(out_dir, f'{pair_name}.offmap'),
-        os.path.join(out_dir, f'{pair_name}.offmap.{off_weight}'),
-        os.path.join(out_dir, f'{pair_name}.par'),
-        '-', '-', '-', poly_order, 0
-    )
-
-    # - Run Gamma offset_sub: Subtraction of polynomial
-    # - from range and azimuth offset estimates
-    pg.offset_sub(
-        os.path.join(out_dir, f'{pair_name}.offmap'),
-        os.path.join(out_dir, f'{pair_name}.par'),
-        os.path.join(out_dir, f'{pair_name}.offmap.res'),
-    )
+    off_map = pg.read_image(os.path.join(out_dir, f'{pair_name}.offmap'),
+                            width=rn_smp, dtype='fcomplex')
+    if off_weight == 'snr':
+        off_wgt = snr_array
+    else:
+        off_wgt = pg.read_image(os.path.join(out_dir,
+                                             f'{pair_name}.offmap.ccp'),
+                                width=rn_smp, dtype='float')
+    off_map = offset_fit_par(off_map, off_wgt, off_param, npoly=poly_order)
+    off_param.write_par(os.path.join(out_dir, f'{pair_name}.par'))
+    off_map.byteswap() \
+        .tofile(os.path.join(out_dir, f'{pair_name}.offmap.res'))
 
     # - Run GAMMA rasmph: Generate 8-bit raster graphics image of the phase
     # - and intensity of complex data - Show Interpolated Offsets Map
@@ -215,9 +289,6 @@ def compute_dense_offsets(data_dir: str, out_dir: str,
     # - > Remove Outliers
     # - > Apply Smoothing Filter
     # - > Fill in Nodata [Optional]
-    off_map \
-        = pg.read_image(os.path.join(out_dir, f'{pair_name}.offmap.res'),
-                        width=rn_smp, dtype='fcomplex')
 
     # - Remove Erroneous Offsets s by apply Median Filter.
     if filter_strategy == 1:
@@ -335,6 +406,48 @@ def main() -> None:
     parser.add_argument('--pdoff', '-p',
                         help='Compute preliminary dense offsets field.',
                         action='store_true')
+    # - Rerun pipeline steps even if up to date.
+    parser.add_argument('--force', nargs='+', default=[], metavar='STEP',
+                        help='Rerun the selected pipeline steps even if up '
+                             'to date - all: rerun every step.')
+    # - Core budget of the concurrent steps.
+    parser.add_argument('--n_cores', type=int, default=os.cpu_count(),
+                        help='Core budget - independent steps run '
+                             'concurrently. Def: number of CPUs.')
+    # - Geocoding products cache.
+    parser.add_argument('--geo_cache', type=str, default=None,
+                        help='Geocoding products cache directory - shared '
+                             'by the pairs with the same reference '
+                             'geometry.')
+    # - Multi-looked intensity cache.
+    parser.add_argument('--mli_cache', type=str, default=None,
+                        help='Multi-looked intensity cache directory - '
+                             'shared by the pairs of a stack.')
+    # - Optional products.
+    parser.add_argument('--profile', choices=sorted(PROFILES),
+                        default='batch',
+                        help='Optional products profile - batch: none, '
+                             'quicklooks: 8-bit quicklooks, full: '
+                             'quicklooks, incidence angle map and inverted '
+                             'lookup table.')
+    parser.add_argument('--products', nargs='+', default=[], metavar='STEP',
+                        help='Optional products (lazy pipeline steps) '
+                             'computed in addition to the profile.')
+    # - Node-level resource pool.
+    parser.add_argument('--resource_pool', type=str, default=None,
+                        help='Node-level resource pool shared with the '
+                             'other pairs processed on the node.')
+    # - Node-local staging.
+    parser.add_argument('--stage', action='store_true',
+                        help='Process the pair in node-local scratch - only '
+                             'the final products are copied to the data '
+                             'directory.')
+    parser.add_argument('--scratch', type=str, default=None,
+                        help='Node-local scratch directory (NVMe, '
+                             '/dev/shm) - Def: $TMPDIR.')
+    parser.add_argument('--stage_budget', type=float, default=None,
+                        help='Space budget of the staging area [GB] - Def: '
+                             'half of the scratch file system.')
 
     args = parser.parse_args()
 
@@ -346,265 +459,171 @@ def main() -> None:
     ref = args.reference        # - Reference SLC
     sec = args.secondary        # - Secondary SLC
 
-    # - Create New ISP Parameter file
-    create_isp_par(data_dir, ref, sec)
-
-    # - Estimate Range and Azimuth Preliminary
-    # - Registration offset fields Preliminary Offset
-    if args.pdoff:
-        pg.offset_pwr_tracking(
-            os.path.join(data_dir, f'{ref}.slc'),
-            os.path.join(data_dir, f'{sec}.slc'),
-            os.path.join(data_dir, f'{ref}.par'),
-            os.path.join(data_dir, f'{sec}.par'),
-            os.path.join(data_dir, f'{ref}-{sec}.par'),
-            os.path.join(out_dir, f'sparse_offsets'),
-            os.path.join(out_dir, f'sparse_offsets.ccp'),
-            64, 64,
-            os.path.join(out_dir, f'sparse_offsets.txt'),
-            '-', '-', 32, 32, '-', '-', '-', '-', '-', '-',
+    # - Stage the inputs to node-local scratch - the pair is processed in
+    # - its staging directory. Space is reserved for the registered and
+    # - resampled secondary SLCs.
+    stage_inputs = [f'{ref}.slc', f'{ref}.par', f'{sec}.slc', f'{sec}.par']
+    scratch_area = None
+    if args.stage:
+        scratch_area = ScratchArea(
+            os.path.abspath(args.scratch if args.scratch
+                            else tempfile.gettempdir()),
+            budget=args.stage_budget)
+        stage_dir = scratch_area.stage_pair(
+            f'{ref}-{sec}', os.path.abspath(data_dir), stage_inputs,
+            reserve=2 * os.path.getsize(os.path.join(data_dir, f'{sec}.slc'))
         )
-    else:
-        pg.offset_pwr(os.path.join(data_dir, f'{ref}.slc'),
-                      os.path.join(data_dir, f'{sec}.slc'),
+        if stage_dir is None:
+            scratch_area = None
+        else:
+            data_dir = stage_dir
+
+    # - Pipeline - steps whose inputs and parameters did not change since
+    # - their last successful run are skipped
+    pipe = Pipeline(os.path.join(out_dir, f'.interf_gamma_{ref}-{sec}.json'))
+
+    def registration() -> None:
+        # - Create New ISP Parameter file
+        create_isp_par(data_dir, ref, sec)
+
+        # - Estimate Range and Azimuth Preliminary
+        # - Registration offset fields Preliminary Offset
+        if args.pdoff:
+            pg.offset_pwr_tracking(
+                os.path.join(data_dir, f'{ref}.slc'),
+                os.path.join(data_dir, f'{sec}.slc'),
+                os.path.join(data_dir, f'{ref}.par'),
+                os.path.join(data_dir, f'{sec}.par'),
+                os.path.join(data_dir, f'{ref}-{sec}.par'),
+                os.path.join(out_dir, f'sparse_offsets'),
+                os.path.join(out_dir, f'sparse_offsets.ccp'),
+                64, 64,
+                os.path.join(out_dir, f'sparse_offsets.txt'),
+                '-', '-', 32, 32, '-', '-', '-', '-', '-', '-',
+            )
+        else:
+            pg.offset_pwr(os.path.join(data_dir, f'{ref}.slc'),
+                          os.path.join(data_dir, f'{sec}.slc'),
+                          os.path.join(data_dir, f'{ref}.par'),
+                          os.path.join(data_dir, f'{sec}.par'),
+                          os.path.join(data_dir, f'{ref}-{sec}.par'),
+                          os.path.join(data_dir, f'sparse_offsets'),
+                          os.path.join(data_dir, f'sparse_offsets.ccp'),
+                          64, 64,
+                          os.path.join(data_dir, f'sparse_offsets.txt'),
+                          '-', 64, 128
+                          )
+
+        # - Estimate range and azimuth offset polynomial
+        # - Update ISP parameter file - offsets polynomial
+        off_par = pg.ParFile(os.path.join(data_dir, f'{ref}-{sec}.par'))
+        off_width \
+            = int(off_par.par_dict['offset_estimation_range_samples'][0])
+        offset_fit_par(
+            pg.read_image(os.path.join(data_dir, 'sparse_offsets'),
+                          width=off_width, dtype='fcomplex'),
+            pg.read_image(os.path.join(data_dir, 'sparse_offsets.ccp'),
+                          width=off_width, dtype='float'),
+            off_par, npoly=3
+        )
+        off_par.write_par(os.path.join(data_dir, f'{ref}-{sec}.par'))
+
+        # - SLC_interp - registers SLC-2 to the reference geometry,
+        # -              that is the geometry of SLC-1.
+        pg.SLC_interp(os.path.join(data_dir, f'{sec}.slc'),
                       os.path.join(data_dir, f'{ref}.par'),
                       os.path.join(data_dir, f'{sec}.par'),
                       os.path.join(data_dir, f'{ref}-{sec}.par'),
-                      os.path.join(data_dir, f'sparse_offsets'),
-                      os.path.join(data_dir, f'sparse_offsets.ccp'),
-                      64, 64,  os.path.join(data_dir, f'sparse_offsets.txt'),
-                      '-', 64, 128
-                      )
-
-    # - Estimate range and azimuth offset polynomial
-    # - Update ISP parameter file - offsets polynomial
-    pg.offset_fit(os.path.join(data_dir, f'sparse_offsets'),
-                  os.path.join(data_dir, f'sparse_offsets.ccp'),
-                  os.path.join(data_dir, f'{ref}-{sec}.par'),
-                  '-', '-', '-', 3)
-
-    # - SLC_interp - registers SLC-2 to the reference geometry,
-    # -              that is the geometry of SLC-1.
-    pg.SLC_interp(os.path.join(data_dir, f'{sec}.slc'),
-                  os.path.join(data_dir, f'{ref}.par'),
-                  os.path.join(data_dir, f'{sec}.par'),
-                  os.path.join(data_dir, f'{ref}-{sec}.par'),
-                  os.path.join(data_dir, f'{sec}.reg.slc'),
-                  os.path.join(data_dir, f'{sec}.reg.par'),
-                  '-', '-', 0, 7
-                  )
-    # - Create New ISP Parameter file
-    create_isp_par(data_dir, ref, f'{sec}.reg')
-
-    # - Compute Dense Offsets Map between the reference SLC and the
-    # - registered secondary SLC.
-    compute_dense_offsets(data_dir, out_dir, ref, f'{sec}.reg', off_filter=1,
-                          search_w=64, off_smooth=True, off_fill=False)
-
-    # - Generate a copy of the dense offsets parameter file
-    shutil.copy(os.path.join(data_dir, f'{ref}-{sec}.reg.par'),
-                os.path.join(data_dir, f'dense_offsets.par'))
-
-    # - Resample the registered secondary SLC to the reference SLC
-    # - using the using a 2-D offset map computed above.
-    pg.SLC_interp_map(os.path.join(data_dir, f'{sec}.reg.slc'),
-                      os.path.join(data_dir, f'{ref}.par'),
+                      os.path.join(data_dir, f'{sec}.reg.slc'),
                       os.path.join(data_dir, f'{sec}.reg.par'),
-                      os.path.join(data_dir, f'{ref}-{sec}.reg.par'),
-                      os.path.join(data_dir, f'{sec}.reg2.slc'),
-                      os.path.join(data_dir, f'{sec}.reg2.par'),
-                      os.path.join(data_dir, f'dense_offsets.par'),
-                      os.path.join(data_dir, f'{ref}-{sec}.reg.offmap.'
-                                             f'res.filt'),
                       '-', '-', 0, 7
                       )
-
-    # - Generate a new parameter file ISP offset and interferogram
-    # - parameter files.
-    # - Create New ISP Parameter file
-    create_isp_par(data_dir, ref, f'{sec}.reg2')
-
-    # - Compute Interferogram
-    pg.SLC_intf(os.path.join(data_dir, f'{ref}.slc'),
-                os.path.join(data_dir, f'{sec}.reg2.slc'),
-                os.path.join(data_dir, f'{ref}.par'),
-                os.path.join(data_dir, f'{sec}.reg2.par'),
-                os.path.join(data_dir, f'{ref}-{sec}.reg2.par'),
-                os.path.join(data_dir, f'coco{ref}-{sec}.reg2.intf'),
-                15, 15      # number of range/azimuth looks
-                )
-    # - Estimate baseline from orbit state vectors
-    pg.base_orbit(os.path.join(data_dir, f'{ref}.par'),
-                  os.path.join(data_dir, f'{sec}.reg2.par'),
-                  os.path.join(data_dir, f'base{ref}-{sec}.reg2.dat'),
-                  )
-
-    # - Estimate and Remove Flat Earth Contribution from the Interferogram
-    pg.ph_slope_base(os.path.join(data_dir, f'coco{ref}-{sec}.reg2.intf'),
+    pipe.add('registration', registration,
+             inputs=[os.path.join(data_dir, f'{ref}.slc'),
+                     os.path.join(data_dir, f'{sec}.slc'),
                      os.path.join(data_dir, f'{ref}.par'),
-                     os.path.join(data_dir, f'{ref}-{sec}.reg2.par'),
-                     os.path.join(data_dir, f'base{ref}-{sec}.reg2.dat'),
-                     os.path.join(data_dir, f'coco{ref}-{sec}.reg2.intf.flat'),
-                     )
-    # - Calculate a multi-look intensity (MLI) image from the reference SLC
-    pg.multi_look(os.path.join(data_dir, f'{ref}.slc'),
-                  os.path.join(data_dir, f'{ref}.par'),
-                  os.path.join(data_dir, f'{ref}.mli'),
-                  os.path.join(data_dir, f'{ref}.mli.par'),
-                  15, 15
-                  )
-
-    # - Extract interferogram dimensions from its parameter file
-    igram_param_dict \
-        = pg.ParFile(os.path.join(data_dir, f'{ref}-{sec}.reg2.par'),).par_dict
-    # - read interferogram number of columns
-    interf_width = int(igram_param_dict['interferogram_width'][0])
-    interf_lines = int(igram_param_dict['interferogram_azimuth_lines'][0])
-    print(f'# - Interferogram Size: {interf_lines} x {interf_width}')
-
-    # - Adaptive interferogram filter using the power spectral density
-    pg.adf(os.path.join(data_dir, f'coco{ref}-{sec}.reg2.intf.flat'),
-           os.path.join(data_dir, f'coco{ref}-{sec}.reg2.intf.flat.filt'),
-           os.path.join(data_dir, f'coco{ref}-{sec}.reg2.intf.flat.coh'),
-           interf_width
-           )
-
-    # - Generate 8-bit greyscale raster image of intensity multi-looked SLC
-    pg.raspwr(os.path.join(data_dir, f'{ref}.mli'), interf_width)
-
-    # - Show Output Interferogram
-    pg.rasmph_pwr(
-        os.path.join(data_dir, f'coco{ref}-{sec}.reg2.intf.flat.filt'),
-        os.path.join(data_dir, f'{ref}.mli.bmp'), interf_width
-    )
-
-    # - Estimate and Remove Topographic Phase from the flattened interferogram
-    dem = args.dem
-    dem_info = path_to_dem(dem, oversample=args.dem_of)
-    dem_info['path'] = dem_info['path']
-    dem_par = os.path.join(dem_info['path'].replace(' ', '\ '), dem_info['par'])
-    dem = os.path.join(dem_info['path'].replace(' ', '\ '), dem_info['dem'])
-    data_dir_gc = data_dir.replace(' ', '\ ')
-
-    pg.gc_map(os.path.join(data_dir_gc, f'{ref}.par'),
-              os.path.join(data_dir_gc, f'{ref}-{sec}.reg2.par'),
-              dem_par,  # - DEM/MAP parameter file
-              dem,  # - DEM data file (or constant height value)
-              dem_info['par'],  # - DEM segment used...
-              'DEMice_gc',  # - DEM segment used for output products...
-              'gc_icemap',  # - geocoding lookup table (fcomplex)
-              dem_info['oversample'], dem_info['oversample'],
-              'sar_map_in_dem_geometry',
-              '-', '-', 'inc.geo', '-', '-', '-', '-', '2', '-'
-              )
-
-    # - Extract DEM Size from parameter file
-    dem_par_path = os.path.join('.', 'DEM_gc_par')
-    dem_param_dict = pg.ParFile(dem_par_path).par_dict
-    dem_width = int(dem_param_dict['width'][0])
-    dem_nlines = int(dem_param_dict['nlines'][0])
-
-    print(f'# - DEM Size: {dem_nlines} x {dem_width}')
-
-    # - Forward geocoding transformation using a lookup table
-    pg.geocode('gc_icemap', 'DEMice_gc', dem_width, 'hgt_icemap',
-               interf_width, interf_lines)
-    pg.geocode('gc_icemap', 'inc.geo', dem_width, 'inc',
-               interf_width, interf_lines)
-
-    # - Invert geocoding lookup table
-    pg.gc_map_inversion('gc_icemap', dem_width, 'gc_map_invert',
-                        interf_width, interf_lines)
-
-    # - Geocoding of Reference SLC power using a geocoding lookup table
-    pg.geocode_back(os.path.join(data_dir, f'{ref}.mli'), interf_width,
-                    'gc_icemap',
-                    os.path.join(data_dir, f'{ref}.mli.geo'),
-                    dem_width, dem_nlines)
-    pg.raspwr(os.path.join(data_dir, f'{ref}.mli.geo'), dem_width)
-
-    # - Remove Interferometric Phase component due to surface Topography.
-    # - Simulate unwrapped interferometric phase using DEM height.
-    pg.phase_sim(os.path.join(data_dir, f'{ref}.par'),
-                 os.path.join(data_dir, f'{ref}-{sec}.reg2.par'),
-                 os.path.join(data_dir, f'base{ref}-{sec}.reg2.dat'),
-                 'hgt_icemap',
-                 'sim_phase', 1, 0, '-'
-                 )
-    # - Create DIFF/GEO parameter file for geocoding and
-    # - differential interferometry
-    pg.create_diff_par(os.path.join(data_dir, f'{ref}-{sec}.reg2.par'),
-                       os.path.join(data_dir, f'{ref}-{sec}.reg2.par'),
-                       'DIFF_par', '-', 0)
-
-    # - Subtract topographic phase from interferogram
-    pg.sub_phase(os.path.join(data_dir, f'coco{ref}-{sec}.reg2.intf.flat'),
-                 'sim_phase', 'DIFF_par',
-                 os.path.join(data_dir,
-                              f'coco{ref}-{sec}.reg2.intf.flat.topo_off'), 1
-                 )
-    # - Show interferogram w/o topographic phase
-    pg.rasmph_pwr(os.path.join(data_dir,
-                                f'coco{ref}-{sec}.reg2.intf.flat.topo_off'),
-                   os.path.join(data_dir, f'{ref}.mli'), interf_width)
-
-    # - Geocode Output interferogram
-    # - Reference Interferogram look-up table
-    ref_gcmap = os.path.join('.', 'gc_icemap')
-
-    # - geocode interferogram
-    pg.geocode_back(
-        os.path.join(data_dir, f'coco{ref}-{sec}.reg2.intf.flat.topo_off'),
-        interf_width,  ref_gcmap,
-        os.path.join(data_dir, f'coco{ref}-{sec}.reg2.intf.flat.topo_off.geo'),
-        dem_width, dem_nlines, '-', 1
-    )
-
-    # - Show Geocoded interferogram
-    pg.rasmph_pwr(
-        os.path.join(data_dir, f'coco{ref}-{sec}.reg2.intf.flat.topo_off.geo'),
-        os.path.join(data_dir, f'{ref}.mli.geo'),  dem_width
-    )
-
-    if args.filter:
-        # - Smooth the obtained interferogram with pg.adf
-        # - Adaptive interferogram filter using the power spectral density.
-        pg.adf(os.path.join(data_dir,
-                            f'coco{ref}-{sec}.reg2.intf.flat.topo_off'),
-               os.path.join(data_dir,
-                            f'coco{ref}-{sec}.reg2.intf.flat.topo_off.filt'),
-               os.path.join(data_dir,
-                            f'coco{ref}-{sec}.reg2.intf.flat.'
-                            f'topo_off.filt.coh'),
-               dem_width)
-        # - Show filtered interferogram
-        pg.rasmph_pwr(
-            os.path.join(data_dir,
-                         f'coco{ref}-{sec}.reg2.intf.flat.topo_off.filt'),
-            os.path.join(data_dir, f'{ref}.mli'), interf_width
-        )
-
-        # - Smooth Geocoded Interferogram
-        pg.adf(os.path.join(data_dir,
-                            f'coco{ref}-{sec}.reg2.intf.flat.topo_off.geo'),
-               os.path.join(data_dir,
-                            f'coco{ref}-{sec}.reg2.intf.flat.'
-                            f'topo_off.geo.filt'),
-               os.path.join(data_dir,
-                            f'coco{ref}-{sec}.reg2.intf.flat.topo_off.geo.'
-                            f'filt.coh'),
-               dem_width)
-        # - Show filtered interferogram
-        pg.rasmph_pwr(
-            os.path.join(data_dir,
-                         f'coco{ref}-{sec}.reg2.intf.flat.topo_off.geo.filt'),
-            os.path.join(data_dir, f'{ref}.mli.geo'), dem_width
-        )
+                     os.path.join(data_dir, f'{sec}.par')],
+             outputs=[os.path.join(data_dir, f'{ref}-{sec}.par'),
+                      os.path.join(data_dir, f'{sec}.reg.slc'),
+                      os.path.join(data_dir, f'{sec}.reg.par')],
+             params={'pdoff': args.pdoff}, cores=gamma_threads(), io=1,
+             ram=partial(slc_ram, os.path.join(data_dir, f'{sec}.slc')))
+
+    def dense_offsets() -> None:
+        # - Create New ISP Parameter file
+        create_isp_par(data_dir, ref, f'{sec}.reg')
+
+        # - Compute Dense Offsets Map between the reference SLC and the
+        # - registered secondary SLC. The offsets map is written next to
+        # - the SLCs - it is moved to the output directory at the end.
+        compute_dense_offsets(data_dir, data_dir, ref, f'{sec}.reg',
+                              off_filter=1, search_w=64, off_smooth=True,
+                              off_fill=False)
+
+        # - Generate a copy of the dense offsets parameter file
+        shutil.copy(os.path.join(data_dir, f'{ref}-{sec}.reg.par'),
+                    os.path.join(data_dir, f'dense_offsets.par'))
+    pipe.add('dense_offsets', dense_offsets,
+             inputs=[os.path.join(data_dir, f'{ref}.slc'),
+                     os.path.join(data_dir, f'{ref}.par'),
+                     os.path.join(data_dir, f'{sec}.reg.slc'),
+                     os.path.join(data_dir, f'{sec}.reg.par')],
+             outputs=[os.path.join(data_dir, f'{ref}-{sec}.reg.par'),
+                      os.path.join(data_dir, f'dense_offsets.par'),
+                      os.path.join(data_dir,
+                                   f'{ref}-{sec}.reg.offmap.res.filt')],
+             params={'off_filter': 1, 'search_w': 64, 'off_smooth': True,
+                     'off_fill': False}, cores=gamma_threads(), io=1)
+
+    def resample() -> None:
+        # - Resample the registered secondary SLC to the reference SLC
+        # - using the using a 2-D offset map computed above.
+        pg.SLC_interp_map(os.path.join(data_dir, f'{sec}.reg.slc'),
+                          os.path.join(data_dir, f'{ref}.par'),
+                          os.path.join(data_dir, f'{sec}.reg.par'),
+                          os.path.join(data_dir, f'{ref}-{sec}.reg.par'),
+                          os.path.join(data_dir, f'{sec}.reg2.slc'),
+                          os.path.join(data_dir, f'{sec}.reg2.par'),
+                          os.path.join(data_dir, f'dense_offsets.par'),
+                          os.path.join(data_dir, f'{ref}-{sec}.reg.offmap.'
+                                                 f'res.filt'),
+                          '-', '-', 0, 7
+                          )
+    pipe.add('resample', resample,
+             inputs=[os.path.join(data_dir, f'{sec}.reg.slc'),
+                     os.path.join(data_dir, f'{ref}.par'),
+                     os.path.join(data_dir, f'{sec}.reg.par'),
+                     os.path.join(data_dir, f'{ref}-{sec}.reg.par'),
+                     os.path.join(data_dir, f'dense_offsets.par'),
+                     os.path.join(data_dir,
+                                  f'{ref}-{sec}.reg.offmap.res.filt')],
+             outputs=[os.path.join(data_dir, f'{sec}.reg2.slc'),
+                      os.path.join(data_dir, f'{sec}.reg2.par')],
+             cores=gamma_threads(), io=1,
+             ram=partial(slc_ram, os.path.join(data_dir, f'{sec}.reg.slc')))
+
+    # - Interferogram, topographic phase removal and geocoding
+    add_interf_steps(pipe, data_dir, ref, f'{sec}.reg2', args.dem,
+                     dem_of=args.dem_of, nrlks=15, nazlks=15,
+                     adf_filter=args.filter, ras=pg,
+                     geo_cache=None if args.geo_cache is None
+                     else os.path.abspath(args.geo_cache),
+                     mli_cache=None if args.mli_cache is None
+                     else os.path.abspath(args.mli_cache),
+                     work_dir=pair_workspace(out_dir, f'{ref}-{sec}'),
+                     pub_dir=out_dir)
+
+    # - Run the pipeline
+    pipe.run(targets=pipe.default_targets()
+             + profile_targets(pipe, args.profile) + args.products,
+             force=args.force, n_cores=args.n_cores,
+             pool=None if args.resource_pool is None
+             else ResourcePool(os.path.abspath(args.resource_pool)))
 
     # - Change Permission Access to all the files contained inside the
     # - output directory.
-    for out_file in os.listdir('.'):
-        os.chmod(out_file, 0o0755)
+    for out_file in os.listdir(out_dir):
+        os.chmod(os.path.join(out_dir, out_file), 0o0755)
 
     if not args.keep:
         # - Rename interferometric outputs
@@ -615,7 +634,7 @@ def main() -> None:
                 os.rename(co, co.replace('_r.reg2.', '.'))
 
         # - Save Offsets Maps inside a subdirectory
-        off_dir = make_dir('.', 'offsets')
+        off_dir = make_dir(out_dir, 'offsets')
         off_list = [os.path.join(data_dir, x) for x in os.listdir(data_dir)
                     if 'offsets' in x or 'offmap' in x]
         for off in off_list:
@@ -633,6 +652,14 @@ def main() -> None:
             if '_r.reg' in out and os.path.isfile(out):
                 os.remove(out)
 
+    if scratch_area is not None:
+        # - Copy the products back to the data directory
+        copied = copy_back(data_dir, os.path.abspath(args.directory),
+                           exclude=stage_inputs)
+        scratch_area.release()
+        print(f'# - Staging area: {len(copied)} products copied to '
+              f'{args.directory}.')
+
 
 # - run main program
 if __name__ == '__main__':
@@ -6,8 +6,17 @@ Run Standard UCI Interferometric Processing on a pair of SLCs.
 
 usage: interf_proc.py [-h] [--directory DIRECTORY]
     [--out_directory OUT_DIRECTORY] [--n_proc N_PROC]
+    [--chunk_factor CHUNK_FACTOR] [--n_rn_tiles N_RN_TILES]
+    [--history_key HISTORY_KEY] [--ampcor_timeout AMPCOR_TIMEOUT]
+    [--ampcor_retries AMPCOR_RETRIES] [--mem_budget MEM_BUDGET] [--resume]
+    [--affinity] [--queue_dir QUEUE_DIR] [--monitor MONITOR] [--speculate]
+    [--stage_slabs] [--scratch SCRATCH] [--force STEP [STEP ...]]
+    [--n_cores N_CORES] [--geo_cache GEO_CACHE] [--mli_cache MLI_CACHE]
+    [--profile {batch,quicklooks,full}] [--products STEP [STEP ...]]
+    [--resource_pool RESOURCE_POOL] [--stage] [--stage_budget STAGE_BUDGET]
     [--ampcor {ampcor_large,ampcor_large2,ampcor_superlarge2}]
-    [--pdoff] [--nrlks NRLKS] [--nazlks NAZLKS] [--filter]
+    [--pdoff] [--off_fit {wls,huber,tukey,ransac}]
+    [--nrlks NRLKS] [--nazlks NAZLKS] [--filter]
     ref_slc sec_slc {gis,gimp,greenland,ais,antarctica,bedmap2,rema}
 
 Run Interferometric Processing (ISP) on a pair of SLCs.
@@ -27,22 +36,111 @@ options:
                         Output directory.
   --n_proc N_PROC, -N N_PROC
                         Number of Parallel Processes.
+  --chunk_factor CHUNK_FACTOR, -C CHUNK_FACTOR
+                        Number of AMPCOR chunks per process.
+  --n_rn_tiles N_RN_TILES, -R N_RN_TILES
+                        Number of AMPCOR range tiles.
+  --history_key HISTORY_KEY
+                        AMPCOR runtime history key (e.g. track/frame)
+                        - size chunks by predicted runtime.
+  --ampcor_timeout AMPCOR_TIMEOUT
+                        AMPCOR chunk wall-time limit [s].
+  --ampcor_retries AMPCOR_RETRIES
+                        Number of retries of a failed AMPCOR chunk.
+  --mem_budget MEM_BUDGET
+                        AMPCOR memory budget [GB] - Def: available memory.
+  --affinity            Pin AMPCOR workers to cores spread across NUMA nodes.
+  --queue_dir QUEUE_DIR
+                        Shared job queue directory - AMPCOR chunks are also
+                        run by ampcor_worker.py processes on other nodes.
+  --monitor MONITOR     AMPCOR progress report interval [s] - 0: disabled.
+  --speculate           Run backup copies of the straggling AMPCOR chunks.
+  --stage_slabs         Run the AMPCOR chunks on SLC slabs staged to
+                        node-local scratch (ampcor_slab.py).
+  --scratch SCRATCH     Node-local scratch directory - Def: $TMPDIR.
   --ampcor {ampcor_large,ampcor_large2,ampcor_superlarge2}, -A
         {ampcor_large,ampcor_large2,ampcor_superlarge2}
                         AMPCOR Binary Selected.
   --pdoff, -p           Compute preliminary dense offsets field.
+  --off_fit {wls,huber,tukey,ransac}
+                        Offsets polynomial fit method.
+  --resume              Resume AMPCOR - rerun only missing or failed chunks.
   --nrlks NRLKS         Number of looks Range.
   --nazlks NAZLKS       Number of looks Azimuth.
   --filter, -F          Use ADF filter to smooth interferogram phase.
+  --force STEP [STEP ...]
+                        Rerun the selected pipeline steps even if up to
+                        date - all: rerun every step.
+  --n_cores N_CORES     Core budget - independent steps run concurrently.
+                        Def: number of CPUs.
+  --geo_cache GEO_CACHE
+                        Geocoding products cache directory - shared by the
+                        pairs with the same reference geometry.
+  --mli_cache MLI_CACHE
+                        Multi-looked intensity cache directory - shared by
+                        the pairs of a stack.
+  --profile {batch,quicklooks,full}
+                        Optional products profile - batch: none,
+                        quicklooks: 8-bit quicklooks, full: quicklooks,
+                        incidence angle map and inverted lookup table.
+  --products STEP [STEP ...]
+                        Optional products (lazy pipeline steps) computed in
+                        addition to the profile - e.g. incidence.
+  --resource_pool RESOURCE_POOL
+                        Node-level resource pool shared with the other
+                        pairs processed on the node - see pair_scheduler.py.
+  --stage               Process the pair in node-local scratch (--scratch) -
+                        only the final products are copied to the data
+                        directory.
+  --stage_budget STAGE_BUDGET
+                        Space budget of the staging area [GB] - Def: half
+                        of the scratch file system.
+
+NOTE: The processing steps (registration, offsets, resample, interferogram,
+      geocoding, ...) are cached - a step is skipped if its inputs and
+      parameters did not change since its last successful run (see
+      utils/pipeline.py). The cache is saved in .interf_proc_<ref>-<sec>.json.
+      Independent steps run concurrently within the --n_cores core budget
+      - the AMPCOR step counts for --n_proc cores.
+      The geocoding products with fixed names (DEMice_gc, hgt_icemap,
+      sim_phase, ...) are written to the pair workspace
+      <out_directory>/work_<ref>-<sec> - gc_icemap and DEM_gc_par are
+      published to the output directory, so that pairs sharing the data
+      directory do not overwrite each other.
+      With --geo_cache, the DEM-derived products (gc_map, geocode,
+      incidence, gc_map_inversion) are linked from the cache when the
+      reference geometry, the DEM and the oversampling factor match a
+      previous run - see utils/geo_cache.py. Use a directory on the same
+      file system.
+      With --mli_cache, the reference MLI is linked from the cache when
+      the same SLC was multi-looked with the same looks by another pair -
+      see utils/mli_cache.py.
+      Optional products (quicklooks, incidence angle map, inverted
+      lookup table) are computed only when requested with --profile or
+      --products - see utils/interf_steps.py.
+      With --resource_pool, every step waits for its cores, memory and
+      disk-bandwidth tokens to be granted by the node-level pool shared by
+      the pairs launched by pair_scheduler.py - see
+      utils/resource_pool.py.
+      With --stage, the input SLCs and parameter files are copied to the
+      node-local staging area, which replaces the data directory of the
+      pair - the output directory is not staged. The registered and
+      resampled SLCs, and the AMPCOR chunks, never reach the shared
+      storage: only the outputs of the other steps written to the data
+      directory are copied back to it. The least recently used
+      staged files are evicted to respect the space budget - see
+      utils/scratch_area.py. If the inputs do not fit the budget, the
+      pair is processed in place. Not available with --queue_dir.
 """
 # - Python Dependencies
 from __future__ import print_function
 import os
 import argparse
 import datetime
+import json
 import shutil
-import subprocess
-from multiprocessing import Pool
+import tempfile
+from functools import partial
 # - GAMMA's Python integration with the py_gamma module
 import py_gamma as pg
 import py_gamma2019 as pg9
@@ -53,7 +151,20 @@ from interp_sec_slc import register_slc
 from st_release.r_off_sar import r_off_sar
 from st_release.c_off4intf import c_off4intf
 from utils.make_dir import make_dir
-from utils.path_to_dem import path_to_dem
+from utils.ampcor_history import HISTORY_PATH, record_runtimes
+from utils.ampcor_chunks import validate_chunk, ampcor_jobs
+from utils.executor import run_jobs, load_rss_cache, RSS_CACHE_PATH
+from utils.ampcor_monitor import AmpcorMonitor
+from utils.ampcor_speculate import AmpcorSpeculator
+from utils.slc_staging import staged_job
+from utils.pipeline import Pipeline
+from utils.interf_steps import (add_interf_steps, gamma_threads, slc_ram,
+                                PROFILES, profile_targets)
+from utils.workspace import pair_workspace
+from utils.resource_pool import ResourcePool
+from utils.scratch_area import ScratchArea, copy_back
+from utils.job_queue import (init_queue, submit_jobs, queue_worker,
+                             queue_results)
 
 
 def create_isp_par(data_dir: str, ref_slc: str, sec_slc: str,
@@ -86,19 +197,6 @@ def create_isp_par(data_dir: str, ref_slc: str, sec_slc: str,
     )
 
 
-def run_sub_process(cmd: list[str]) -> None:
-    """
-    Run a command in a subprocess
-    :param cmd: command to run
-    :return: None
-    """
-    # - Run the command
-    with open(os.devnull, 'wb') as devnull:
-        subprocess.check_call(cmd,
-                              stdout=devnull,
-                              stderr=subprocess.STDOUT)
-
-
 def main() -> None:
     # - Read the system arguments listed after the program
     parser = argparse.ArgumentParser(
@@ -135,6 +233,71 @@ def main() -> None:
                         type=int, default=15,
                         help='Number of Parallel Processes.')
 
+    # - Number of AMPCOR chunks per process
+    parser.add_argument('--chunk_factor', '-C',
+                        type=int, default=6,
+                        help='Number of AMPCOR chunks per process.')
+
+    # - Number of AMPCOR range tiles
+    parser.add_argument('--n_rn_tiles', '-R',
+                        type=int, default=1,
+                        help='Number of AMPCOR range tiles.')
+
+    # - AMPCOR runtime history key
+    parser.add_argument('--history_key', type=str, default=None,
+                        help='AMPCOR runtime history key (e.g. track/frame)'
+                             ' - size chunks by predicted runtime.')
+
+    # - AMPCOR chunk wall-time limit
+    parser.add_argument('--ampcor_timeout', type=float, default=None,
+                        help='AMPCOR chunk wall-time limit [s].')
+
+    # - AMPCOR memory budget
+    parser.add_argument('--mem_budget', type=float, default=None,
+                        help='AMPCOR memory budget [GB] - '
+                             'Def: available memory.')
+
+    # - AMPCOR workers placement
+    parser.add_argument('--affinity', action='store_true',
+                        help='Pin AMPCOR workers to cores spread across '
+                             'NUMA nodes.')
+
+    # - AMPCOR progress monitor
+    parser.add_argument('--monitor', type=float, default=60.,
+                        help='AMPCOR progress report interval [s] - '
+                             '0: disabled.')
+
+    # - Speculative execution of the straggling chunks
+    parser.add_argument('--speculate', action='store_true',
+                        help='Run backup copies of the straggling AMPCOR '
+                             'chunks.')
+
+    # - Stage SLC slabs to node-local scratch
+    parser.add_argument('--stage_slabs', action='store_true',
+                        help='Run the AMPCOR chunks on SLC slabs staged to '
+                             'node-local scratch (ampcor_slab.py).')
+    parser.add_argument('--scratch', type=str, default=None,
+                        help='Node-local scratch directory - Def: $TMPDIR.')
+
+    # - Process the pair in node-local scratch
+    parser.add_argument('--stage', action='store_true',
+                        help='Process the pair in node-local scratch - only '
+                             'the final products are copied to the data '
+                             'directory.')
+    parser.add_argument('--stage_budget', type=float, default=None,
+                        help='Space budget of the staging area [GB] - Def: '
+                             'half of the scratch file system.')
+
+    # - Shared job queue directory
+    parser.add_argument('--queue_dir', type=str, default=None,
+                        help='Shared job queue directory - AMPCOR chunks '
+                             'are also run by ampcor_worker.py processes '
+                             'on other nodes.')
+
+    # - AMPCOR chunk retries
+    parser.add_argument('--ampcor_retries', type=int, default=1,
+                        help='Number of retries of a failed AMPCOR chunk.')
+
     # - AMPCOR Binary Selected
     parser.add_argument('--ampcor', '-A',
                         type=str, default='ampcor_large',
@@ -148,6 +311,16 @@ def main() -> None:
                         help='Compute preliminary dense offsets field.',
                         action='store_true')
 
+    # - Offsets Polynomial Fit Method
+    parser.add_argument('--off_fit', type=str, default='wls',
+                        choices=['wls', 'huber', 'tukey', 'ransac'],
+                        help='Offsets polynomial fit method.')
+
+    # - Resume AMPCOR - rerun only missing or failed chunks
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume AMPCOR - rerun only missing or failed '
+                             'chunks.')
+
     # - Number of Looks in Range
     parser.add_argument('--nrlks', type=int, default=15,
                         help='Number of looks Range.')
@@ -160,6 +333,43 @@ def main() -> None:
                         help='Use ADF filter to smooth interferogram phase.',
                         action='store_true')
 
+    # - Rerun pipeline steps even if up to date
+    parser.add_argument('--force', nargs='+', default=[], metavar='STEP',
+                        help='Rerun the selected pipeline steps even if up '
+                             'to date - all: rerun every step.')
+
+    # - Core budget of the concurrent steps
+    parser.add_argument('--n_cores', type=int, default=os.cpu_count(),
+                        help='Core budget - independent steps run '
+                             'concurrently. Def: number of CPUs.')
+
+    # - Geocoding products cache
+    parser.add_argument('--geo_cache', type=str, default=None,
+                        help='Geocoding products cache directory - shared '
+                             'by the pairs with the same reference '
+                             'geometry.')
+
+    # - Multi-looked intensity cache
+    parser.add_argument('--mli_cache', type=str, default=None,
+                        help='Multi-looked intensity cache directory - '
+                             'shared by the pairs of a stack.')
+
+    # - Optional products
+    parser.add_argument('--profile', choices=sorted(PROFILES),
+                        default='batch',
+                        help='Optional products profile - batch: none, '
+                             'quicklooks: 8-bit quicklooks, full: '
+                             'quicklooks, incidence angle map and inverted '
+                             'lookup table.')
+    parser.add_argument('--products', nargs='+', default=[], metavar='STEP',
+                        help='Optional products (lazy pipeline steps) '
+                             'computed in addition to the profile.')
+
+    # - Node-level resource pool
+    parser.add_argument('--resource_pool', type=str, default=None,
+                        help='Node-level resource pool shared with the '
+                             'other pairs processed on the node.')
+
     # - Parse the command line arguments
     args = parser.parse_args()
 
@@ -172,271 +382,280 @@ def main() -> None:
     ampcor_bin = args.ampcor    # - AMPCOR binary selected
     pdoff = args.pdoff          # - Compute preliminary dense offsets field
     dem = args.dem            # - DEM file for Geocoding and Topo Phase Removal
+    queue_dir = None if args.queue_dir is None \
+        else os.path.abspath(args.queue_dir)
+    if queue_dir is not None:
+        init_queue(queue_dir, max_attempts=args.ampcor_retries + 1)
+
+    # - Stage the inputs to node-local scratch - the data directory of the
+    # - pair is moved to its staging directory, the output directory is not.
+    # - Space is reserved for the registered and resampled secondary SLCs.
+    stage_inputs = [f'{ref_slc}.slc', f'{ref_slc}.par', f'{sec_slc}.slc',
+                    f'{sec_slc}.par']
+    scratch_area = None
+    if args.stage:
+        if queue_dir is not None:
+            parser.error('--stage: the AMPCOR chunks of a shared job queue '
+                         'must be readable by the other nodes.')
+        scratch_area = ScratchArea(
+            os.path.abspath(args.scratch if args.scratch
+                            else tempfile.gettempdir()),
+            budget=args.stage_budget)
+        stage_dir = scratch_area.stage_pair(
+            f'{ref_slc}-{sec_slc}', os.path.abspath(data_dir), stage_inputs,
+            reserve=2 * os.path.getsize(os.path.join(data_dir,
+                                                     f'{sec_slc}.slc')))
+        if stage_dir is None:
+            scratch_area = None
+        else:
+            data_dir = stage_dir
+    # - Directory of the registration and AMPCOR intermediates - the AMPCOR
+    # - chunks refer to the SLCs relative to it, and their outputs are
+    # - stacked from the data directory
+    proc_dir = out_dir if scratch_area is None else data_dir
+
+    # - Resume mode - the AMPCOR chunks have already been planned
+    bat_path = os.path.join(proc_dir, f'bat_{ref_slc}-{sec_slc}.reg')
+    resume = args.resume and os.path.isfile(bat_path)
+
+    # - Pipeline - steps whose inputs and parameters did not change since
+    # - their last successful run are skipped
+    pipe = Pipeline(os.path.join(out_dir,
+                                 f'.interf_proc_{ref_slc}-{sec_slc}.json'))
+
+    def registration() -> None:
+        # - Compute ISP Parameters
+        create_isp_par(data_dir, ref_slc, args.sec_slc)
+
+        # - Register SLC-2 to SLC-1 using 3rd order polynomial
+        register_slc(ref_slc, args.sec_slc,  # - Reference and Secondary SLC
+                     pdoff=pdoff,   # - Compute preliminary dense offsets field
+                     data_dir=data_dir,     # - Path to data directory
+                     out_dir=proc_dir)      # - Path to output directory
+    pipe.add('registration', registration,
+             inputs=[os.path.join(data_dir, f'{ref_slc}.slc'),
+                     os.path.join(data_dir, f'{sec_slc}.slc'),
+                     os.path.join(data_dir, f'{ref_slc}.par'),
+                     os.path.join(data_dir, f'{sec_slc}.par')],
+             outputs=[os.path.join(data_dir, f'{ref_slc}-{sec_slc}.par'),
+                      os.path.join(data_dir, f'{sec_slc}.reg.slc'),
+                      os.path.join(data_dir, f'{sec_slc}.reg.par'),
+                      os.path.join(data_dir,
+                                   f'{ref_slc}-{sec_slc}.reg.par')],
+             params={'pdoff': pdoff}, cores=gamma_threads(), io=1,
+             ram=partial(slc_ram, os.path.join(data_dir, f'{sec_slc}.slc')))
 
-    # - Compute ISP Parameters
-    create_isp_par(data_dir, ref_slc, sec_slc)
-
-    # - Register SLC-2 to SLC-1 using 3rd order polynomial
-    register_slc(ref_slc, sec_slc,  # - Reference and Secondary SLC
-                 pdoff=pdoff,       # - Compute preliminary dense offsets field
-                 data_dir=data_dir,     # - Path to data directory
-                 out_dir=out_dir)       # - Path to output directory
-
-    # - Create the bat file to run AMPCOR
     sec_slc = f'{sec_slc}.reg'  # - Secondary SLC registered to reference SLC
-    c_ampcor_iceye(ref_slc, sec_slc,    # - Reference and Secondary SLC
-                   data_dir=data_dir,   # - Path to data directory
-                   out_dir=out_dir,     # - Path to output directory
-                   n_proc=n_proc,       # - Number of parallel processes
-                   ampcor=ampcor_bin)   # - AMPCOR binary selected
-
-    print('# - Run AMPCOR.')
-    # - Read ampcor bat file
-    with open(os.path.join(out_dir, f'bat_{ref_slc}-{sec_slc}')) as r_fid:
-        sub_proc = r_fid.readlines()
-    sub_proc_list = [s.split(' ')[0:2] for s in sub_proc]
-
-    # - Run AMPCOR
-    with Pool(n_proc) as p:
-        p.map(run_sub_process, sub_proc_list)
-
-    print('# - AMPCOR Run Completed.')
-
-    # - Process offsets - Stack offset files
-    r_off_sar(data_dir, ref_slc, sec_slc)
-
-    # - Process offsets for Interferogram
-    c_off4intf(data_dir, ref_slc, sec_slc,
-               range_spacing=30, azimuth_spacing=30,
-               filter_strategy=2, smooth=True,
-               fill=False, nrlks=args.nrlks, nazlks=args.nazlks)
-
-    # - Make Save directory
-    save_dir = make_dir(data_dir, 'Save')
-    # - Move offsets calculated by AMPCOR into OFFSETS
-    off_file_list = [os.path.join('.', x) for x in os.listdir('.')
-                     if '.offmap_' in x]
-    for f_mv in off_file_list:
-        shutil.move(f_mv, save_dir)
-
-    # - Resample the registered secondary SLC to the reference SLC
-    # - using the using a 2-D offset map computed above.
     offset_par = f'{ref_slc}-{sec_slc}.offmap.par.interp'
     offset_interp = f'{ref_slc}-{sec_slc}.offmap.off.new.interp'
-    pg.SLC_interp_map(
-        os.path.join(data_dir, f'{sec_slc}.slc'),  # - Secondary SLC
-        os.path.join(data_dir, f'{ref_slc}.par'),  # - Reference SLC par file
-        os.path.join(data_dir, f'{sec_slc}.par'),  # - Secondary SLC par file
-        os.path.join(data_dir, offset_par),            # - Offsets par file
-        os.path.join(data_dir, f'{sec_slc}.reg2.slc'),  # - Output SLC
-        os.path.join(data_dir, f'{sec_slc}.reg2.par'),  # - Output SLC par file
-        os.path.join(data_dir, offset_par),            # - Offsets par file
-        os.path.join(data_dir, offset_interp),         # - Offsets file
-        '-', '-', 0, 7
-    )
-
-    # - Generate a new parameter file ISP offset and interferogram
-    # - parameter files.
-    # - Create New ISP Parameter file
-    create_isp_par(data_dir, ref_slc, f'{sec_slc}.reg2')
-
-    # - Compute Interferogram
-    pg.SLC_intf(os.path.join(data_dir, f'{ref_slc}.slc'),
-                os.path.join(data_dir, f'{sec_slc}.reg2.slc'),
-                os.path.join(data_dir, f'{ref_slc}.par'),
-                os.path.join(data_dir, f'{sec_slc}.reg2.par'),
-                os.path.join(data_dir, f'{ref_slc}-{sec_slc}.reg2.par'),
-                os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}.reg2.intf'),
-                args.nrlks, args.nazlks,      # number of range/azimuth looks
-                )
-
-    # - Estimate baseline from orbit state vectors
-    pg.base_orbit(os.path.join(data_dir, f'{ref_slc}.par'),
-                  os.path.join(data_dir, f'{sec_slc}.reg2.par'),
-                  os.path.join(data_dir, f'base{ref_slc}-{sec_slc}.reg2.dat'),
-                  )
-
-    # - Estimate and Remove Flat Earth Contribution from the Interferogram
-    pg.ph_slope_base(
-        os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}.reg2.intf'),
-        os.path.join(data_dir, f'{ref_slc}.par'),
-        os.path.join(data_dir, f'{ref_slc}-{sec_slc}.reg2.par'),
-        os.path.join(data_dir, f'base{ref_slc}-{sec_slc}.reg2.dat'),
-        os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}.reg2.intf.flat')
-    )
-    # - Calculate a multi-look intensity (MLI) image from the reference SLC
-    pg.multi_look(os.path.join(data_dir, f'{ref_slc}.slc'),
-                  os.path.join(data_dir, f'{ref_slc}.par'),
-                  os.path.join(data_dir, f'{ref_slc}.mli'),
-                  os.path.join(data_dir, f'{ref_slc}.mli.par'),
-                  args.nrlks, args.nazlks,
-                  )
-
-    # - Extract interferogram dimensions from its parameter file
-    igram_param_dict \
-        = pg.ParFile(os.path.join(data_dir,
-                                  f'{ref_slc}-{sec_slc}.reg2.par'),).par_dict
-    # - read interferogram number of columns
-    interf_width = int(igram_param_dict['interferogram_width'][0])
-    interf_lines = int(igram_param_dict['interferogram_azimuth_lines'][0])
-    print(f'# - Interferogram Size: {interf_lines} x {interf_width}')
-
-    # - Adaptive interferogram filter using the power spectral density
-    pg.adf(
-        os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}.reg2.intf.flat'),
-        os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}.reg2.intf.flat.filt'),
-        os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}.reg2.intf.flat.coh'),
-        interf_width
-    )
-
-    # - Generate 8-bit greyscale raster image of intensity multi-looked SLC
-    pg9.raspwr(os.path.join(data_dir, f'{ref_slc}.mli'), interf_width)
-
-    # - Show Output Interferogram
-    pg9.rasmph_pwr(
-        os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}.reg2.intf.flat.filt'),
-        os.path.join(data_dir, f'{ref_slc}.mli.bmp'), interf_width
-    )
-
-    # - Estimate and Remove Topographic Phase from the flattened interferogram
-    dem_info = path_to_dem(dem, oversample=args.dem_of)
-    dem_info['path'] = dem_info['path']
-    dem_par = os.path.join(dem_info['path'].replace(' ', '\ '), dem_info['par'])
-    dem = os.path.join(dem_info['path'].replace(' ', '\ '), dem_info['dem'])
-    data_dir_gc = data_dir.replace(' ', '\ ')
-
-    pg.gc_map(
-        os.path.join(data_dir_gc, f'{ref_slc}.par'),
-        os.path.join(data_dir_gc, f'{ref_slc}-{sec_slc}.reg2.par'),
-        dem_par,  # - DEM/MAP parameter file
-        dem,  # - DEM data file (or constant height value)
-        dem_info['par'],  # - DEM segment used...
-        'DEMice_gc',  # - DEM segment used for output products...
-        'gc_icemap',  # - geocoding lookup table (fcomplex)
-        dem_info['oversample'], dem_info['oversample'],
-        'sar_map_in_dem_geometry',
-        '-', '-', 'inc.geo', '-', '-', '-', '-', '2', '-'
-    )
-
-    # - Extract DEM Size from parameter file
-    dem_par_path = os.path.join('.', 'DEM_gc_par')
-    dem_param_dict = pg.ParFile(dem_par_path).par_dict
-    dem_width = int(dem_param_dict['width'][0])
-    dem_nlines = int(dem_param_dict['nlines'][0])
-
-    print(f'# - DEM Size: {dem_nlines} x {dem_width}')
-
-    # - Forward geocoding transformation using a lookup table
-    pg.geocode('gc_icemap', 'DEMice_gc', dem_width, 'hgt_icemap',
-               interf_width, interf_lines)
-    pg.geocode('gc_icemap', 'inc.geo', dem_width, 'inc',
-               interf_width, interf_lines)
-
-    # - Invert geocoding lookup table
-    pg.gc_map_inversion('gc_icemap', dem_width, 'gc_map_invert',
-                        interf_width, interf_lines)
-
-    # - Geocoding of Reference SLC power using a geocoding lookup table
-    pg.geocode_back(os.path.join(data_dir, f'{ref_slc}.mli'), interf_width,
-                    'gc_icemap',
-                    os.path.join(data_dir, f'{ref_slc}.mli.geo'),
-                    dem_width, dem_nlines)
-    pg9.raspwr(os.path.join(data_dir, f'{ref_slc}.mli.geo'), dem_width)
-
-    # - Remove Interferometric Phase component due to surface Topography.
-    # - Simulate unwrapped interferometric phase using DEM height.
-    pg.phase_sim(
-        os.path.join(data_dir, f'{ref_slc}.par'),
-        os.path.join(data_dir, f'{ref_slc}-{sec_slc}.reg2.par'),
-        os.path.join(data_dir, f'base{ref_slc}-{sec_slc}.reg2.dat'),
-        'hgt_icemap',
-        'sim_phase', 1, 0, '-'
-    )
-    # - Create DIFF/GEO parameter file for geocoding and
-    # - differential interferometry
-    pg.create_diff_par(os.path.join(data_dir, f'{ref_slc}-{sec_slc}.reg2.par'),
-                       os.path.join(data_dir, f'{ref_slc}-{sec_slc}.reg2.par'),
-                       'DIFF_par', '-', 0)
-
-    # - Subtract topographic phase from interferogram
-    pg.sub_phase(
-        os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}.reg2.intf.flat'),
-        'sim_phase', 'DIFF_par',
-        os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}.reg2.'
-                               f'intf.flat.topo_off'), 1
-    )
-    # - Show interferogram w/o topographic phase
-    pg9.rasmph_pwr(
-        os.path.join(data_dir,
-                     f'coco{ref_slc}-{sec_slc}.reg2.intf.flat.topo_off'),
-        os.path.join(data_dir, f'{ref_slc}.mli'), interf_width
-    )
-
-    # - Geocode Output interferogram
-    # - Reference Interferogram look-up table
-    ref_gcmap = os.path.join('.', 'gc_icemap')
-
-    # - geocode interferogram
-    pg.geocode_back(
-        os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}'
-                               f'.reg2.intf.flat.topo_off'),
-        interf_width,  ref_gcmap,
-        os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}'
-                               f'.reg2.intf.flat.topo_off.geo'),
-        dem_width, dem_nlines, '-', 1
-    )
-
-    # - Show Geocoded interferogram
-    pg9.rasmph_pwr(
-        os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}'
-                               f'.reg2.intf.flat.topo_off.geo'),
-        os.path.join(data_dir, f'{ref_slc}.mli.geo'),  dem_width
-    )
-
-    if args.filter:
-        # - Smooth the obtained interferogram with pg.adf
-        # - Adaptive interferogram filter using the power spectral density.
-        pg.adf(
-            os.path.join(data_dir,
-                         f'coco{ref_slc}-{sec_slc}.reg2.intf.flat.topo_off'),
-            os.path.join(data_dir,
-                         f'coco{ref_slc}-{sec_slc}.reg2.intf.'
-                         f'flat.topo_off.filt'),
-            os.path.join(data_dir,
-                         f'coco{ref_slc}-{sec_slc}.reg2.intf.flat.'
-                         f'topo_off.filt.coh'),
-            dem_width
-        )
-        # - Show filtered interferogram
-        pg9.rasmph_pwr(
-            os.path.join(data_dir,
-                         f'coco{ref_slc}-{sec_slc}.reg2.intf.'
-                         f'flat.topo_off.filt'),
-            os.path.join(data_dir, f'{ref_slc}.mli'), interf_width
-        )
-
-        # - Smooth Geocoded Interferogram
-        pg.adf(
-            os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}.reg2.intf.'
-                                   f'flat.topo_off.geo'),
-            os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}.reg2.intf.'
-                                   f'flat.topo_off.geo.filt'),
-            os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}.reg2.intf.'
-                                   f'flat.topo_off.geo.filt.coh'),
-            dem_width
-        )
 
-        # - Show filtered interferogram
-        pg9.rasmph_pwr(
-            os.path.join(data_dir, f'coco{ref_slc}-{sec_slc}.reg2.intf.'
-                                   f'flat.topo_off.geo.filt'),
-            os.path.join(data_dir, f'{ref_slc}.mli.geo'), dem_width
+    def offsets() -> None:
+        # - Create the bat file to run AMPCOR
+        if not resume:
+            c_ampcor_iceye(ref_slc, sec_slc,    # - Reference and Secondary
+                           data_dir=data_dir,   # - Path to data directory
+                           out_dir=proc_dir,    # - Path to output directory
+                           n_proc=n_proc,       # - Number of processes
+                           chunk_factor=args.chunk_factor,  # - Chunks/proc.
+                           n_rn_tiles=args.n_rn_tiles,      # - Range tiles
+                           history_key=args.history_key,    # - History key
+                           queue_dir=queue_dir,  # - Shared job queue
+                           stage_slabs=args.stage_slabs,  # - Stage slabs
+                           scratch=args.scratch,  # - Node-local scratch
+                           ampcor=ampcor_bin)   # - AMPCOR binary selected
+
+        print('# - Run AMPCOR.')
+        # - Read ampcor bat file
+        all_jobs = ampcor_jobs(bat_path)
+        # - Stage SLC slabs - each chunk reads its azimuth slabs from the
+        # - shared storage with one sequential read and runs on local copies
+        if args.stage_slabs:
+            all_jobs = [staged_job(job, scratch=args.scratch)
+                        for job in all_jobs]
+        in_paths = {job['chunk']: job['in_path'] for job in all_jobs}
+        jobs = all_jobs
+
+        # - Resume - rerun only the missing, failed or incomplete chunks
+        if resume:
+            jobs = [job for job in all_jobs
+                    if validate_chunk(job['in_path'])['status'] != 'done']
+            print(f'# - Resume: {len(jobs)} of {len(all_jobs)} '
+                  f'AMPCOR chunks to run.')
+            if queue_dir is not None:
+                submit_jobs(queue_dir, jobs)
+
+        # - Run AMPCOR - chunks are handed to the n_proc workers one at a
+        # - time as soon as a worker becomes idle.
+        # - Chunks are admitted only while the projected memory, based on the
+        # - peak RSS of the AMPCOR binary/window size, fits the memory budget.
+        # - With a shared job queue, the local workers drain the queue together
+        # - with the ampcor_worker.py processes started on other nodes.
+        mem_budget = None if args.mem_budget is None \
+            else int(args.mem_budget * 1024 ** 2)
+        # - Progress monitor - chunks output files tailed in the background
+        monitor = AmpcorMonitor([job['in_path'] for job in jobs],
+                                status_path=os.path.join(
+                                    out_dir, f'ampcor_progress_{ref_slc}-'
+                                             f'{sec_slc}.json'))
+        if args.monitor > 0:
+            monitor.start(interval=args.monitor)
+        # - Speculative execution - the first copy of a chunk that succeeds
+        # - is kept (local workers only)
+        speculator = AmpcorSpeculator(monitor, jobs) \
+            if args.speculate else None
+
+        def chunk_callback(name: str, result: dict) -> None:
+            if result['cancelled']:
+                return
+            if speculator is not None:
+                name = speculator.promote(name, result)
+            if name is not None:
+                monitor.finish(name, result)
+
+        if queue_dir is None:
+            results = run_jobs(jobs, max_workers=n_proc,
+                               timeout=args.ampcor_timeout,
+                               retries=args.ampcor_retries,
+                               log_dir=os.path.join(out_dir, 'ampcor_logs'),
+                               cwd=proc_dir, rss_cache_path=RSS_CACHE_PATH,
+                               mem_budget=mem_budget, affinity=args.affinity,
+                               callback=chunk_callback, speculate=speculator)
+        else:
+            queue_worker(queue_dir, n_proc=n_proc, timeout=args.ampcor_timeout,
+                         log_dir=os.path.join(out_dir, 'ampcor_logs'),
+                         rss_cache_path=RSS_CACHE_PATH, mem_budget=mem_budget,
+                         affinity=args.affinity)
+            results = queue_results(queue_dir)
+        print(monitor.report(monitor.stop()))
+        results = {job['chunk']: results[job['name']] for job in jobs}
+        runtimes = {c_id: res['wall_time'] for c_id, res in results.items()}
+
+        # - Validate the chunks outputs and save their status
+        chunk_status = {}
+        for c_id, in_path in in_paths.items():
+            chunk_status[c_id] = validate_chunk(
+                in_path, returncode=results.get(c_id, {}).get('returncode'))
+            chunk_status[c_id].update(results.get(c_id, {}))
+        with open(os.path.join(out_dir, f'ampcor_status_{ref_slc}-{sec_slc}'
+                                        f'.json'), 'w') as w_fid:
+            json.dump(chunk_status, w_fid, indent=1)
+
+        # - Record the chunks runtimes in the AMPCOR runtime history
+        with open(os.path.join(proc_dir,
+                               f'chunks_{ref_slc}-{sec_slc}.json')) as r_fid:
+            record_runtimes(HISTORY_PATH, json.load(r_fid),
+                            {c_id: c_time for c_id, c_time in runtimes.items()
+                             if chunk_status[c_id]['status'] == 'done'})
+
+        failed = [c_id for c_id, c_st in chunk_status.items()
+                  if c_st['status'] != 'done']
+        if failed:
+            raise RuntimeError(f'# - AMPCOR chunks not completed: {failed}. '
+                               f'Rerun with --resume.')
+        print('# - AMPCOR Run Completed.')
+
+        # - Process offsets - Stack offset files
+        r_off_sar(data_dir, ref_slc, sec_slc, fit_method=args.off_fit,
+                  queue_dir=queue_dir)
+
+        # - Process offsets for Interferogram
+        c_off4intf(data_dir, ref_slc, sec_slc,
+                   range_spacing=30, azimuth_spacing=30,
+                   filter_strategy=2, smooth=True,
+                   fill=False, nrlks=args.nrlks, nazlks=args.nazlks)
+
+        # - Make Save directory
+        save_dir = make_dir(data_dir, 'Save')
+        # - Move offsets calculated by AMPCOR into OFFSETS
+        off_file_list = [os.path.join(proc_dir, x)
+                         for x in os.listdir(proc_dir) if '.offmap_' in x]
+        for f_mv in off_file_list:
+            shutil.move(f_mv, save_dir)
+
+    def ampcor_ram() -> float:
+        # - Memory of the AMPCOR step [GB] - peak RSS of the AMPCOR chunks
+        # - measured by the previous runs, one chunk per worker
+        rss = [c_rss for key, c_rss in load_rss_cache(RSS_CACHE_PATH).items()
+               if key.split(':')[0] == os.path.basename(ampcor_bin)]
+        return n_proc * max(rss, default=0) / 1024 ** 2
+    pipe.add('offsets', offsets,
+             inputs=[os.path.join(data_dir, f'{ref_slc}.slc'),
+                     os.path.join(data_dir, f'{ref_slc}.par'),
+                     os.path.join(data_dir, f'{sec_slc}.slc'),
+                     os.path.join(data_dir, f'{sec_slc}.par'),
+                     os.path.join(data_dir, f'{ref_slc}-{sec_slc}.par')],
+             outputs=[os.path.join(data_dir, offset_par),
+                      os.path.join(data_dir, offset_interp)],
+             params={'ampcor': ampcor_bin, 'off_fit': args.off_fit,
+                     'nrlks': args.nrlks, 'nazlks': args.nazlks},
+             cores=n_proc, io=1,
+             ram=ampcor_ram if args.mem_budget is None else args.mem_budget)
+
+    def resample() -> None:
+        # - Resample the registered secondary SLC to the reference SLC
+        # - using the using a 2-D offset map computed above.
+        pg.SLC_interp_map(
+            os.path.join(data_dir, f'{sec_slc}.slc'),  # - Secondary SLC
+            os.path.join(data_dir, f'{ref_slc}.par'),  # - Reference par
+            os.path.join(data_dir, f'{sec_slc}.par'),  # - Secondary par
+            os.path.join(data_dir, offset_par),            # - Offsets par
+            os.path.join(data_dir, f'{sec_slc}.reg2.slc'),  # - Output SLC
+            os.path.join(data_dir, f'{sec_slc}.reg2.par'),  # - Output par
+            os.path.join(data_dir, offset_par),            # - Offsets par
+            os.path.join(data_dir, offset_interp),         # - Offsets file
+            '-', '-', 0, 7
         )
+    pipe.add('resample', resample,
+             inputs=[os.path.join(data_dir, f'{sec_slc}.slc'),
+                     os.path.join(data_dir, f'{ref_slc}.par'),
+                     os.path.join(data_dir, f'{sec_slc}.par'),
+                     os.path.join(data_dir, offset_par),
+                     os.path.join(data_dir, offset_interp)],
+             outputs=[os.path.join(data_dir, f'{sec_slc}.reg2.slc'),
+                      os.path.join(data_dir, f'{sec_slc}.reg2.par')],
+             cores=gamma_threads(), io=1,
+             ram=partial(slc_ram, os.path.join(data_dir, f'{sec_slc}.slc')))
+
+    # - Interferogram, topographic phase removal and geocoding
+    add_interf_steps(pipe, data_dir, ref_slc, f'{sec_slc}.reg2', dem,
+                     dem_of=args.dem_of, nrlks=args.nrlks,
+                     nazlks=args.nazlks, adf_filter=args.filter, ras=pg9,
+                     geo_cache=None if args.geo_cache is None
+                     else os.path.abspath(args.geo_cache),
+                     mli_cache=None if args.mli_cache is None
+                     else os.path.abspath(args.mli_cache),
+                     work_dir=pair_workspace(out_dir,
+                                             f'{ref_slc}-{args.sec_slc}'),
+                     pub_dir=out_dir)
+
+    # - Run the pipeline - in resume mode, the registration completed
+    # - before the AMPCOR run is not repeated
+    pipe.run(targets=pipe.default_targets()
+             + profile_targets(pipe, args.profile) + args.products,
+             force=args.force, n_cores=args.n_cores,
+             assume_done=['registration'] if resume else [],
+             pool=None if args.resource_pool is None
+             else ResourcePool(os.path.abspath(args.resource_pool)))
 
     # - Change Permission Access to all the files contained inside the
     # - output directory.
-    for out_file in os.listdir('.'):
-        os.chmod(out_file, 0o0755)
+    for out_file in os.listdir(out_dir):
+        os.chmod(os.path.join(out_dir, out_file), 0o0755)
+
+    if scratch_area is not None:
+        # - Copy the products back to the data directory - the outputs of
+        # - the steps written to the data directory, except the registered
+        # - and resampled SLCs. The AMPCOR chunks are left in scratch.
+        products = [os.path.basename(out_path)
+                    for name, step in pipe.steps.items()
+                    if name not in ('registration', 'resample')
+                    for out_path in step.outputs
+                    if os.path.dirname(out_path) == data_dir]
+        copied = copy_back(data_dir, os.path.abspath(args.directory),
+                           exclude=stage_inputs, products=products)
+        scratch_area.release()
+        print(f'# - Staging area: {len(copied)} products copied to '
+              f'{args.directory}.')
 
 
 # - run main program
@@ -33,6 +33,7 @@ import shutil
 import py_gamma as pg
 import py_gamma2019 as pg9
 from utils.make_dir import make_dir
+from utils.offset_fit import offset_fit_par
 
 
 def create_isp_par(data_dir: str, ref: str, sec: str,
@@ -133,17 +134,19 @@ def register_slc(ref_slc: str, sec_slc: str, pdoff: bool = False,
 
     # - Estimate range and azimuth offset polynomial
     # - Update ISP parameter file - offsets polynomial
-    pg.offset_fit(os.path.join(data_dir, f'sparse_offsets'),
-                  os.path.join(data_dir, f'sparse_offsets.ccp'),
-                  os.path.join(data_dir, f'{ref_slc}-{sec_slc}.par'),
-                  '-', '-', '-', 3)
-    # - Run Gamma offset_sub: Subtraction of polynomial
-    # - from range and azimuth offset estimates
-    pg.offset_sub(
-        os.path.join(data_dir, f'sparse_offsets'),
-        os.path.join(data_dir, f'{ref_slc}-{sec_slc}.par'),
-        os.path.join(data_dir, f'sparse_offsets.res'),
+    off_par = pg.ParFile(os.path.join(data_dir, f'{ref_slc}-{sec_slc}.par'))
+    off_width = int(off_par.par_dict['offset_estimation_range_samples'][0])
+    sparse_res = offset_fit_par(
+        pg.read_image(os.path.join(data_dir, 'sparse_offsets'),
+                      width=off_width, dtype='fcomplex'),
+        pg.read_image(os.path.join(data_dir, 'sparse_offsets.ccp'),
+                      width=off_width, dtype='float'),
+        off_par, npoly=3
     )
+    off_par.write_par(os.path.join(data_dir, f'{ref_slc}-{sec_slc}.par'))
+    # - Subtraction of polynomial from range and azimuth offset estimates
+    sparse_res.byteswap() \
+        .tofile(os.path.join(data_dir, 'sparse_offsets.res'))
 
     # - SLC_interp - registers SLC-2 to the reference geometry,
     # -              that is the geometry of SLC-1.
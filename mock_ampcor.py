@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+u"""
+mock_ampcor.py
+
+Mock AMPCOR binary used to benchmark and regression-test the AMPCOR
+orchestration (c_ampcor_iceye.py, interf_proc.py, ampcor_worker.py)
+without the AMPCOR binaries and the SLCs.
+
+The mock reads a chunk .in file, spends a time proportional to the number
+of offsets requested (offset lines x range samples) - sleeping or burning
+CPU - and writes syntactically valid AMPCOR output lines:
+    x  range_offset  y  azimuth_offset  snr  cov_x  cov_y  cov_xy
+
+The per-offset cost is scaled along azimuth by a linear skew, and by a
+log-normal jitter drawn per scene block of JITTER_BLOCK lines x samples,
+to emulate the slow scene areas and the stragglers of the real runs. The
+jitter is seeded by the block position - not by the chunk - so that every
+chunk plan of a benchmark runs on the same cost field.
+Being called with the AMPCOR command line (<in file> old), the mock can
+replace the AMPCOR binary in a bat file; the cost parameters are then read
+from the MOCK_AMPCOR_* environment variables.
+
+usage: mock_ampcor.py [-h] [--rate RATE] [--skew SKEW] [--jitter JITTER]
+    [--scene_lines SCENE_LINES] [--mode {sleep,cpu}]
+    [--fail_rate FAIL_RATE] in_file [flag]
+
+Mock AMPCOR binary.
+
+positional arguments:
+  in_file               AMPCOR input parameter file (.in).
+  flag                  AMPCOR flag (ignored).
+
+options:
+  -h, --help            show this help message and exit
+  --rate RATE           Cost per offset [s] - env: MOCK_AMPCOR_RATE.
+  --skew SKEW           Cost increase at the last scene line - cost x
+                        (1 + skew * y / scene_lines) - env: MOCK_AMPCOR_SKEW.
+  --jitter JITTER       Per-block log-normal cost jitter (sigma)
+                        - env: MOCK_AMPCOR_JITTER.
+  --scene_lines SCENE_LINES
+                        Scene azimuth lines - env: MOCK_AMPCOR_SCENE_LINES.
+  --mode {sleep,cpu}    Sleep or burn CPU - env: MOCK_AMPCOR_MODE.
+  --fail_rate FAIL_RATE
+                        Probability of a chunk failure (exit status 1)
+                        - env: MOCK_AMPCOR_FAIL_RATE.
+
+PYTHON DEPENDENCIES:
+    argparse: Parser for command-line options, arguments and sub-commands
+           https://docs.python.org/3/library/argparse.html
+    numpy: Fundamental package for scientific computing with Python
+           https://numpy.org
+"""
+# - Python Dependencies
+from __future__ import print_function
+import os
+import sys
+import time
+import zlib
+import argparse
+import numpy as np
+# - Package Dependencies
+from utils.ampcor_chunks import read_ampcor_in
+
+# - Size of the blocks of the jitter cost field [lines and samples]
+JITTER_BLOCK = 512
+
+
+def spend(seconds: float, mode: str = 'sleep') -> None:
+    """
+    Spend a given time sleeping or burning CPU
+    :param seconds: time to spend [s]
+    :param mode: sleep or cpu
+    :return: None
+    """
+    if mode == 'sleep':
+        time.sleep(seconds)
+        return
+    t_end = time.process_time() + seconds
+    while time.process_time() < t_end:
+        pass
+
+
+def block_jitter(y_line: int, x_nodes: np.ndarray,
+                 jitter: float) -> np.ndarray:
+    """
+    Jitter of the cost field at the offsets of an azimuth line - one
+    log-normal factor per scene block, seeded by the block position
+    :param y_line: azimuth line
+    :param x_nodes: range samples of the offsets
+    :param jitter: log-normal jitter (sigma)
+    :return: cost factor of each offset
+    """
+    if jitter == 0.:
+        return np.ones(len(x_nodes))
+    i_az = y_line // JITTER_BLOCK
+    i_rg = x_nodes // JITTER_BLOCK
+    c_block = {i_b: np.exp(jitter * np.random.default_rng(
+        zlib.crc32(f'{i_az}:{i_b}'.encode())).standard_normal())
+        for i_b in np.unique(i_rg)}
+    return np.array([c_block[i_b] for i_b in i_rg])
+
+
+def mock_ampcor(in_path: str, rate: float = 1e-4, skew: float = 0.,
+                jitter: float = 0., scene_lines: int = 10000,
+                mode: str = 'sleep', fail_rate: float = 0.) -> int:
+    """
+    Emulate an AMPCOR run on a chunk
+    :param in_path: absolute path to the chunk .in file
+    :param rate: cost per offset [s]
+    :param skew: relative cost increase at the last scene line
+    :param jitter: per-block log-normal cost jitter (sigma)
+    :param scene_lines: scene azimuth lines
+    :param mode: sleep or cpu
+    :param fail_rate: probability of a chunk failure
+    :return: exit status
+    """
+    params = read_ampcor_in(in_path)
+    with open(in_path, 'r', encoding='utf8') as fid:
+        x_off, y_off = (float(v) for v in fid.readlines()[9].split()[:2])
+    # - Failures and offsets are seeded by the chunk extent
+    rng = np.random.default_rng(zlib.crc32(
+        f"{params['y_first']}:{params['x_first']}".encode()))
+    fail_line = rng.integers(params['y_first'], params['y_last'] + 1) \
+        if rng.random() < fail_rate else None
+
+    x_nodes = np.arange(params['x_first'], params['x_last'] + 1,
+                        params['range_spacing'])
+    out_path = os.path.join(os.path.dirname(in_path), params['out_name'])
+    with open(out_path, 'w', encoding='utf8') as fid:
+        for y_line in range(params['y_first'], params['y_last'] + 1,
+                            params['line_spacing']):
+            if fail_line is not None and y_line >= fail_line:
+                print(f'# - Mock AMPCOR failure at line {y_line}',
+                      file=sys.stderr)
+                return 1
+            spend(rate * np.sum(block_jitter(y_line, x_nodes, jitter))
+                  * (1. + skew * y_line / scene_lines), mode)
+            off_x = x_off + 0.05 * rng.standard_normal(len(x_nodes))
+            off_y = y_off + 0.05 * rng.standard_normal(len(x_nodes))
+            snr = rng.uniform(5., 50., len(x_nodes))
+            for x_n, o_x, o_y, s_n in zip(x_nodes, off_x, off_y, snr):
+                print(f'{x_n:8d} {o_x:12.5f} {y_line:8d} {o_y:12.5f} '
+                      f'{s_n:12.5f} {0.01:12.6f} {0.01:12.6f} '
+                      f'{0.:12.6f}', file=fid)
+            fid.flush()
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="""Mock AMPCOR binary.""")
+    parser.add_argument('in_file', type=str,
+                        help='AMPCOR input parameter file (.in).')
+    parser.add_argument('flag', type=str, nargs='?', default='old',
+                        help='AMPCOR flag (ignored).')
+    env = os.environ.get
+    parser.add_argument('--rate', type=float,
+                        default=float(env('MOCK_AMPCOR_RATE', 1e-4)),
+                        help='Cost per offset [s] - env: MOCK_AMPCOR_RATE.')
+    parser.add_argument('--skew', type=float,
+                        default=float(env('MOCK_AMPCOR_SKEW', 0.)),
+                        help='Cost increase at the last scene line - cost x'
+                             ' (1 + skew * y / scene_lines) - env: '
+                             'MOCK_AMPCOR_SKEW.')
+    parser.add_argument('--jitter', type=float,
+                        default=float(env('MOCK_AMPCOR_JITTER', 0.)),
+                        help='Per-block log-normal cost jitter (sigma) - '
+                             'env: MOCK_AMPCOR_JITTER.')
+    parser.add_argument('--scene_lines', type=int,
+                        default=int(env('MOCK_AMPCOR_SCENE_LINES', 10000)),
+                        help='Scene azimuth lines - env: '
+                             'MOCK_AMPCOR_SCENE_LINES.')
+    parser.add_argument('--mode', type=str,
+                        default=env('MOCK_AMPCOR_MODE', 'sleep'),
+                        choices=['sleep', 'cpu'],
+                        help='Sleep or burn CPU - env: MOCK_AMPCOR_MODE.')
+    parser.add_argument('--fail_rate', type=float,
+                        default=float(env('MOCK_AMPCOR_FAIL_RATE', 0.)),
+                        help='Probability of a chunk failure (exit status '
+                             '1) - env: MOCK_AMPCOR_FAIL_RATE.')
+    args = parser.parse_args()
+
+    sys.exit(mock_ampcor(os.path.abspath(args.in_file), rate=args.rate,
+                         skew=args.skew, jitter=args.jitter,
+                         scene_lines=args.scene_lines, mode=args.mode,
+                         fail_rate=args.fail_rate))
+
+
+# - run main program
+if __name__ == '__main__':
+    main()
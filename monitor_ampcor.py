@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+u"""
+monitor_ampcor.py
+
+Monitor the progress of a running AMPCOR job - e.g. from another terminal
+or node. The output file of each chunk listed in the bat file is tailed
+and the per-chunk and overall progress, throughput, ETA and stalled
+chunks are printed and saved to a JSON status file.
+
+usage: monitor_ampcor.py [-h] [--directory DIRECTORY] [--interval INTERVAL]
+    [--stall_time STALL_TIME] [--status STATUS] [--once] ref_slc sec_slc
+
+Monitor the progress of the AMPCOR chunks of a pair.
+
+positional arguments:
+  ref_slc               Reference SLC.
+  sec_slc               Secondary SLC (e.g. registered SLC: <sec>.reg).
+
+options:
+  -h, --help            show this help message and exit
+  --directory DIRECTORY, -D DIRECTORY
+                        Directory containing the AMPCOR bat file.
+  --interval INTERVAL   Update interval [s].
+  --stall_time STALL_TIME
+                        Time without output after which a running chunk is
+                        flagged as stalled [s].
+  --status STATUS       JSON status file
+                        - Def: ampcor_progress_<ref>-<sec>.json.
+  --once                Print the status once and exit.
+
+PYTHON DEPENDENCIES:
+    argparse: Parser for command-line options, arguments and sub-commands
+           https://docs.python.org/3/library/argparse.html
+"""
+# - Python Dependencies
+from __future__ import print_function
+import os
+import time
+import argparse
+# - Package Dependencies
+from utils.ampcor_chunks import ampcor_jobs
+from utils.ampcor_monitor import AmpcorMonitor, STALL_TIME
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""Monitor the progress of the AMPCOR chunks of a
+        pair."""
+    )
+    parser.add_argument('ref_slc', type=str, help='Reference SLC.')
+    parser.add_argument('sec_slc', type=str,
+                        help='Secondary SLC (e.g. registered SLC: '
+                             '<sec>.reg).')
+    parser.add_argument('--directory', '-D', default=os.getcwd(),
+                        help='Directory containing the AMPCOR bat file.')
+    parser.add_argument('--interval', type=float, default=60.,
+                        help='Update interval [s].')
+    parser.add_argument('--stall_time', type=float, default=STALL_TIME,
+                        help='Time without output after which a running '
+                             'chunk is flagged as stalled [s].')
+    parser.add_argument('--status', type=str, default=None,
+                        help='JSON status file - '
+                             'Def: ampcor_progress_<ref>-<sec>.json.')
+    parser.add_argument('--once', action='store_true',
+                        help='Print the status once and exit.')
+    args = parser.parse_args()
+
+    pair_name = f'{args.ref_slc}-{args.sec_slc}'
+    bat_path = os.path.join(os.path.abspath(args.directory),
+                            f'bat_{pair_name}')
+    status_path = args.status if args.status else \
+        os.path.join(os.path.dirname(bat_path),
+                     f'ampcor_progress_{pair_name}.json')
+    in_paths = [job['in_path'] for job in ampcor_jobs(bat_path)]
+    monitor = AmpcorMonitor(in_paths, status_path=status_path,
+                            stall_time=args.stall_time)
+    while True:
+        status = monitor.update()
+        print(monitor.report(status), flush=True)
+        # - Stop when all the chunks have terminated
+        if args.once or set(status['states']) <= {'done', 'failed'}:
+            break
+        time.sleep(args.interval)
+
+
+# - run main program
+if __name__ == '__main__':
+    main()
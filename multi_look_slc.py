@@ -5,6 +5,7 @@ Written by Enrico Ciraci' (03/2022)
 Calculate a multi-looked intensity (MLI) image from the selected ICEye SLCs.
 
 usage: multi_look_slc.py [-h] [--slc SLC] [--directory DIRECTORY]
+    [--mli_cache MLI_CACHE]
 
 Calculate a multi-looked intensity (MLI) image from the selected ICEye SLCs.
 
@@ -15,6 +16,9 @@ options:
                     image from an SLC image.
   --directory DIRECTORY, -D DIRECTORY
                         Project data directory.
+  --mli_cache MLI_CACHE
+                        Multi-looked intensity cache directory - shared
+                        with the interferogram drivers.
 
 
 
@@ -29,6 +33,8 @@ PYTHON DEPENDENCIES:
 
 UPDATE HISTORY:
 11/21/2022: slc - converted from optional argument to positional argument.
+10/2026: MLIs linked from the per-SLC cache (--mli_cache) when available -
+    see utils/mli_cache.py.
 """
 # - Python Dependencies
 from __future__ import print_function
@@ -38,6 +44,7 @@ import datetime
 # - GAMMA's Python integration with the py_gamma module
 import py_gamma as pg
 import py_gamma2019 as pg9
+from utils.mli_cache import multi_look
 
 
 def main():
@@ -52,11 +59,17 @@ def main():
     # - Absolute Path to directory containing input data.
     parser.add_argument('--directory', '-D', type=str, default=os.getcwd(),
                         help='Project data directory.')
+    # - Multi-looked intensity cache
+    parser.add_argument('--mli_cache', type=str, default=None,
+                        help='Multi-looked intensity cache directory - '
+                             'shared with the interferogram drivers.')
 
     args = parser.parse_args()
 
     # - Path to Test directory
     data_dir = args.directory
+    mli_cache = None if args.mli_cache is None \
+        else os.path.abspath(args.mli_cache)
 
     # - Parameters
     rlks = 10          # - number of range looks (INT)
@@ -74,8 +87,8 @@ def main():
         mli_par_name = os.path.join(data_dir,
                                     b_input_name.replace('.slc', '.mli.par'))
         # - Extract SLC and Parameter File
-        pg.multi_look(slc_name, par_name, mli_name,
-                      mli_par_name, rlks, azlks)
+        multi_look(slc_name, par_name, mli_name,
+                   mli_par_name, rlks, azlks, cache_dir=mli_cache)
 
         # - Read Multi-Looked SLCs par file
         par_dict = pg.ParFile(mli_par_name).par_dict
@@ -100,8 +113,8 @@ def main():
             mli_par_name = os.path.join(data_dir,
                                         b_input_name.replace('.slc', '.mli.par'))
             # - Extract SLC and Parameter File
-            pg.multi_look(slc_name, par_name, mli_name,
-                          mli_par_name, rlks, azlks)
+            multi_look(slc_name, par_name, mli_name,
+                       mli_par_name, rlks, azlks, cache_dir=mli_cache)
 
             # - Read Multi-Looked SLCs par file
             par_dict = pg.ParFile(mli_par_name).par_dict
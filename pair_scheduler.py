@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+u"""
+pair_scheduler.py
+
+Process many interferometric pairs concurrently on one node. The pairs
+share a node-level resource pool (cores, memory and disk-bandwidth
+tokens - see utils/resource_pool.py): each pipeline step of each pair
+waits for its resources to be granted, so that the CPU-bound AMPCOR runs,
+the I/O-bound resampling/interferogram steps and the memory-heavy steps
+of different pairs interleave without oversubscribing the node.
+
+The pairs file lists one driver command line per pair - e.g.:
+    interf_proc.py REF SEC gis -D /data/stack -O /data/stack/REF-SEC -N 16
+    interf_gamma.py REF SEC2 gis -D /data/stack -O /data/stack/REF-SEC2
+Empty lines and lines starting with # are ignored. The drivers are run
+with --resource_pool appended. Each pair must have its own output
+directory (-O - def. the current directory): the drivers write products
+with fixed names (gc_icemap, DEM_gc_par) and their pipeline cache to it.
+Pairs sharing an output directory are rejected.
+
+usage: pair_scheduler.py [-h] [--cores CORES] [--ram RAM] [--io IO]
+    [--max_pairs MAX_PAIRS] [--pool POOL] [--gamma_threads GAMMA_THREADS]
+    [--log_dir LOG_DIR] pairs_file
+
+Process interferometric pairs concurrently sharing the node resources.
+
+positional arguments:
+  pairs_file            File listing one driver command line per pair.
+
+options:
+  -h, --help            show this help message and exit
+  --cores CORES         Number of cores of the pool - Def: number of CPUs.
+  --ram RAM             Memory of the pool [GB] - Def: available memory.
+  --io IO               Number of disk-bandwidth tokens - steps streaming
+                        full SLCs or rasters hold one token.
+  --max_pairs MAX_PAIRS
+                        Maximum number of pairs processed at the same time.
+  --pool POOL           Resource pool state file.
+  --gamma_threads GAMMA_THREADS
+                        OpenMP threads of the GAMMA programs
+                        (OMP_NUM_THREADS).
+  --log_dir LOG_DIR     Directory of the per-pair logs.
+
+NOTE: The GAMMA thread count is set for each driver process
+      (OMP_NUM_THREADS) - a step declaring N cores is expected to run
+      N processes or threads. The GAMMA steps of the drivers declare
+      --gamma_threads cores, and the memory of the rasters they process.
+
+PYTHON DEPENDENCIES:
+    argparse: Parser for command-line options, arguments and sub-commands
+           https://docs.python.org/3/library/argparse.html
+"""
+# - Python Dependencies
+from __future__ import print_function
+import os
+import sys
+import time
+import shlex
+import argparse
+import datetime
+import subprocess
+# - Package Dependencies
+from utils.make_dir import make_dir
+from utils.executor import mem_available, cmd_line
+from utils.resource_pool import init_pool, ResourcePool
+
+
+def read_pairs(pairs_file: str) -> list:
+    """
+    Read the driver command lines of the pairs
+    :param pairs_file: absolute path to the pairs file
+    :return: list of command lines - split into arguments
+    """
+    pairs = []
+    with open(pairs_file, 'r', encoding='utf8') as fid:
+        for line in fid:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                pairs.append(shlex.split(line))
+    return pairs
+
+
+def out_directory(cmd: list) -> str:
+    """
+    Output directory of a driver command line
+    :param cmd: driver command line - split into arguments
+    :return: absolute path to the output directory (-O/--out_directory)
+    """
+    out_dir = os.getcwd()
+    for i_a, arg in enumerate(cmd):
+        if arg in ('-O', '--out_directory') and i_a + 1 < len(cmd):
+            out_dir = cmd[i_a + 1]
+        elif arg.startswith('--out_directory='):
+            out_dir = arg.split('=', 1)[1]
+        elif arg.startswith('-O') and not arg.startswith('--'):
+            out_dir = arg[2:]
+    return os.path.abspath(out_dir)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""Process interferometric pairs concurrently sharing
+        the node resources."""
+    )
+    parser.add_argument('pairs_file', type=str,
+                        help='File listing one driver command line per '
+                             'pair.')
+    parser.add_argument('--cores', type=int, default=os.cpu_count(),
+                        help='Number of cores of the pool - Def: number of '
+                             'CPUs.')
+    parser.add_argument('--ram', type=float, default=None,
+                        help='Memory of the pool [GB] - Def: available '
+                             'memory.')
+    parser.add_argument('--io', type=int, default=2,
+                        help='Number of disk-bandwidth tokens - steps '
+                             'streaming full SLCs or rasters hold one '
+                             'token.')
+    parser.add_argument('--max_pairs', type=int, default=None,
+                        help='Maximum number of pairs processed at the '
+                             'same time.')
+    parser.add_argument('--pool', type=str, default='.pair_pool.json',
+                        help='Resource pool state file.')
+    parser.add_argument('--gamma_threads', type=int, default=1,
+                        help='OpenMP threads of the GAMMA programs '
+                             '(OMP_NUM_THREADS).')
+    parser.add_argument('--log_dir', type=str, default='pair_logs',
+                        help='Directory of the per-pair logs.')
+    args = parser.parse_args()
+
+    pairs = read_pairs(args.pairs_file)
+    # - Pairs sharing an output directory overwrite each other's products
+    out_dirs = [out_directory(cmd) for cmd in pairs]
+    shared = sorted({o_dir for o_dir in out_dirs if out_dirs.count(o_dir) > 1})
+    if shared:
+        parser.error(f'pairs sharing an output directory: {shared}')
+    max_pairs = len(pairs) if args.max_pairs is None else args.max_pairs
+    ram = mem_available() / 1024 ** 2 if args.ram is None else args.ram
+    pool_path = os.path.abspath(args.pool)
+    init_pool(pool_path, cores=args.cores, ram=ram, io=args.io)
+    log_dir = make_dir(os.path.abspath('.'), args.log_dir)
+    print(f'# - Resource pool: {args.cores} cores, {ram:.1f} GB, '
+          f'{args.io} I/O tokens - {len(pairs)} pairs.')
+
+    # - Drivers are resolved relative to the package directory
+    pkg_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, OMP_NUM_THREADS=str(args.gamma_threads))
+    pending = list(enumerate(pairs))
+    running = {}
+    returncodes = {}
+    while pending or running:
+        # - Launch the pending pairs
+        while pending and len(running) < max_pairs:
+            i_p, cmd = pending.pop(0)
+            script = cmd[0] if os.path.isfile(cmd[0]) \
+                else os.path.join(pkg_dir, cmd[0])
+            log_path = os.path.join(log_dir, f'pair_{i_p:03d}.log')
+            with open(log_path, 'w', encoding='utf8') as log:
+                proc = subprocess.Popen(
+                    [sys.executable, script] + cmd[1:]
+                    + ['--resource_pool', pool_path],
+                    stdout=log, stderr=subprocess.STDOUT, env=env)
+            running[i_p] = proc
+            print(f'# - Pair {i_p}: started - {cmd_line(cmd)}')
+        time.sleep(1.)
+        for i_p, proc in list(running.items()):
+            if proc.poll() is not None:
+                returncodes[i_p] = running.pop(i_p).returncode
+                print(f'# - Pair {i_p}: completed - '
+                      f'exit code {returncodes[i_p]}')
+
+    n_failed = sum(code != 0 for code in returncodes.values())
+    print(f'# - Pairs processed: {len(returncodes)} - failed: {n_failed}')
+    print(f'# - Pool status: {ResourcePool(pool_path).status()}')
+
+
+# - run main program
+if __name__ == '__main__':
+    start_time = datetime.datetime.now()
+    main()
+    end_time = datetime.datetime.now()
+    print(f"# - Computation Time: {end_time - start_time}")
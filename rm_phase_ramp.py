@@ -6,7 +6,8 @@ TEST:
 Estimate and Remove the contribution of a "Linear Ramp" to the Wrapped Phase
 of a Differential InSAR Interferogram.
 
-usage: rm_phase_ramp.py [-h] [--par PAR] in_interf
+usage: rm_phase_ramp.py [-h] [--par PAR] [--figures FIGURE [FIGURE ...]]
+    [--dpi DPI] in_interf
 
 positional arguments:
   in_interf          Input Interferogram - Absolute Path
@@ -14,6 +15,12 @@ positional arguments:
 optional arguments:
   -h, --help         show this help message and exit
   --par PAR, -P PAR  Interferogram Parameter File
+  --figures FIGURE [FIGURE ...]
+                     Figures saved inside the DERAMP directory - all: every
+                     figure. Def: input_interferometric_phase and
+                     cropped_input_interferometric_phase (used to select
+                     the ramp estimation region and first guess).
+  --dpi DPI          Figures resolution [dpi].
 
 NOTE: In this implementation of the algorithm, a first guess or preliminary
     estimate of the parameters defining the ramp must be provided by the user.
@@ -39,6 +46,7 @@ PYTHON DEPENDENCIES:
 
 UPDATE HISTORY:
 07/2022: estimate_phase_ramp() - Updated - Accepts ramp parameters as floats.
+10/2026: Figures saved only on request (--figures) - save_figure() added.
 """
 # - Python dependencies
 from __future__ import print_function
@@ -130,6 +138,36 @@ def estimate_phase_ramp(dd_phase_complex: np.ndarray, cycle_r: float,
            'xx_m': xx_m, 'yy_m': yy_m}
 
 
+# - Figures saved inside the DERAMP directory
+FIGURES = ('coherence_map', 'binary_mask', 'input_interferometric_phase',
+           'cropped_input_interferometric_phase', 'phase_ramp',
+           'deramped_interferogram')
+
+
+def save_figure(data: np.ndarray, title: str, cmap, out_path: str,
+                dpi: int = 200, fig_format: str = 'jpeg',
+                tight: bool = False) -> None:
+    """
+    Save a raster as a figure with colorbar
+    :param data: raster
+    :param title: figure title
+    :param cmap: color map
+    :param out_path: absolute path to the output figure
+    :param dpi: figure resolution [dpi]
+    :param fig_format: figure format
+    :param tight: use tight layout
+    :return: None
+    """
+    plt.figure()
+    plt.title(title)
+    plt.imshow(data, cmap=cmap)
+    plt.colorbar()
+    if tight:
+        plt.tight_layout()
+    plt.savefig(out_path, dpi=dpi, format=fig_format)
+    plt.close()
+
+
 def main() -> None:
     # - Read the system arguments listed after the program
     parser = argparse.ArgumentParser(
@@ -151,9 +189,22 @@ def main() -> None:
     # - Interferogram Coherence Maps
     parser.add_argument('--pwr', '--W', type=str, default=None,
                         help='Reference SLCs intensity image.', required=True)
+    # - Output figures
+    parser.add_argument('--figures', nargs='+', metavar='FIGURE',
+                        choices=FIGURES + ('all',),
+                        default=['input_interferometric_phase',
+                                 'cropped_input_interferometric_phase'],
+                        help='Figures saved inside the DERAMP directory - '
+                             'all: every figure.')
+    parser.add_argument('--dpi', type=int, default=200,
+                        help='Figures resolution [dpi].')
     args = parser.parse_args()
     # - Output figures parameters
     fig_format = 'jpeg'
+    figures = FIGURES if 'all' in args.figures else args.figures
+
+    def fig_path(name: str) -> str:
+        return os.path.join(out_dir, name + '.' + fig_format)
     # - Absolute Path to input interferogram
     interf_input_path = Path(args.in_interf)
     # - Extract Data Directory from input file path
@@ -176,26 +227,19 @@ def main() -> None:
     coh_in = pg.read_image(coh_mask, width=interf_width, dtype='float')
 
     # - Show Coherence Mask
-    plt.figure()
-    plt.title('Interferogram Coherence')
-    plt.imshow(coh_in, cmap=plt.get_cmap('viridis'))
-    plt.colorbar()
-    plt.tight_layout()
-    plt.savefig(os.path.join(out_dir, 'coherence_map.'+fig_format),
-                dpi=200, format=fig_format)
-    plt.close()
+    if 'coherence_map' in figures:
+        save_figure(coh_in, 'Interferogram Coherence',
+                    plt.get_cmap('viridis'), fig_path('coherence_map'),
+                    dpi=args.dpi, fig_format=fig_format, tight=True)
 
     # - Compute Binary Mask using grid point with Coherence > 0
     coh_mask = np.zeros(coh_in.shape)
     coh_mask[coh_in > 0.] = 1
     # - Show Binary Mask
-    plt.figure()
-    plt.title('Binary Mask')
-    plt.imshow(coh_mask, cmap=plt.get_cmap('gray'))
-    plt.colorbar()
-    plt.savefig(os.path.join(out_dir, 'binary_mask.'+fig_format),
-                dpi=200, format=fig_format)
-    plt.close()
+    if 'binary_mask' in figures:
+        save_figure(coh_mask, 'Binary Mask', plt.get_cmap('gray'),
+                    fig_path('binary_mask'), dpi=args.dpi,
+                    fig_format=fig_format)
 
     # - Read Complex Interferogram saved as Gamma Software binary image
     # - Note: Set type = fcomplex
@@ -207,15 +251,13 @@ def main() -> None:
 
     # - Compute wrapped interferometric phase
     data_in_r_phase = np.angle(interf_in)
-    plt.figure()
-    plt.title('Input Interferometric Phase')
-    plt.imshow(data_in_r_phase, cmap=plt.cm.get_cmap('jet'))
-    plt.colorbar()
-    plt.savefig(os.path.join(out_dir, 'input_interferometric_phase.'+fig_format),
-                dpi=200, format=fig_format)
-    plt.close()
-    print('# - input_interferometric_phase.'+fig_format
-          + ' - available inside DERAMP directory.')
+    if 'input_interferometric_phase' in figures:
+        save_figure(data_in_r_phase, 'Input Interferometric Phase',
+                    plt.cm.get_cmap('jet'),
+                    fig_path('input_interferometric_phase'), dpi=args.dpi,
+                    fig_format=fig_format)
+        print('# - input_interferometric_phase.'+fig_format
+              + ' - available inside DERAMP directory.')
 
     # - Crop the interferogram over the area where the ramp is more easily
     # - detectable.
@@ -229,16 +271,13 @@ def main() -> None:
     # - Cropped Interferometric Phase Map: region used to estimate the
     # - phase ramp.
     data_in_r_phase_c = data_in_r_phase[row_min: row_max, col_min: col_max]
-    plt.figure()
-    plt.title('Cropped Interferometric Phase Map')
-    plt.imshow(data_in_r_phase_c, cmap=plt.cm.get_cmap('jet'))
-    plt.colorbar()
-    plt.savefig(os.path.join(out_dir,
-                             'cropped_input_interferometric_phase.'+fig_format),
-                dpi=200, format=fig_format)
-    plt.close()
-    print('# - cropped_input_interferometric_phase.'+fig_format
-          + ' - available inside DERAMP directory.')
+    if 'cropped_input_interferometric_phase' in figures:
+        save_figure(data_in_r_phase_c, 'Cropped Interferometric Phase Map',
+                    plt.cm.get_cmap('jet'),
+                    fig_path('cropped_input_interferometric_phase'),
+                    dpi=args.dpi, fig_format=fig_format)
+        print('# - cropped_input_interferometric_phase.'+fig_format
+              + ' - available inside DERAMP directory.')
 
     # - Search Parameters
     print('\n\n# - Phase Ramp Removal Parameters. Provide first guess: ')
@@ -274,14 +313,10 @@ def main() -> None:
     print(f'# - Columns : {freq_c*n_columns}')
 
     # - Estimated Phase Ramp
-    plt.figure()
-    plt.title('Estimated Phase Ramp')
-    plt.imshow(phase_ramp, cmap=plt.cm.get_cmap('jet'))
-    plt.colorbar()
-    plt.savefig(os.path.join(out_dir,
-                             'phase_ramp.'+fig_format),
-                dpi=200, format=fig_format)
-    plt.close()
+    if 'phase_ramp' in figures:
+        save_figure(phase_ramp, 'Estimated Phase Ramp',
+                    plt.cm.get_cmap('jet'), fig_path('phase_ramp'),
+                    dpi=args.dpi, fig_format=fig_format)
 
     # - Compute synthetic ramp
     xx_m, yy_m = np.meshgrid(np.arange(n_columns), np.arange(n_rows))
@@ -299,15 +334,11 @@ def main() -> None:
     # - Apply binary mask to the corrected interferogram
     dd_phase_complex_corrected[coh_mask == 0] = 0
 
-    plt.figure()
-    plt.title('Deramped Interferogram')
-    plt.imshow(np.angle(dd_phase_complex_corrected),
-               cmap=plt.cm.get_cmap('jet'))
-    plt.colorbar()
-    plt.savefig(os.path.join(out_dir,
-                             'deramped_interferogram.'+fig_format),
-                dpi=200, format=fig_format)
-    plt.close()
+    if 'deramped_interferogram' in figures:
+        save_figure(np.angle(dd_phase_complex_corrected),
+                    'Deramped Interferogram', plt.cm.get_cmap('jet'),
+                    fig_path('deramped_interferogram'), dpi=args.dpi,
+                    fig_format=fig_format)
 
     # - Save Deramped Interferogram as a Gamma Software binary image
     pg.write_image(dd_phase_complex_corrected, interf_output_path,
@@ -5,7 +5,8 @@ Enrico Ciraci' - 03/2022
 Remove Topographic Contribution from Flattened Interferogram.
 
 usage: rm_topo_phase.py [-h] [--directory DIRECTORY]
-                        [--filter] reference secondary dem
+                        [--filter] [--geo_cache GEO_CACHE]
+                        reference secondary dem
 
 Geocode Flattened Interferogram and Remove Topographic Contribution
 to Interferometric Phase.
@@ -25,6 +26,9 @@ options:
                         Data directory.
   --filter, -F          Adaptive interferogram filter using the power spectral
                         density - (GAMMA - adf)
+  --geo_cache GEO_CACHE
+                        Geocoding products cache directory - shared by the
+                        pairs with the same reference geometry.
 
 PYTHON DEPENDENCIES:
     argparse: Parser for command-line options, arguments and sub-commands
@@ -32,6 +36,11 @@ PYTHON DEPENDENCIES:
     py_gamma: GAMMA's Python integration with the py_gamma module
 
 UPDATE HISTORY:
+    10/2026: The working directory is no longer changed. The geocoding
+        products with fixed names are written to the pair workspace
+        <directory>/work_<reference>-<secondary>; gc_icemap and DEM_gc_par
+        are published to the data directory.
+    10/2026: Geocoding products cache (--geo_cache) - see utils/geo_cache.py.
 
 """
 # - Python dependencies
@@ -45,6 +54,8 @@ import py_gamma as pg
 import py_gamma2019 as pg9
 from utils.path_to_dem import path_to_dem
 from utils.read_keyword import read_keyword
+from utils.workspace import pair_workspace, publish
+from utils.geo_cache import geometry_key, cached_geo_call
 
 
 def main() -> None:
@@ -73,6 +84,11 @@ def main() -> None:
     # - DEM oversampling factor
     parser.add_argument('--dems_os', '-O', type=int, default=1,
                         help='DEM oversampling factor')
+    # - Geocoding products cache
+    parser.add_argument('--geo_cache', type=str, default=None,
+                        help='Geocoding products cache directory - shared '
+                             'by the pairs with the same reference '
+                             'geometry.')
     args = parser.parse_args()
 
     # - Reference and Secondary SLCs
@@ -80,12 +96,18 @@ def main() -> None:
     sec_slc = args.secondary
 
     # - Directory containing the SLCs
-    data_dir = args.directory
-    os.chdir(data_dir)
+    data_dir = os.path.abspath(args.directory)
+    # - Pair workspace - geocoding products with fixed names
+    work_dir = pair_workspace(data_dir, f'{ref_slc}-{sec_slc}')
+
+    def d_path(name: str) -> str:
+        return os.path.join(data_dir, name)
+
+    def w_path(name: str) -> str:
+        return os.path.join(work_dir, name)
 
     # - Extract Interferogram Size from parameter file
-    igram_par_path = os.path.join('.',
-                                  f'{ref_slc}-{sec_slc}.offmap.par.interp')
+    igram_par_path = d_path(f'{ref_slc}-{sec_slc}.offmap.par.interp')
 
     print('# - Calculate terrain-geocoding lookup table and DEM derived '
           'data products.')
@@ -134,17 +156,32 @@ def main() -> None:
     dem_info = path_to_dem(args.dem, oversample=args.dems_os)
     dem_par = os.path.join(dem_info['path'], dem_info['par'])
     dem = os.path.join(dem_info['path'], dem_info['dem'])
-    pg.gc_map(ref_slc+'.par',   # - SLC image parameter file
-              igram_par_path,   # - ISP offset/interferogram parameter file
-              dem_par,          # - DEM/MAP parameter file
-              dem,               # - DEM data file (or constant height value)
-              dem_info['par'],     # - DEM segment used...
-              'DEMice_gc',      # - DEM segment used for output products...
-              'gc_icemap',      # - geocoding lookup table (fcomplex)
-              dem_info['oversample'], dem_info['oversample'],
-              'sar_map_in_dem_geometry',
-              '-', '-', 'inc.geo', '-', '-', '-', '-', '2', '-'
-              )
+    # - Geocoding products cache - DEM-derived products shared by the pairs
+    # - with the same reference geometry
+    geo_cache = None if args.geo_cache is None \
+        else os.path.abspath(args.geo_cache)
+    geo_key = geometry_key(d_path(ref_slc+'.par'), igram_par_path, dem_par,
+                           dem, dem_info['oversample'], ls_mode=2)
+    cached_geo_call(
+        geo_cache, geo_key, 'gc_map',
+        [w_path(dem_info['par']), w_path('DEMice_gc'), w_path('gc_icemap'),
+         w_path('sar_map_in_dem_geometry'), w_path('inc.geo')],
+        lambda: pg.gc_map(
+            d_path(ref_slc+'.par'),   # - SLC image parameter file
+            igram_par_path,   # - ISP offset/interferogram parameter file
+            dem_par,          # - DEM/MAP parameter file
+            dem,               # - DEM data file (or constant height value)
+            w_path(dem_info['par']),     # - DEM segment used...
+            w_path('DEMice_gc'),  # - DEM segment used for output products
+            w_path('gc_icemap'),  # - geocoding lookup table (fcomplex)
+            dem_info['oversample'], dem_info['oversample'],
+            w_path('sar_map_in_dem_geometry'),
+            '-', '-', w_path('inc.geo'), '-', '-', '-', '-', '2', '-'
+        ))
+    # - Publish the lookup table and the DEM segment parameter file to the
+    # - data directory - read by the double difference scripts
+    publish(w_path('gc_icemap'), d_path('gc_icemap'))
+    publish(w_path(dem_info['par']), d_path(dem_info['par']))
 
     igram_param_dict = pg.ParFile(igram_par_path).par_dict
 
@@ -154,7 +191,7 @@ def main() -> None:
     print(f'# - Interferogram Size: {interf_lines} x {interf_width}')
 
     # - Extract DEM Size from parameter file
-    dem_par_path = os.path.join('.', 'DEM_gc_par')
+    dem_par_path = w_path('DEM_gc_par')
     try:
         dem_param_dict = pg.ParFile(dem_par_path).par_dict
         dem_width = int(dem_param_dict['width'][0])
@@ -165,86 +202,95 @@ def main() -> None:
 
     print(f'# - DEM Size: {dem_nlines} x {dem_width}')
 
-    # - Forward geocoding transformation using a lookup table
-    pg.geocode('gc_icemap', 'DEMice_gc', dem_width, 'hgt_icemap',
-               interf_width, interf_lines)
-    pg.geocode('gc_icemap', 'inc.geo', dem_width, 'inc',
-               interf_width, interf_lines)
+    # - Forward geocoding transformation using a lookup table - DEM
+    # - heights and incidence angle cached as in utils/interf_steps.py
+    cached_geo_call(geo_cache, geo_key, 'geocode', [w_path('hgt_icemap')],
+                    lambda: pg.geocode(w_path('gc_icemap'),
+                                       w_path('DEMice_gc'), dem_width,
+                                       w_path('hgt_icemap'), interf_width,
+                                       interf_lines))
+    cached_geo_call(geo_cache, geo_key, 'incidence', [w_path('inc')],
+                    lambda: pg.geocode(w_path('gc_icemap'), w_path('inc.geo'),
+                                       dem_width, w_path('inc'),
+                                       interf_width, interf_lines))
 
     # - Create DIFF/GEO parameter file for geocoding and differential
     # - interferometry.
-    pg.create_diff_par(igram_par_path, igram_par_path, 'DIFF_par', '-', 0)
+    pg.create_diff_par(igram_par_path, igram_par_path, w_path('DIFF_par'),
+                       '-', 0)
 
     # - Invert geocoding lookup table
-    pg.gc_map_inversion('gc_icemap', dem_width, 'gc_map_invert',
-                        interf_width, interf_lines)
+    cached_geo_call(geo_cache, geo_key, 'gc_map_inversion',
+                    [w_path('gc_map_invert')],
+                    lambda: pg.gc_map_inversion(
+                        w_path('gc_icemap'), dem_width,
+                        w_path('gc_map_invert'), interf_width, interf_lines
+                    ))
 
     # - Geocoding of Reference SLC power using a geocoding lookup table
-    pg.geocode_back(ref_slc + '.pwr1', interf_width, 'gc_icemap',
-                    ref_slc + '.pwr1.geo', dem_width, dem_nlines)
-    pg9.raspwr(ref_slc + '.pwr1.geo', dem_width)
+    pg.geocode_back(d_path(ref_slc + '.pwr1'), interf_width,
+                    w_path('gc_icemap'), d_path(ref_slc + '.pwr1.geo'),
+                    dem_width, dem_nlines)
+    pg9.raspwr(d_path(ref_slc + '.pwr1.geo'), dem_width)
 
     # - Remove Interferometric Phase component due to surface Topography.
     # - Simulate unwrapped interferometric phase using DEM height.
-    pg.phase_sim(ref_slc + '.par', igram_par_path,
-                 f'base{ref_slc}-{sec_slc}.dat', 'hgt_icemap',
-                 'sim_phase', 1, 0, '-')
+    pg.phase_sim(d_path(ref_slc + '.par'), igram_par_path,
+                 d_path(f'base{ref_slc}-{sec_slc}.dat'),
+                 w_path('hgt_icemap'), w_path('sim_phase'), 1, 0, '-')
     # - Create DIFF/GEO parameter file for geocoding and
     # - differential interferometry
-    pg.create_diff_par(igram_par_path, igram_par_path, 'DIFF_par', '-', 0)
+    pg.create_diff_par(igram_par_path, igram_par_path, w_path('DIFF_par'),
+                       '-', 0)
 
     # - Subtract topographic phase from interferogram
-    pg.sub_phase(f'coco{ref_slc}-{sec_slc}.flat', 'sim_phase', 'DIFF_par',
-                 f'coco{ref_slc}-{sec_slc}.flat.topo_off', 1)
+    topo_off = d_path(f'coco{ref_slc}-{sec_slc}.flat.topo_off')
+    pg.sub_phase(d_path(f'coco{ref_slc}-{sec_slc}.flat'),
+                 w_path('sim_phase'), w_path('DIFF_par'), topo_off, 1)
     # - Show interferogram w/o topographic phase
-    pg9.rasmph_pwr(f'coco{ref_slc}-{sec_slc}.flat.topo_off',
-                   f'{ref_slc}.pwr1', interf_width)
+    pg9.rasmph_pwr(topo_off, d_path(f'{ref_slc}.pwr1'), interf_width)
 
     # - Geocode Output interferogram
     # - Reference Interferogram look-up table
-    ref_gcmap = os.path.join('.', 'gc_icemap')
-    dem_par_path = os.path.join('.', 'DEM_gc_par')
+    ref_gcmap = w_path('gc_icemap')
+    dem_par_path = w_path('DEM_gc_par')
     # -  Width of Geocoding par (reference)
     dem_width = int(read_keyword(dem_par_path, 'width'))
     # -  nlines of Geocoding par (secondary)
     dem_nlines = int(read_keyword(dem_par_path, 'nlines'))
     # - geocode interferogram
-    pg.geocode_back(f'coco{ref_slc}-{sec_slc}.flat.topo_off',
+    pg.geocode_back(topo_off,
                     interf_width,
                     ref_gcmap,
-                    f'coco{ref_slc}-{sec_slc}.flat.topo_off.geo',
+                    f'{topo_off}.geo',
                     dem_width, dem_nlines,
                     '-', 1
                     )
 
     # - Show Geocoded interferogram
-    pg9.rasmph_pwr(f'coco{ref_slc}-{sec_slc}.flat.topo_off.geo',
-                   f'{ref_slc}.pwr1.geo', dem_width)
+    pg9.rasmph_pwr(f'{topo_off}.geo', d_path(f'{ref_slc}.pwr1.geo'),
+                   dem_width)
 
     if args.filter:
         # - Smooth the obtained interferogram with pg.adf
         # - Adaptive interferogram filter using the power spectral density.
-        pg.adf(f'coco{ref_slc}-{sec_slc}.flat.topo_off',
-               f'coco{ref_slc}-{sec_slc}.flat.topo_off.filt',
-               f'coco{ref_slc}-{sec_slc}.flat.topo_off.filt.coh',
+        pg.adf(topo_off, f'{topo_off}.filt', f'{topo_off}.filt.coh',
                dem_width)
         # - Show filtered interferogram
-        pg9.rasmph_pwr(f'coco{ref_slc}-{sec_slc}.flat.topo_off.filt',
-                       f'{ref_slc}.pwr1.geo', dem_width)
+        pg9.rasmph_pwr(f'{topo_off}.filt', d_path(f'{ref_slc}.pwr1.geo'),
+                       dem_width)
 
         # - Smooth Geocoded Interferogram
-        pg.adf(f'coco{ref_slc}-{sec_slc}.flat.topo_off.geo',
-               f'coco{ref_slc}-{sec_slc}.flat.topo_off.geo.filt',
-               f'coco{ref_slc}-{sec_slc}.flat.topo_off.geo.filt.coh',
-               dem_width)
+        pg.adf(f'{topo_off}.geo', f'{topo_off}.geo.filt',
+               f'{topo_off}.geo.filt.coh', dem_width)
         # - Show filtered interferogram
-        pg9.rasmph_pwr(f'coco{ref_slc}-{sec_slc}.flat.topo_off.geo.filt',
-                       f'{ref_slc}.pwr1.geo', dem_width)
+        pg9.rasmph_pwr(f'{topo_off}.geo.filt',
+                       d_path(f'{ref_slc}.pwr1.geo'), dem_width)
 
     # - Change Permission Access to all the files contained inside the
     # - output directory.
-    for out_file in os.listdir('.'):
-        os.chmod(out_file, 0o0755)
+    for out_file in os.listdir(data_dir):
+        os.chmod(d_path(out_file), 0o0755)
 
 
 # - run main program
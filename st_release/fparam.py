@@ -866,14 +866,10 @@ class off_param:  # {{{
         f.write(
             'offset_estimation_threshhold:         ' + str(self.ofw_thr) + '\n')
         f.write('range_offset_polynomial:     ' + \
-                '{:14.5e}'.format(self.xoff[0]) + \
-                '{:14.5e}'.format(self.xoff[1]) + \
-                '{:14.5e}'.format(self.xoff[2]) + \
+                ''.join(['{:14.5e}'.format(c) for c in self.xoff]) + \
                 '\n')
         f.write('azimuth_offset_polynomial:   ' + \
-                '{:14.5e}'.format(self.yoff[0]) + \
-                '{:14.5e}'.format(self.yoff[1]) + \
-                '{:14.5e}'.format(self.yoff[2]) + \
+                ''.join(['{:14.5e}'.format(c) for c in self.yoff]) + \
                 '\n')
         f.write('slc1_starting_azimuth_line:               ' + str(
             self.slc1) + '\n')
@@ -17,15 +17,34 @@ import numpy as np
 import os
 # - ST_Release dependencies
 from st_release.fparam import off_param, isp_param
+from utils.offset_fit import offset_fit, offset_sub, robust_offset_fit
+from utils.ampcor_chunks import is_offset_line
+from utils.job_queue import wait_queue
 # - GAMMA Python Binding
-import py_gamma as pg
 import py_gamma2019 as pg9
 
 
+def list_offmap_chunks(data_dir: str, pair_name: str) -> list:
+    """
+    List the AMPCOR output offsets files (.offmap_N) of a pair
+    :param data_dir: path to the data directory
+    :param pair_name: pair name - reference-secondary
+    :return: list of absolute paths sorted by chunk number
+    """
+    chunk_list = []
+    for f_name in os.listdir(data_dir):
+        prefix, _, chunk_id = f_name.partition(pair_name + '.offmap_')
+        if not prefix and chunk_id.isdigit():
+            chunk_list.append((int(chunk_id), os.path.join(data_dir, f_name)))
+    return [f_path for _, f_path in sorted(chunk_list)]
+
+
 def r_off_sar(data_dir: str, id1: str, id2: str,
               poly_order: int = 3,
+              fit_method: str = 'wls',
               nrlks: int = None,
               nazlks: int = None,
+              queue_dir: str = None,
               ) -> None:
     """
     Read dense offsets maps generated by AMPCOR
@@ -33,10 +52,20 @@ def r_off_sar(data_dir: str, id1: str, id2: str,
     :param id1: reference SLC
     :param id2: secondary SLC
     :param poly_order: offsets fit polynomial order [def. 3]
+    :param fit_method: offsets fit method [wls, huber, tukey, ransac]
     :param nrlks: number of looks in range [def. None]
     :param nazlks: number of looks in azimuth [def. None]
+    :param queue_dir: shared job queue running the AMPCOR chunks - wait
+                      for the queue to complete [def. None]
     :return: None
     """
+    # - Wait for the AMPCOR chunks run by the queue workers
+    if queue_dir is not None:
+        print(f'# - Waiting for the AMPCOR chunks queue: {queue_dir}')
+        q_status = wait_queue(queue_dir)
+        if q_status['failed']:
+            raise RuntimeError(f"# - {q_status['failed']} AMPCOR chunks "
+                               f"failed - see: {queue_dir}/failed")
 
     # - Load the firs available offset parameter file and
     # - extract AMPCOR calculation parameters.
@@ -62,12 +91,15 @@ def r_off_sar(data_dir: str, id1: str, id2: str,
         os.remove(off_map_path)
 
     # - Concatenate all available offset files content into a single file
-    os.system("ls " + os.path.join(data_dir, id1 + "-" + id2 + ".offmap_?")
-              + "  | xargs cat | grep -v '*' |"
-                f" awk 'length($0)>80' >> {off_map_path}")
-    os.system("ls " + os.path.join(data_dir, id1 + "-" + id2 + ".offmap_??")
-              + "  | xargs cat | grep -v '*' "
-                f"| awk 'length($0)>80' >> {off_map_path}")
+    # - Skip lines containing '*' and lines shorter than 81 characters.
+    chunk_list = list_offmap_chunks(data_dir, id1 + '-' + id2)
+    print(f'# - Number of AMPCOR chunks found: {len(chunk_list)}')
+    with open(off_map_path, 'w') as w_fid:
+        for chunk_path in chunk_list:
+            with open(chunk_path, 'r') as r_fid:
+                for line in r_fid:
+                    if is_offset_line(line):
+                        w_fid.write(line)
 
     # - Verify that the concatenated file has the right format.
     if os.stat(off_map_path).st_size < 830:
@@ -144,6 +176,24 @@ def r_off_sar(data_dir: str, id1: str, id2: str,
     poff.rgsp_i = x_posting * p1.rgsp
     poff.azsp_i = y_posting * p1.azsp
 
+    # - Range and azimuth offset polynomial estimation
+    # - SNR values are used as fit weights.
+    # - Robust methods down-weight fast-moving areas (outliers).
+    if fit_method == 'wls':
+        fit = offset_fit(off_map, snr_map, poff.x_start, poff.rgsp,
+                         poff.y_start, poff.azsp, npoly=poly_order,
+                         thresh=poff.ofw_thr)
+    else:
+        fit = robust_offset_fit(off_map, snr_map, poff.x_start, poff.rgsp,
+                                poff.y_start, poff.azsp, npoly=poly_order,
+                                thresh=poff.ofw_thr, method=fit_method)
+        print(f'# - Inliers ({fit_method}): '
+              f'{np.count_nonzero(fit["inliers"])}')
+    poff.xoff = fit['xoff']
+    poff.yoff = fit['yoff']
+    print(f'# - Final model fit std. dev. (samples) range: '
+          f'{fit["x_std"]:.4f}  azimuth: {fit["y_std"]:.4f}')
+
     # - Update Offsets Parameter File Content
     poff.write(os.path.join(data_dir, id1 + '-' + id2 + '.offmap.par'))
 
@@ -158,17 +208,11 @@ def r_off_sar(data_dir: str, id1: str, id2: str,
               'w') as s_out:
         snr_map.byteswap().tofile(s_out)
 
-    # - Run Gamma offset_fit: Range and azimuth offset polynomial estimation
-    pg.offset_fit(os.path.join(data_dir, id1 + '-' + id2 + '.offmap.off'),
-                  os.path.join(data_dir, id1 + '-' + id2 + '.offmap.snr'),
-                  os.path.join(data_dir, id1 + '-' + id2 + '.offmap.par'),
-                  '-', '-', '-', poly_order, 0)
-
-    # - Run Gamma offset_sub: Subtraction of polynomial
-    # - from range and azimuth offset estimates
-    pg.offset_sub(os.path.join(data_dir, id1 + '-' + id2 + '.offmap.off'),
-                  os.path.join(data_dir, id1 + '-' + id2 + '.offmap.par'),
-                  os.path.join(data_dir, id1 + '-' + id2 + '.offmap.off.new'))
+    # - Subtraction of polynomial from range and azimuth offset estimates
+    off_res = offset_sub(off_map, poff.xoff, poff.yoff, poff.x_start,
+                         poff.rgsp, poff.y_start, poff.azsp)
+    off_res.byteswap().tofile(os.path.join(data_dir, id1 + '-' + id2
+                                           + '.offmap.off.new'))
 
     # - Run GAMMA rasmph: Generate 8-bit raster graphics image of the phase
     # - and intensity of complex data
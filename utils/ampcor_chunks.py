@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+"""
+AMPCOR chunk planning: split the offsets grid into independent range x
+azimuth chunks (tiles) and
+write the AMPCOR input parameter files (.in) and the bat file used to run
+them. The module depends only on NumPy so that chunks can be planned and
+inspected without GAMMA.
+"""
+# - Python Dependencies
+import os
+import numpy as np
+from utils.ampcor_history import balance_lines
+from utils.executor import bat_commands
+
+
+def split_lines(n_lines: int, n_chunks: int) -> list:
+    """
+    Split a number of offset lines into contiguous chunks. The remainder
+    is distributed over the first chunks, so no offset line is lost.
+    :param n_lines: total number of offset lines
+    :param n_chunks: number of chunks
+    :return: list of (first offset line, number of offset lines)
+    """
+    n_chunks = max(min(n_chunks, n_lines), 1)
+    n_base, n_rem = divmod(n_lines, n_chunks)
+    counts = [n_base + 1 if i < n_rem else n_base for i in range(n_chunks)]
+    firsts = np.cumsum([0] + counts[:-1])
+    return [(int(f), c) for f, c in zip(firsts, counts)]
+
+
+def plan_chunks(y_start: int, n_rec: int, line_spacing: int,
+                n_chunks: int, y_off: int = 0, y_slope: float = 0.,
+                x_start: int = 1, x_end: int = None,
+                x_off: int = 0, range_spacing: int = 30,
+                n_rn_tiles: int = 1, profile: np.ndarray = None) -> list:
+    """
+    Plan the AMPCOR chunks. The offsets grid is split in n_rn_tiles range
+    tiles of balanced width, aligned to the range offsets grid, and each
+    range tile in n_chunks / n_rn_tiles azimuth chunks. Tiles and chunks
+    abut - no offset is computed twice. Chunks are numbered sequentially
+    along azimuth within each range tile.
+    :param y_start: first azimuth line of the offsets grid
+    :param n_rec: number of azimuth lines of the offsets grid
+    :param line_spacing: azimuth offsets spacing [lines]
+    :param n_chunks: number of chunks
+    :param y_off: initial azimuth offset [lines]
+    :param y_slope: relative azimuth pixel spacing difference
+    :param x_start: first range sample
+    :param x_end: last range sample
+    :param x_off: initial range offset [samples]
+    :param range_spacing: range offsets spacing [samples]
+    :param n_rn_tiles: number of range tiles [def. 1 - full range extent]
+    :param profile: azimuth cost profile - if provided, azimuth chunks
+                    have equal predicted cost instead of equal number of
+                    lines. See ampcor_history.cost_profile.
+    :return: list of chunks - Python dictionaries containing the chunk
+             azimuth/range extent (y_first, y_last, x_first, x_last),
+             initial offsets (x_off, y_off), first offset line and number
+             of offset lines (az_first, n_lines).
+    """
+    # - Range tiles - each tile starts on a node of the range offsets grid.
+    # - Like the azimuth chunks, tiles abut without overlap, and their
+    # - widths differ by one range node at most.
+    if n_rn_tiles > 1:
+        n_cols = (x_end - x_start) // range_spacing + 1
+        x_tiles = [(x_start + first * range_spacing,
+                    x_start + (first + count - 1) * range_spacing)
+                   for first, count in split_lines(n_cols, n_rn_tiles)]
+    else:
+        x_tiles = [(x_start, x_end)]
+    # - Azimuth chunks per range tile - the total number of chunks is the
+    # - closest to n_chunks
+    n_az_chunks = max(int(round(n_chunks / len(x_tiles))), 1)
+
+    n_lines = int(n_rec / line_spacing)
+    if profile is None:
+        az_split = split_lines(n_lines, n_az_chunks)
+    else:
+        az_split = balance_lines(profile, n_lines, n_az_chunks)
+    az_chunks = []
+    for first, count in az_split:
+        y_curr = int(y_start + first * line_spacing)
+        y_last = y_curr + line_spacing * (count - 1)
+        # - chunk initial azimuth offset - evaluated at the chunk center
+        y_off_c = int(np.fix(y_off + y_slope
+                             * (2. * y_curr + line_spacing * (count - 1))
+                             / 2. + 0.5))
+        # - Chunks abut exactly - no offset line is computed twice. The
+        # - first chunk keeps the legacy start two offset lines above the
+        # - grid, so the extent of the stitched offsets map is unchanged.
+        if first == 0:
+            y_curr = max(y_curr - 2 * line_spacing, 0)
+        az_chunks.append({'y_first': y_curr,
+                          'y_last': y_last, 'y_off': y_off_c,
+                          'az_first': first, 'n_lines': count})
+
+    return [{**az_chunk, 'x_first': x_first, 'x_last': x_last,
+             'x_off': x_off}
+            for x_first, x_last in x_tiles for az_chunk in az_chunks]
+
+
+def write_ampcor_in(in_path: str, ref_slc: str, sec_slc: str,
+                    out_name: str, n_pix_ref: int, n_pix_sec: int,
+                    chunk: dict, line_spacing: int,
+                    range_spacing: int) -> None:
+    """
+    Write the AMPCOR input parameter file of a chunk
+    :param in_path: absolute path to the .in file
+    :param ref_slc: reference SLC file name
+    :param sec_slc: secondary SLC file name
+    :param out_name: AMPCOR output offsets file name
+    :param n_pix_ref: reference SLC range samples
+    :param n_pix_sec: secondary SLC range samples
+    :param chunk: chunk - see plan_chunks
+    :param line_spacing: azimuth offsets spacing [lines]
+    :param range_spacing: range offsets spacing [samples]
+    :return: None
+    """
+    with open(in_path, 'w', encoding='utf8') as fid:
+        # - Reference and Secondary SLCs
+        print(ref_slc, file=fid)
+        print(sec_slc, file=fid)
+        # - Output offset map file name
+        print(out_name, file=fid)
+        # - range_samples of the 2 slc
+        print('{:5} {:5}'.format(n_pix_ref, n_pix_sec), file=fid)
+        # - azimuth-direction processing spacing
+        print('{:6} {:8} {:3}'.format(chunk['y_first'], chunk['y_last'],
+                                      line_spacing), file=fid)
+        # - range-direction processing spacing
+        print('{:4} {:5} {:5}'.format(chunk['x_first'], chunk['x_last'],
+                                      range_spacing), file=fid)
+        # - Define "Search Window" and "Chip" size
+        print('64 64', file=fid)
+        print('32 32', file=fid)
+        print('1 1', file=fid)
+        # - chunk initial offset
+        print('{:5} {:6}'.format(chunk['x_off'], chunk['y_off']), file=fid)
+        # - Other Input parameters for AMPCOR
+        # - threshold SNR = 0
+        # - threshold covariance matrix = 1.e10
+        # - > With this threshold values, all the offset are calculated.
+        print('0. 1.e10', file=fid)
+        # - Offsets expressed as floating point real numbers
+        print('f f', file=fid)
+    os.chmod(in_path, 0o0755)
+
+
+def write_ampcor_chunks(out_dir: str, ref_slc: str, sec_slc: str,
+                        chunks: list, ampcor_path: str,
+                        n_pix_ref: int, n_pix_sec: int,
+                        line_spacing: int, range_spacing: int) -> str:
+    """
+    Write the .in file of each chunk and the bat file listing the AMPCOR
+    command of each chunk - one per line.
+    :param out_dir: output directory
+    :param ref_slc: reference SLC name
+    :param sec_slc: secondary SLC name
+    :param chunks: list of chunks - see plan_chunks
+    :param ampcor_path: absolute path to the AMPCOR binary
+    :param n_pix_ref: reference SLC range samples
+    :param n_pix_sec: secondary SLC range samples
+    :param line_spacing: azimuth offsets spacing [lines]
+    :param range_spacing: range offsets spacing [samples]
+    :return: absolute path to the bat file
+    """
+    pair_name = f'{ref_slc}-{sec_slc}'
+    bat_path = os.path.join(out_dir, f'bat_{pair_name}')
+    with open(bat_path, 'w', encoding='utf8') as fid:
+        for i, chunk in enumerate(chunks):
+            out_name = f'{pair_name}.offmap_{i + 1}'
+            write_ampcor_in(os.path.join(out_dir, out_name + '.in'),
+                            f'{ref_slc}.slc', f'{sec_slc}.slc', out_name,
+                            n_pix_ref, n_pix_sec, chunk,
+                            line_spacing, range_spacing)
+            print(f'{ampcor_path} {out_name}.in old &', file=fid)
+    os.chmod(bat_path, 0o0755)
+    return bat_path
+
+
+def ampcor_jobs(bat_path: str) -> list:
+    """
+    Executor jobs of the AMPCOR chunks listed in a bat file - see
+    executor.run_jobs. Jobs run in the bat file directory and their
+    memory class is the AMPCOR binary and window size.
+    :param bat_path: absolute path to the bat file
+    :return: list of jobs - the chunk number (chunk) and the absolute path
+             to the .in file (in_path) are stored with each job
+    """
+    out_dir = os.path.dirname(os.path.abspath(bat_path))
+    jobs = []
+    for c_id, cmd in enumerate(bat_commands(bat_path), start=1):
+        in_path = os.path.join(out_dir, os.path.basename(cmd[1]))
+        c_win = read_ampcor_in(in_path)['window']
+        jobs.append({'name': os.path.basename(in_path), 'cmd': cmd,
+                     'cwd': out_dir, 'chunk': c_id, 'in_path': in_path,
+                     'mem_key': f'{os.path.basename(cmd[0])}:'
+                                f'{c_win[0]}x{c_win[1]}'})
+    return jobs
+
+
+def read_ampcor_in(in_path: str) -> dict:
+    """
+    Read the AMPCOR input parameter file of a chunk
+    :param in_path: absolute path to the .in file
+    :return: Python dictionary containing the chunk parameters
+    """
+    with open(in_path, 'r', encoding='utf8') as fid:
+        lines = fid.readlines()
+    y_first, y_last, y_sp = (int(v) for v in lines[4].split()[:3])
+    x_first, x_last, x_sp = (int(v) for v in lines[5].split()[:3])
+    return {'ref_slc': lines[0].strip(), 'sec_slc': lines[1].strip(),
+            'out_name': lines[2].strip(),
+            'y_first': y_first, 'y_last': y_last, 'line_spacing': y_sp,
+            'x_first': x_first, 'x_last': x_last, 'range_spacing': x_sp,
+            'window': [int(v) for v in lines[6].split()[:2]]}
+
+
+def is_offset_line(line: str) -> bool:
+    """
+    Check if a line of an AMPCOR output file contains a valid offset -
+    lines containing '*' or shorter than 81 characters are discarded.
+    :param line: AMPCOR output line
+    :return: True if the line contains a valid offset
+    """
+    return '*' not in line and len(line.rstrip('\n')) > 80
+
+
+def validate_chunk(in_path: str, returncode: int = None,
+                   tol: int = 2) -> dict:
+    """
+    Validate the output of an AMPCOR chunk: the number of azimuth offset
+    lines found in the output file is compared with the number expected
+    from the .in parameters. Offset lines can be missing only in the
+    chunks at the scene azimuth borders, where the correlation and search
+    windows fall outside the SLC.
+    :param in_path: absolute path to the .in file
+    :param returncode: AMPCOR exit status [def. None - not run]. A known
+                       exit status must be 0.
+    :param tol: number of azimuth offset lines that can be missing in the
+                chunks at the scene borders [def. 2]
+    :return: Python dictionary containing the chunk status
+             [done, failed, incomplete, missing], and the expected and
+             parsed number of azimuth offset lines
+    """
+    params = read_ampcor_in(in_path)
+    in_dir = os.path.dirname(in_path)
+    out_path = os.path.join(in_dir, params['out_name'])
+    n_expected = (params['y_last'] - params['y_first']) \
+        // params['line_spacing'] + 1
+    y_lines = set()
+    if os.path.isfile(out_path):
+        with open(out_path, 'r', encoding='utf8') as fid:
+            for line in fid:
+                if is_offset_line(line):
+                    y_lines.add(line.split()[2])
+    # - Scene border chunks - within the correlation and search windows
+    # - of the first or the last reference SLC line
+    with open(in_path, 'r', encoding='utf8') as fid:
+        lines = fid.readlines()
+    n_pix_ref = int(lines[3].split()[0])
+    pad = params['window'][1] + int(lines[7].split()[1])
+    border = params['y_first'] < pad
+    ref_path = os.path.join(in_dir, params['ref_slc'])
+    if os.path.isfile(ref_path):
+        n_lines = os.path.getsize(ref_path) // (n_pix_ref * 8)
+        border = border or params['y_last'] + pad >= n_lines
+    n_missing = n_expected - len(y_lines)
+
+    if returncode not in (None, 0):
+        status = 'failed'
+    elif not os.path.isfile(out_path):
+        status = 'missing'
+    elif n_missing > (tol if border else 0):
+        status = 'incomplete'
+    else:
+        status = 'done'
+    return {'in': os.path.basename(in_path), 'status': status,
+            'returncode': returncode, 'expected': n_expected,
+            'parsed': len(y_lines)}
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+AMPCOR runtime history: per-chunk runtimes are stored in a local JSON file,
+grouped by a history key (e.g. track/frame identifier). The history of a
+key is turned into a cost profile along the normalized azimuth extent of
+the scene, used to size new chunks so that their predicted runtimes, and
+not their line counts, are equal.
+"""
+# - Python Dependencies
+import os
+import json
+import fcntl
+import numpy as np
+
+# - Default history store
+HISTORY_PATH = os.path.join(os.path.expanduser('~'), '.ampcor_history.json')
+# - Maximum number of runtime records kept for each history key
+MAX_RECORDS = 5000
+
+
+def write_chunk_plan(plan_path: str, chunks: list, n_lines: int,
+                     history_key: str = None, **kwargs) -> None:
+    """
+    Save the AMPCOR chunks plan next to the bat file
+    :param plan_path: absolute path to the plan file (JSON)
+    :param chunks: list of chunks - see ampcor_chunks.plan_chunks
+    :param n_lines: total number of offset lines
+    :param history_key: runtime history key
+    :param kwargs: other plan parameters (e.g. window size)
+    :return: None
+    """
+    plan = {'history_key': history_key, 'n_lines': n_lines,
+            'chunks': chunks, **kwargs}
+    with open(plan_path, 'w', encoding='utf8') as fid:
+        json.dump(plan, fid, indent=1)
+
+
+def load_history(history_path: str, history_key: str) -> list:
+    """
+    Load the runtime records of a history key
+    :param history_path: absolute path to the history store
+    :param history_key: runtime history key
+    :return: list of runtime records
+    """
+    if not os.path.isfile(history_path):
+        return []
+    with open(history_path, 'r', encoding='utf8') as fid:
+        fcntl.flock(fid, fcntl.LOCK_SH)
+        history = json.load(fid)
+    return history.get(history_key, [])
+
+
+def record_runtimes(history_path: str, plan: dict,
+                    runtimes: dict) -> None:
+    """
+    Append the runtimes of the chunks of a plan to the history store
+    :param history_path: absolute path to the history store
+    :param plan: chunks plan - see write_chunk_plan
+    :param runtimes: wall time of each chunk [s] - indexed by chunk number
+    :return: None
+    """
+    if plan.get('history_key') is None:
+        return
+    records = []
+    for c_id, chunk in enumerate(plan['chunks'], start=1):
+        if c_id not in runtimes:
+            continue
+        n_samples = (chunk['x_last'] - chunk['x_first']) \
+            // plan['range_spacing'] + 1
+        records.append({
+            'az_start': chunk['az_first'] / plan['n_lines'],
+            'az_end': (chunk['az_first'] + chunk['n_lines'])
+            / plan['n_lines'],
+            'lines': chunk['n_lines'], 'samples': n_samples,
+            'window': plan['window'], 'wall_time': runtimes[c_id]
+        })
+
+    # - Read-modify-write under an exclusive lock
+    with open(history_path, 'a+', encoding='utf8') as fid:
+        fcntl.flock(fid, fcntl.LOCK_EX)
+        fid.seek(0)
+        content = fid.read()
+        history = json.loads(content) if content else {}
+        key_hist = history.get(plan['history_key'], []) + records
+        history[plan['history_key']] = key_hist[-MAX_RECORDS:]
+        fid.seek(0)
+        fid.truncate()
+        json.dump(history, fid)
+
+
+def cost_profile(records: list, n_bins: int = 100) -> np.ndarray:
+    """
+    Cost profile along the normalized azimuth extent of the scene - mean
+    wall time per offset node of the chunks covering each azimuth bin.
+    :param records: runtime records - see record_runtimes
+    :param n_bins: number of azimuth bins
+    :return: cost profile [n_bins] - None if no record is available
+    """
+    cost = np.zeros(n_bins)
+    count = np.zeros(n_bins)
+    for rec in records:
+        n_nodes = rec['lines'] * rec['samples']
+        if n_nodes <= 0 or rec['wall_time'] <= 0:
+            continue
+        b_start = int(np.clip(np.floor(rec['az_start'] * n_bins),
+                              0, n_bins - 1))
+        b_end = int(np.clip(np.ceil(rec['az_end'] * n_bins),
+                            b_start + 1, n_bins))
+        cost[b_start:b_end] += rec['wall_time'] / n_nodes
+        count[b_start:b_end] += 1
+    valid = count > 0
+    if not np.any(valid):
+        return None
+    # - Bins not covered by the history - interpolated
+    b_ind = np.arange(n_bins)
+    cost[valid] /= count[valid]
+    return np.interp(b_ind, b_ind[valid], cost[valid])
+
+
+def balance_lines(profile: np.ndarray, n_lines: int, n_chunks: int) -> list:
+    """
+    Split the offset lines into contiguous chunks of equal predicted cost
+    :param profile: cost profile - see cost_profile
+    :param n_lines: total number of offset lines
+    :param n_chunks: number of chunks
+    :return: list of (first offset line, number of offset lines)
+    """
+    n_chunks = max(min(n_chunks, n_lines), 1)
+    # - Predicted cost of each offset line
+    l_pos = (np.arange(n_lines) + 0.5) / n_lines
+    l_cost = profile[np.minimum((l_pos * len(profile)).astype(int),
+                                len(profile) - 1)]
+    cum_cost = np.cumsum(l_cost)
+    targets = cum_cost[-1] * np.arange(1, n_chunks) / n_chunks
+    bounds = np.searchsorted(cum_cost, targets) + 1
+    # - At least one offset line per chunk
+    edges = [0]
+    for i_c, bound in enumerate(bounds, start=1):
+        edges.append(int(min(max(bound, edges[-1] + 1),
+                             n_lines - (n_chunks - i_c))))
+    edges.append(n_lines)
+    return [(edges[i], edges[i + 1] - edges[i]) for i in range(n_chunks)]
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""
+Live progress monitor of the AMPCOR chunks. The growing output file of
+each chunk is tailed - only the bytes added since the previous update
+are read - and the completed azimuth offset lines are counted against the
+number expected from the chunk .in file.
+For each chunk and for the whole run the monitor reports progress,
+throughput [lines/min] and ETA, and flags the running chunks whose output
+has not grown for stall_time seconds. The status is printed and saved to
+a JSON file at every update.
+"""
+# - Python Dependencies
+import os
+import json
+import time
+import threading
+from collections import deque
+from utils.ampcor_chunks import read_ampcor_in, is_offset_line
+
+# - Default stall time [s]
+STALL_TIME = 600.
+# - Number of updates used to estimate the overall throughput
+RATE_WINDOW = 10
+
+
+class AmpcorMonitor:
+    """
+    Progress monitor of a set of AMPCOR chunks
+    :param in_paths: absolute paths to the chunks .in files
+    :param status_path: JSON status file [def. None - not saved]
+    :param stall_time: time without output growth after which a running
+                       chunk is flagged as stalled [s]
+    :param tol: number of azimuth offset lines that can be missing from a
+                completed chunk - see ampcor_chunks.validate_chunk
+    """
+    def __init__(self, in_paths: list, status_path: str = None,
+                 stall_time: float = STALL_TIME, tol: int = 2):
+        self.status_path = status_path
+        self.stall_time = stall_time
+        self.tol = tol
+        self.t_start = time.time()
+        self.chunks = {}
+        for in_path in in_paths:
+            params = read_ampcor_in(in_path)
+            self.chunks[os.path.basename(in_path)] = {
+                'out_path': os.path.join(os.path.dirname(in_path),
+                                         params['out_name']),
+                'expected': (params['y_last'] - params['y_first'])
+                // params['line_spacing'] + 1,
+                'y_lines': set(), 'f_pos': 0, 'partial': '', 'ino': None,
+                't_first': None, 't_growth': None, 'returncode': None,
+            }
+        self.history = deque(maxlen=RATE_WINDOW)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _tail(self, chunk: dict, now: float) -> None:
+        """
+        Read the output added to a chunk file since the last update
+        :param chunk: chunk state
+        :param now: current time (epoch)
+        :return: None
+        """
+        try:
+            f_stat = os.stat(chunk['out_path'])
+            if f_stat.st_size < chunk['f_pos'] \
+                    or f_stat.st_ino != chunk['ino']:
+                # - Output rewritten or replaced - e.g. chunk restarted
+                chunk.update({'f_pos': 0, 'partial': '',
+                              'y_lines': set(), 'ino': f_stat.st_ino})
+            with open(chunk['out_path'], 'r', encoding='utf8') as fid:
+                fid.seek(chunk['f_pos'])
+                new_text = fid.read()
+                chunk['f_pos'] = fid.tell()
+        except FileNotFoundError:
+            return
+        if chunk['t_first'] is None:
+            chunk['t_first'] = now
+        if not new_text:
+            return
+        chunk['t_growth'] = now
+        # - Only complete lines are parsed
+        lines = (chunk['partial'] + new_text).split('\n')
+        chunk['partial'] = lines.pop()
+        for line in lines:
+            if is_offset_line(line):
+                chunk['y_lines'].add(line.split()[2])
+
+    def _chunk_state(self, chunk: dict, now: float) -> str:
+        """
+        State of a chunk
+        :param chunk: chunk state
+        :param now: current time (epoch)
+        :return: pending, running, stalled, done or failed
+        """
+        if chunk['returncode'] not in (None, 0):
+            return 'failed'
+        if chunk['returncode'] == 0 \
+                or len(chunk['y_lines']) >= chunk['expected'] - self.tol:
+            return 'done'
+        if chunk['t_first'] is None:
+            return 'pending'
+        if now - (chunk['t_growth'] or chunk['t_first']) > self.stall_time:
+            return 'stalled'
+        return 'running'
+
+    def finish(self, name: str, result: dict) -> None:
+        """
+        Record the exit status of a chunk - executor.run_jobs callback
+        :param name: job name - .in file name
+        :param result: job result - see executor.run_jobs
+        :return: None
+        """
+        with self.lock:
+            if name in self.chunks:
+                self.chunks[name]['returncode'] = result['returncode']
+
+    def update(self) -> dict:
+        """
+        Update the chunks progress and save the status file
+        :return: Python dictionary containing the overall and per-chunk
+                 status
+        """
+        with self.lock:
+            now = time.time()
+            chunk_status = {}
+            for name, chunk in self.chunks.items():
+                self._tail(chunk, now)
+                n_done = min(len(chunk['y_lines']), chunk['expected'])
+                state = self._chunk_state(chunk, now)
+                # - Chunk throughput - up to its last output for the
+                # - terminated chunks
+                t_end = chunk['t_growth'] \
+                    if state in ('done', 'failed') else now
+                c_time = t_end - chunk['t_first'] \
+                    if chunk['t_first'] and t_end else 0.
+                c_rate = 60. * n_done / c_time if c_time > 0 else 0.
+                c_eta = (chunk['expected'] - n_done) / c_rate * 60. \
+                    if c_rate > 0 and state in ('running', 'stalled') \
+                    else None
+                chunk_status[name] = {
+                    'state': state, 'lines': n_done,
+                    'expected': chunk['expected'],
+                    'progress': n_done / chunk['expected'],
+                    'rate': c_rate, 'eta': c_eta, 'runtime': c_time,
+                    'idle': now - chunk['t_growth']
+                    if chunk['t_growth'] else None,
+                }
+            n_total = sum(c['expected'] for c in chunk_status.values())
+            n_done = sum(c['expected'] if c['state'] == 'done'
+                         else c['lines'] for c in chunk_status.values())
+            # - Overall throughput - over the last RATE_WINDOW updates
+            self.history.append((now, n_done))
+            t_0, n_0 = self.history[0]
+            rate = 60. * (n_done - n_0) / (now - t_0) if now > t_0 else 0.
+            states = [c['state'] for c in chunk_status.values()]
+            status = {
+                'time': now, 'elapsed': now - self.t_start,
+                'lines': n_done, 'expected': n_total,
+                'progress': n_done / n_total if n_total else 1.,
+                'rate': rate,
+                'eta': (n_total - n_done) / rate * 60. if rate > 0
+                else None,
+                'states': {s: states.count(s) for s in sorted(set(states))},
+                'stalled': [n for n, c in chunk_status.items()
+                            if c['state'] == 'stalled'],
+                'chunks': chunk_status,
+            }
+        if self.status_path is not None:
+            tmp_path = f'{self.status_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf8') as fid:
+                json.dump(status, fid, indent=1)
+            os.replace(tmp_path, self.status_path)
+        return status
+
+    @staticmethod
+    def report(status: dict, n_slow: int = 3) -> str:
+        """
+        Format the monitor status for the terminal
+        :param status: monitor status - see update
+        :param n_slow: number of slowest running chunks listed
+        :return: status report
+        """
+        eta = time.strftime('%H:%M:%S', time.gmtime(status['eta'])) \
+            if status['eta'] is not None else '--:--:--'
+        states = ', '.join(f'{s}: {n}' for s, n in status['states'].items())
+        msg = f"# - AMPCOR: {100. * status['progress']:5.1f}% - " \
+              f"{status['lines']}/{status['expected']} lines - " \
+              f"{status['rate']:.1f} lines/min - ETA {eta} - {states}"
+        running = {n: c for n, c in status['chunks'].items()
+                   if c['state'] in ('running', 'stalled')}
+        if running:
+            slow = sorted(running, key=lambda n: running[n]['rate'])
+            msg += '\n#   slowest: ' + ', '.join(
+                f"{n} ({100. * running[n]['progress']:.0f}%, "
+                f"{running[n]['rate']:.1f} l/min)" for n in slow[:n_slow])
+        if status['stalled']:
+            msg += f"\n#   stalled: {', '.join(status['stalled'])}"
+        return msg
+
+    def _run(self, interval: float) -> None:
+        """
+        Monitor thread loop
+        :param interval: update interval [s]
+        :return: None
+        """
+        while not self.stop_event.wait(interval):
+            print(self.report(self.update()), flush=True)
+
+    def start(self, interval: float = 60.) -> None:
+        """
+        Start updating the status in a background thread
+        :param interval: update interval [s]
+        :return: None
+        """
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, args=(interval,),
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self) -> dict:
+        """
+        Stop the background thread and save the final status
+        :return: final status - see update
+        """
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+        return self.update()
+
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Speculative re-execution of straggling AMPCOR chunks - see the speculate
+hook of executor.run_jobs.
+Once most chunks are done and worker slots are idle, the running chunks
+whose throughput (from the progress monitor) is well below the median, or
+whose output stalled, get a backup copy. The backup runs a copy of the
+chunk .in file writing to <out_name>.spec, so that the two copies never
+write the same file; if the backup finishes first, its output replaces
+the output of the original chunk, and the executor kills the original.
+The .spec files do not match the .offmap_<N> pattern of the chunk
+outputs and are ignored by r_off_sar.
+"""
+# - Python Dependencies
+import os
+import time
+import numpy as np
+from utils.ampcor_chunks import read_ampcor_in
+
+# - Suffix of the backup copies .in and output files
+SPEC_SUFFIX = '.spec'
+
+
+def backup_in(in_path: str) -> str:
+    """
+    Write the .in file of the backup copy of a chunk
+    :param in_path: absolute path to the chunk .in file
+    :return: absolute path to the backup .in file
+    """
+    with open(in_path, 'r', encoding='utf8') as fid:
+        lines = fid.readlines()
+    # - Line 3: output offsets file name
+    lines[2] = lines[2].strip() + SPEC_SUFFIX + '\n'
+    spec_path = in_path[:-len('.in')] + SPEC_SUFFIX + '.in'
+    with open(spec_path, 'w', encoding='utf8') as fid:
+        fid.writelines(lines)
+    return spec_path
+
+
+class AmpcorSpeculator:
+    """
+    Speculate hook of executor.run_jobs for AMPCOR chunks
+    :param monitor: chunks progress monitor - see ampcor_monitor
+    :param jobs: chunk jobs - see ampcor_chunks.ampcor_jobs
+    :param min_done: minimum fraction of completed chunks
+    :param slow_factor: a chunk is a straggler if its throughput is below
+                        slow_factor x the median chunk throughput
+    :param min_runtime: minimum runtime of a chunk before it can be
+                        flagged as straggler [s]
+    :param interval: minimum interval between two checks [s]
+    """
+    def __init__(self, monitor, jobs: list, min_done: float = 0.75,
+                 slow_factor: float = 0.5, min_runtime: float = 60.,
+                 interval: float = 30.):
+        self.monitor = monitor
+        self.jobs = {job['name']: job for job in jobs}
+        self.min_done = min_done
+        self.slow_factor = slow_factor
+        self.min_runtime = min_runtime
+        self.interval = interval
+        self.t_check = None
+        # - Original chunk of each backup copy
+        self.originals = {}
+
+    def __call__(self, names: list, n_idle: int) -> list:
+        """
+        Select the stragglers and create their backup copies
+        :param names: running chunks without a backup copy
+        :param n_idle: number of idle worker slots
+        :return: list of backup jobs
+        """
+        now = time.monotonic()
+        if self.t_check is not None and now - self.t_check < self.interval:
+            return []
+        self.t_check = now
+        status = self.monitor.update()
+        chunks = status['chunks']
+        n_done = sum(c['state'] == 'done' for c in chunks.values())
+        if n_done < self.min_done * len(chunks):
+            return []
+        rates = [c['rate'] for c in chunks.values()
+                 if c['state'] != 'pending' and c['rate'] > 0]
+        if not rates:
+            return []
+        slow_rate = self.slow_factor * np.median(rates)
+        stragglers = [n for n in names if n in chunks
+                      and chunks[n]['runtime'] >= self.min_runtime
+                      and (chunks[n]['state'] == 'stalled'
+                           or chunks[n]['rate'] < slow_rate)]
+        # - Chunks with the most remaining lines first
+        stragglers.sort(key=lambda n: chunks[n]['lines']
+                        - chunks[n]['expected'])
+        b_jobs = []
+        for name in stragglers[:n_idle]:
+            job = self.jobs[name]
+            spec_path = backup_in(job['in_path'])
+            b_name = os.path.basename(spec_path)
+            self.originals[b_name] = name
+            b_cmd = [b_name if os.path.basename(arg) == name else arg
+                     for arg in job['cmd']]
+            b_jobs.append({**job, 'name': b_name, 'in_path': spec_path,
+                           'cmd': b_cmd, 'backup_of': name})
+            print(f"# - Speculative copy of {name} - "
+                  f"{100. * chunks[name]['progress']:.0f}% at "
+                  f"{chunks[name]['rate']:.1f} lines/min")
+        return b_jobs
+
+    def promote(self, name: str, result: dict) -> str:
+        """
+        Executor callback - if a backup copy succeeded, its output replaces
+        the output of the original chunk. The original chunk output file
+        is replaced atomically, so the killed original can not corrupt it.
+        :param name: job name
+        :param result: job result - see executor.run_jobs
+        :return: name of the chunk whose result is final - None for the
+                 failed or killed backup copies
+        """
+        if name not in self.originals:
+            return name
+        orig_name = self.originals[name]
+        spec_in = self.jobs[orig_name]['in_path'][:-len('.in')] \
+            + SPEC_SUFFIX + '.in'
+        if result['returncode'] != 0 or result['cancelled']:
+            return None
+        out_dir = os.path.dirname(spec_in)
+        spec_out = read_ampcor_in(spec_in)['out_name']
+        os.replace(os.path.join(out_dir, spec_out),
+                   os.path.join(out_dir, spec_out[:-len(SPEC_SUFFIX)]))
+        return orig_name
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+CPU affinity and NUMA-aware placement of parallel workers (Linux).
+The NUMA topology is read from /sys/devices/system/node and restricted to
+the CPUs the current process is allowed to run on. Worker slots are spread
+round-robin across NUMA nodes so that concurrent workers use the memory
+bandwidth of all sockets, and each worker is pinned to the cores of a
+single node. Linux allocates pages on the node of the CPU that first
+touches them, so the buffers a pinned worker reads its chunk into stay
+local to that worker.
+On platforms without os.sched_setaffinity placement is disabled.
+"""
+# - Python Dependencies
+import os
+import glob
+import threading
+
+# - NUMA topology
+NODE_DIR = '/sys/devices/system/node'
+
+
+def affinity_supported() -> bool:
+    """
+    Check if CPU affinity can be set on this platform
+    :return: True if os.sched_setaffinity is available
+    """
+    return hasattr(os, 'sched_setaffinity')
+
+
+def parse_cpulist(cpulist: str) -> list:
+    """
+    Parse a Linux CPU list - e.g. "0-3,8-11"
+    :param cpulist: CPU list string
+    :return: sorted list of CPU ids
+    """
+    cpus = set()
+    for item in cpulist.strip().split(','):
+        if not item:
+            continue
+        if '-' in item:
+            first, last = item.split('-')
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(item))
+    return sorted(cpus)
+
+
+def numa_nodes() -> list:
+    """
+    CPUs of each NUMA node usable by the current process. If the topology
+    is not available all usable CPUs are returned as a single node.
+    :return: list of NUMA nodes - sorted lists of CPU ids
+    """
+    allowed = os.sched_getaffinity(0) if affinity_supported() \
+        else set(range(os.cpu_count() or 1))
+    nodes = []
+    node_paths = glob.glob(os.path.join(NODE_DIR, 'node[0-9]*'))
+    for node_path in sorted(node_paths,
+                            key=lambda p: int(p.rsplit('node', 1)[1])):
+        try:
+            with open(os.path.join(node_path, 'cpulist'), 'r',
+                      encoding='utf8') as fid:
+                cpus = [c for c in parse_cpulist(fid.read()) if c in allowed]
+        except OSError:
+            continue
+        if cpus:
+            nodes.append(cpus)
+    return nodes if nodes else [sorted(allowed)]
+
+
+def cpu_slots(n_slots: int, cpus_per_slot: int = 1) -> list:
+    """
+    Assign CPUs to worker slots. Slots are distributed round-robin across
+    NUMA nodes and each slot takes cpus_per_slot cores of its node. When
+    there are more slots than cores, the slots of a node share its cores.
+    :param n_slots: number of worker slots
+    :param cpus_per_slot: number of cores of each slot
+    :return: list of CPU sets - one for each slot
+    """
+    nodes = numa_nodes()
+    next_core = [0] * len(nodes)
+    slots = []
+    for i_s in range(n_slots):
+        n_id = i_s % len(nodes)
+        node = nodes[n_id]
+        n_cpus = min(cpus_per_slot, len(node))
+        first = next_core[n_id]
+        slots.append({node[(first + i_c) % len(node)]
+                      for i_c in range(n_cpus)})
+        next_core[n_id] = (first + n_cpus) % len(node)
+    return slots
+
+
+def pin_process(cpus: set, pid: int = 0) -> None:
+    """
+    Pin a process (or the calling thread) to a set of CPUs - used as
+    thread pool initializer, or on a subprocess right after it started.
+    :param cpus: set of CPU ids
+    :param pid: process id [def. 0 - calling thread]
+    :return: None
+    """
+    if cpus and affinity_supported():
+        try:
+            os.sched_setaffinity(pid, cpus)
+        except ProcessLookupError:
+            # - The process already exited
+            pass
+
+
+class ThreadPinner:
+    """
+    Thread pool initializer pinning each new worker thread to the next
+    CPU slot - see cpu_slots.
+    :param n_threads: number of worker threads
+    """
+    def __init__(self, n_threads: int):
+        self.slots = cpu_slots(n_threads)
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self) -> None:
+        with self.lock:
+            cpus = self.slots[self.count % len(self.slots)]
+            self.count += 1
+        pin_process(cpus)
@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+"""
+Managed subprocess executor for AMPCOR and GAMMA binaries.
+Jobs are run by an event loop that keeps at most max_workers processes
+alive, enforces per-job wall-time limits, retries failed jobs a bounded
+number of times, writes stdout/stderr of each job to its own log file and
+collects the resources used by each job (os.wait4 rusage).
+
+Memory governor: the peak RSS of each job class (e.g. AMPCOR binary and
+window size - the job mem_key) is cached in a JSON file. New jobs are
+admitted only while the projected memory of the running jobs plus the
+new one stays under the memory budget, or the available memory if no
+budget is set. Jobs are throttled, never killed, and one job is always
+allowed to run.
+
+Placement: optionally, each worker slot is pinned to its own cores, with
+the slots spread across NUMA nodes (see cpu_affinity.cpu_slots).
+
+Speculative execution: when no job is left to start and worker slots are
+idle, a speculate hook can return backup copies of straggling jobs. The
+first copy of a job that succeeds is kept and its twin is killed.
+"""
+# - Python Dependencies
+import os
+import json
+import time
+import shlex
+import signal
+import subprocess
+from utils.cpu_affinity import cpu_slots, pin_process
+
+# - Event loop polling interval [s]
+POLL_INTERVAL = 0.1
+# - Default peak RSS cache
+RSS_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.job_rss_cache.json')
+# - Minimum run time before the peak RSS of a running job is used as the
+# - estimate of jobs of the same class not yet in the cache [s]
+RSS_PROBE_TIME = 10.
+
+
+def mem_available() -> int:
+    """
+    Available memory from /proc/meminfo
+    :return: MemAvailable [kB]
+    """
+    with open('/proc/meminfo', 'r', encoding='utf8') as fid:
+        for line in fid:
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1])
+    raise ValueError('# - MemAvailable not found in /proc/meminfo')
+
+
+def proc_hwm(pid: int) -> int:
+    """
+    Peak resident set size of a running process (VmHWM)
+    :param pid: process id
+    :return: VmHWM [kB] - 0 if not available
+    """
+    try:
+        with open(f'/proc/{pid}/status', 'r', encoding='utf8') as fid:
+            for line in fid:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def load_rss_cache(cache_path: str) -> dict:
+    """
+    Load the peak RSS cache
+    :param cache_path: absolute path to the cache file
+    :return: peak RSS of each job class [kB]
+    """
+    if not os.path.isfile(cache_path):
+        return {}
+    with open(cache_path, 'r', encoding='utf8') as fid:
+        return json.load(fid)
+
+
+def save_rss_cache(cache_path: str, rss_cache: dict) -> None:
+    """
+    Save the peak RSS cache - merged with the content of the file
+    :param cache_path: absolute path to the cache file
+    :param rss_cache: peak RSS of each job class [kB]
+    :return: None
+    """
+    merged = load_rss_cache(cache_path)
+    for key, rss in rss_cache.items():
+        merged[key] = max(rss, merged.get(key, 0))
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf8') as fid:
+        json.dump(merged, fid, indent=1)
+    os.replace(tmp_path, cache_path)
+
+
+def cmd_line(cmd: list) -> str:
+    """
+    Shell-quoted command line (shlex.join is not available in Python 3.7)
+    :param cmd: command arguments
+    :return: command line
+    """
+    return ' '.join(shlex.quote(arg) for arg in cmd)
+
+
+def exit_code(w_status: int) -> int:
+    """
+    Exit code of a process from its wait status - negative signal number
+    if it was killed (os.waitstatus_to_exitcode requires Python 3.9)
+    :param w_status: wait status - see os.wait4
+    :return: exit code
+    """
+    if os.WIFEXITED(w_status):
+        return os.WEXITSTATUS(w_status)
+    if os.WIFSIGNALED(w_status):
+        return -os.WTERMSIG(w_status)
+    return w_status
+
+
+def bat_commands(bat_path: str) -> list:
+    """
+    Parse a bat file into a list of commands. Empty lines and comments are
+    skipped, environment variables are expanded and the trailing
+    background operator (&) is removed.
+    :param bat_path: absolute path to the bat file
+    :return: list of commands - list of arguments
+    """
+    commands = []
+    with open(bat_path, 'r', encoding='utf8') as fid:
+        for line in fid:
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            cmd = [os.path.expandvars(arg) for arg in shlex.split(line)]
+            if cmd[-1] == '&':
+                cmd = cmd[:-1]
+            commands.append(cmd)
+    return commands
+
+
+def _start_job(job: dict, cwd: str, log_dir: str,
+               slot: int = None, cpus: set = None) -> dict:
+    """
+    Start a job attempt
+    :param job: job - Python dictionary containing the job name and command
+    :param cwd: working directory
+    :param log_dir: log directory
+    :param slot: worker slot index
+    :param cpus: CPUs the job is pinned to [def. None - not pinned]
+    :return: running job state
+    """
+    log_path = os.path.join(log_dir, f"{job['name']}.log") \
+        if log_dir else os.devnull
+    log_fid = open(log_path, 'ab')
+    log_fid.write(f"# - {time.strftime('%Y-%m-%d %H:%M:%S')} - "
+                  f"{cmd_line(job['cmd'])}\n".encode())
+    log_fid.flush()
+    proc = subprocess.Popen(job['cmd'], cwd=job.get('cwd', cwd),
+                            stdout=log_fid, stderr=subprocess.STDOUT,
+                            **job.get('popen_kwargs', {}))
+    # - Pin the job after it started - preexec_fn is not safe when the
+    # - caller runs other threads (pipeline steps, progress monitor)
+    if cpus:
+        pin_process(cpus, pid=proc.pid)
+    return {'job': job, 'proc': proc, 'log_fid': log_fid,
+            'log': log_path if log_dir else None, 'slot': slot,
+            't_start': time.monotonic(), 'start_time': time.time()}
+
+
+def _mem_estimate(state: dict, rss_cache: dict) -> int:
+    """
+    Projected peak RSS of a running job
+    :param state: running job state
+    :param rss_cache: peak RSS of each job class [kB]
+    :return: projected peak RSS [kB]
+    """
+    return max(rss_cache.get(state['job'].get('mem_key'), 0),
+               proc_hwm(state['proc'].pid))
+
+
+def _admit(job: dict, running: dict, rss_cache: dict,
+           mem_budget: int) -> bool:
+    """
+    Memory governor - check if a new job can be started
+    :param job: job to start
+    :param running: running jobs
+    :param rss_cache: peak RSS of each job class [kB]
+    :param mem_budget: memory budget [kB] - None: available memory
+    :return: True if the job can be started
+    """
+    if not running:
+        return True
+    mem_key = job.get('mem_key')
+    job_est = rss_cache.get(mem_key)
+    if job_est is None:
+        # - Unknown job class - wait for a job of the same class to run
+        # - long enough to measure its peak RSS.
+        probes = [s for s in running.values()
+                  if s['job'].get('mem_key') == mem_key]
+        if not probes or any(time.monotonic() - s['t_start']
+                             < RSS_PROBE_TIME for s in probes):
+            return False
+        job_est = max(proc_hwm(s['proc'].pid) for s in probes)
+    projected = sum(_mem_estimate(s, rss_cache) for s in running.values())
+    if mem_budget is None:
+        # - Memory still usable: available memory plus the memory already
+        # - used by the running jobs.
+        budget = mem_available() + sum(proc_hwm(s['proc'].pid)
+                                       for s in running.values())
+    else:
+        budget = mem_budget
+    return projected + job_est <= budget
+
+
+def run_jobs(jobs: list, max_workers: int = 1, timeout: float = None,
+             retries: int = 0, log_dir: str = None, cwd: str = None,
+             callback=None, rss_cache_path: str = None,
+             mem_budget: int = None, affinity: bool = False,
+             cpus_per_job: int = 1, feed=None, on_poll=None,
+             speculate=None) -> dict:
+    """
+    Run a list of jobs keeping at most max_workers processes running
+    :param jobs: list of jobs - Python dictionaries containing the job
+                 name (name), command (cmd - list of arguments) and
+                 optionally the job working directory (cwd) and the job
+                 class used by the memory governor (mem_key)
+    :param max_workers: maximum number of concurrent processes
+    :param timeout: per-job wall-time limit [s] - def. None, no limit
+    :param retries: number of times a failed job is retried
+    :param log_dir: directory of the per-job log files (<name>.log)
+                    [def. None - outputs discarded]
+    :param cwd: working directory of the jobs
+    :param callback: function called as callback(name, result) every time
+                     a job attempt terminates
+    :param rss_cache_path: peak RSS cache - enables the memory governor
+                           [def. None - no memory governor]
+    :param mem_budget: memory budget [kB] - def. None, available memory
+    :param affinity: pin each worker slot to its own cores, spread across
+                     NUMA nodes [def. False]
+    :param cpus_per_job: number of cores of each worker slot
+    :param feed: function called as feed() when a worker slot is free and
+                 no job is pending - returns a new job or None when no
+                 job is available [def. None - only the listed jobs]
+    :param on_poll: function called as on_poll(names) every polling
+                    interval with the names of the pending and running
+                    jobs - returns the names of the jobs to cancel
+                    (running jobs are killed and not retried)
+    :param speculate: function called as speculate(names, n_idle) when no
+                      job is left to start and n_idle worker slots are
+                      idle, with the names of the running jobs without a
+                      backup - returns a list of backup jobs, each
+                      containing the name of its original job (backup_of).
+                      The result of a job is the one of the first of its
+                      copies that succeeds; the other copy is killed.
+    :return: Python dictionary containing the result of each job:
+             exit status (returncode), wall time, user+system CPU time
+             [s], maximum resident set size [kB], number of attempts,
+             timeout and cancelled flags, start and end times (epoch),
+             speculative flag (result of the backup copy) and log file
+             path.
+    """
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    pending = [{**job, 'attempt': 1} for job in jobs]
+    running = {}
+    results = {}
+    rss_cache = load_rss_cache(rss_cache_path) if rss_cache_path else None
+    # - Worker slots - CPUs of each slot if placement is enabled
+    slots = cpu_slots(max_workers, cpus_per_job) if affinity \
+        else [None] * max_workers
+    free_slots = list(range(max_workers))
+    # - Original jobs of the running backup copies
+    backups = {}
+
+    feed_open = feed is not None
+    while pending or running or feed_open:
+        # - Admit new jobs up to the concurrency limit and memory budget
+        while len(running) < max_workers:
+            if not pending and feed_open:
+                job = feed()
+                if job is None:
+                    feed_open = False
+                else:
+                    pending.append({**job, 'attempt': 1})
+            if not pending:
+                break
+            if rss_cache is not None and not _admit(pending[0], running,
+                                                    rss_cache, mem_budget):
+                break
+            slot = free_slots.pop(0)
+            state = _start_job(pending.pop(0), cwd, log_dir,
+                               slot=slot, cpus=slots[slot])
+            running[state['proc'].pid] = state
+
+        # - Speculative execution - backup copies of the stragglers
+        if speculate is not None and not pending and not feed_open \
+                and len(running) < max_workers:
+            originals = {s['job']['name']: s['job']
+                         for s in running.values()
+                         if 'backup_of' not in s['job']
+                         and s['job']['name'] not in backups}
+            for b_job in speculate(list(originals),
+                                   max_workers - len(running)):
+                if len(running) >= max_workers:
+                    break
+                if b_job['backup_of'] not in originals:
+                    continue
+                if rss_cache is not None and not _admit(
+                        b_job, running, rss_cache, mem_budget):
+                    break
+                backups[b_job['backup_of']] = originals[b_job['backup_of']]
+                slot = free_slots.pop(0)
+                state = _start_job({**b_job, 'attempt': 1}, cwd, log_dir,
+                                   slot=slot, cpus=slots[slot])
+                running[state['proc'].pid] = state
+
+        time.sleep(POLL_INTERVAL)
+        if on_poll is not None:
+            cancel = set(on_poll([job['name'] for job in pending]
+                                 + [s['job']['name']
+                                    for s in running.values()]))
+            pending = [job for job in pending if job['name'] not in cancel]
+            for state in running.values():
+                if state['job']['name'] in cancel \
+                        and not state.get('cancelled'):
+                    state['cancelled'] = True
+                    state['proc'].send_signal(signal.SIGKILL)
+        for pid, state in list(running.items()):
+            proc = state['proc']
+            elapsed = time.monotonic() - state['t_start']
+            # - Enforce the wall-time limit
+            if timeout is not None and elapsed > timeout \
+                    and not state.get('timed_out'):
+                state['timed_out'] = True
+                proc.send_signal(signal.SIGKILL)
+            # - Reap the process if it terminated - collect its rusage
+            w_pid, w_status, rusage = os.wait4(pid, os.WNOHANG)
+            if w_pid == 0:
+                continue
+            proc.returncode = exit_code(w_status)
+            state['log_fid'].close()
+            free_slots.append(state['slot'])
+            del running[pid]
+            job = state['job']
+            # - Original job and running twin copy (speculative execution)
+            orig_name = job.get('backup_of', job['name'])
+            twin = next((s for s in running.values()
+                         if s['job'].get('backup_of', s['job']['name'])
+                         == orig_name), None)
+            result = {'returncode': proc.returncode,
+                      'wall_time': elapsed,
+                      'cpu_time': rusage.ru_utime + rusage.ru_stime,
+                      'max_rss': rusage.ru_maxrss,
+                      'attempts': job['attempt'],
+                      'timeout': bool(state.get('timed_out')),
+                      'cancelled': bool(state.get('cancelled')),
+                      'start_time': state['start_time'],
+                      'end_time': time.time(),
+                      'speculative': 'backup_of' in job,
+                      'log': state['log']}
+            if not state.get('cancelled'):
+                # - The first successful copy wins - its twin is killed.
+                # - A failed copy is ignored while its twin is running.
+                if proc.returncode == 0 and twin is not None:
+                    twin['cancelled'] = True
+                    twin['proc'].send_signal(signal.SIGKILL)
+                if proc.returncode == 0 or twin is None:
+                    results[orig_name] = result
+            if twin is None or proc.returncode == 0:
+                orig_job = backups.pop(orig_name, job)
+            else:
+                orig_job = None
+            # - Update the peak RSS of the job class
+            if rss_cache is not None and job.get('mem_key') is not None:
+                rss_cache[job['mem_key']] = max(
+                    rss_cache.get(job['mem_key'], 0), rusage.ru_maxrss)
+            if callback is not None:
+                callback(job['name'], result)
+            # - Bounded retries of the failed jobs
+            if proc.returncode != 0 and orig_job is not None \
+                    and orig_job['attempt'] <= retries \
+                    and not state.get('cancelled'):
+                pending.append({**orig_job,
+                                'attempt': orig_job['attempt'] + 1})
+
+    if rss_cache:
+        save_rss_cache(rss_cache_path, rss_cache)
+    return results
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Geometry-keyed cache of the GAMMA geocoding products (gc_map lookup table,
+DEM segment, incidence angle, DEM heights in radar geometry, inverted
+lookup table).
+These products depend only on the reference acquisition geometry, on the
+interferogram looks and dimensions, on the DEM and on the oversampling
+factor - not on the secondary SLC. The cache key is a hash of:
+    - the geometry fields of the reference SLC/MLI parameter file
+      (timing, sampling, slant ranges, state vectors);
+    - the looks and dimensions of the interferogram parameter file;
+    - the fingerprints of the DEM parameter (posting) and data files;
+    - the oversampling factor and the other gc_map options.
+Every pair sharing the reference geometry (e.g. all the pairs with the
+same reference over a track) reuses the products of the first one.
+Products are returned as hard links - see utils.product_cache.
+"""
+# - Python Dependencies
+import json
+import hashlib
+# - GAMMA's Python integration with the py_gamma module
+import py_gamma as pg
+from utils.pipeline import fingerprint
+from utils.product_cache import cached_call
+
+# - Geometry fields of the SLC/MLI parameter file
+PAR_KEYS = ('sensor', 'date', 'start_time', 'center_time', 'end_time',
+            'azimuth_line_time', 'range_samples', 'azimuth_lines',
+            'range_looks', 'azimuth_looks', 'image_geometry',
+            'range_pixel_spacing', 'azimuth_pixel_spacing',
+            'near_range_slc', 'center_range_slc', 'far_range_slc',
+            'incidence_angle', 'azimuth_deskew', 'azimuth_angle',
+            'radar_frequency', 'prf', 'heading', 'earth_semi_major_axis',
+            'earth_semi_minor_axis', 'sar_to_earth_center',
+            'earth_radius_below_sensor', 'number_of_state_vectors',
+            'time_of_first_state_vector', 'state_vector_interval')
+# - Looks and dimensions of the interferogram parameter file
+OFF_PAR_KEYS = ('interferogram_range_looks', 'interferogram_azimuth_looks',
+                'interferogram_width', 'interferogram_azimuth_lines',
+                'interferogram_range_pixel_spacing',
+                'interferogram_azimuth_pixel_spacing')
+
+
+def par_fields(par_path: str, keys: tuple) -> dict:
+    """
+    Read selected fields of a GAMMA parameter file
+    :param par_path: absolute path to the parameter file
+    :param keys: field names - the state vectors are always included
+    :return: Python dictionary containing the field values (None if the
+             field is missing)
+    """
+    par_dict = pg.ParFile(par_path).par_dict
+    fields = {key: par_dict.get(key) for key in keys}
+    fields.update({key: value for key, value in par_dict.items()
+                   if key.startswith('state_vector_')})
+    return fields
+
+
+def geometry_key(par_path: str, off_par_path: str, dem_par: str,
+                 dem_bin: str, oversample: float, **kwargs) -> str:
+    """
+    Cache key of the geocoding products
+    :param par_path: absolute path to the reference SLC/MLI parameter file
+    :param off_par_path: absolute path to the interferogram parameter file
+    :param dem_par: absolute path to the DEM parameter file
+    :param dem_bin: absolute path to the DEM data file
+    :param oversample: DEM oversampling factor
+    :param kwargs: other gc_map options
+    :return: cache key
+    """
+    key = {'par': par_fields(par_path, PAR_KEYS),
+           'off_par': par_fields(off_par_path, OFF_PAR_KEYS)
+           if off_par_path else None,
+           'dem_par': fingerprint(dem_par), 'dem': fingerprint(dem_bin),
+           'oversample': oversample, 'options': kwargs}
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str)
+                          .encode('utf8')).hexdigest()
+
+
+def product_key(geo_key: str, step: str) -> str:
+    """
+    Cache key of the products of a step
+    :param geo_key: geometry key - see geometry_key
+    :param step: step name
+    :return: cache key
+    """
+    return hashlib.sha256(f'{geo_key}:{step}'.encode('utf8')).hexdigest()
+
+
+def cached_geo_call(cache_dir: str, geo_key: str, step: str, paths: list,
+                    func) -> bool:
+    """
+    Link the products of a geocoding step from the cache or compute and
+    store them
+    :param cache_dir: absolute path to the cache directory - None: the
+                      products are always computed
+    :param geo_key: geometry key - see geometry_key
+    :param step: step name
+    :param paths: absolute paths to the products
+    :param func: callable computing the products - called without arguments
+    :return: True if the products were found in the cache
+    """
+    return cached_call(cache_dir, product_key(geo_key, step), paths, func,
+                       label='Geocoding cache')
@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+"""
+Interferogram formation, topographic phase removal and geocoding steps
+shared by interf_gamma.py and interf_proc.py - see utils.pipeline.
+The steps start from the secondary SLC resampled to the reference
+geometry (sec2 - e.g. <sec>.reg2). The geocoding products with fixed
+names (gc_icemap, DEMice_gc, DEM_gc_par, inc.geo, hgt_icemap, inc,
+gc_map_invert, sim_phase, DIFF_par) are written to the pair workspace -
+see utils.workspace. All paths are absolute.
+The DEM-derived products (gc_map, geocode and gc_map_inversion steps) can
+be shared by the pairs with the same reference geometry through a
+geometry-keyed cache - see utils.geo_cache - and the reference MLI
+through the per-SLC cache - see utils.mli_cache.
+Optional products - quicklooks, incidence angle map, inverted lookup
+table - are lazy steps, produced only when requested (see PROFILES and
+utils.pipeline).
+The GAMMA raster steps declare gamma_threads() cores, and the memory of
+the rasters they hold (see raster_ram) - evaluated when the step starts,
+from the sizes in the parameter files produced upstream.
+"""
+# - Python Dependencies
+import os
+# - GAMMA's Python integration with the py_gamma module
+import py_gamma as pg
+from utils.path_to_dem import path_to_dem
+from utils.workspace import publish
+from utils.geo_cache import geometry_key, cached_geo_call
+from utils.mli_cache import multi_look
+
+# - Lazy steps producing quicklooks (8-bit rasters)
+QUICKLOOKS = ['mli_bmp', 'adf_flat_ql', 'topo_phase_ql', 'geocode_intf_ql',
+              'filter_ql', 'geocode_filter_ql']
+# - Optional products requested by each processing profile
+PROFILES = {'batch': [],
+            'quicklooks': QUICKLOOKS,
+            'full': QUICKLOOKS + ['incidence', 'gc_map_inversion']}
+# - Bytes per pixel of the GAMMA fcomplex and float rasters
+FCOMPLEX_BYTES = 8
+FLOAT_BYTES = 4
+
+
+def create_isp_par(data_dir: str, ref: str, sec: str,
+                   algorithm: int = 1, rlks: int = 1,
+                   azlks: int = 1, iflg: int = 0) -> None:
+    """
+    Generate a new parameter file ISP offset and interferogram parameter files
+    :param data_dir: absolute path to data directory
+    :param ref: reference SLC
+    :param sec: secondary SLC
+    :param algorithm: offset estimation algorithm
+    :param rlks: number of interferogram range looks
+    :param azlks: number of interferogram azimuth looks
+    :param iflg: interactive mode flag [0, 1]
+    :return: None
+    """
+    # - Create and update ISP offset and interferogram parameter files
+    pg.create_offset(
+        os.path.join(data_dir, f'{ref}.par'),
+        os.path.join(data_dir, f'{sec}.par'),
+        os.path.join(data_dir, f'{ref}-{sec}.par'),
+        algorithm, rlks, azlks, iflg
+    )
+    # - Initial SLC image offset estimation from orbit state-vectors
+    # - and image parameters
+    pg.init_offset_orbit(
+        os.path.join(data_dir, f'{ref}.par'),
+        os.path.join(data_dir, f'{sec}.par'),
+        os.path.join(data_dir, f'{ref}-{sec}.par')
+    )
+
+
+def interf_size(par_path: str) -> tuple:
+    """
+    Interferogram dimensions
+    :param par_path: absolute path to the interferogram parameter file
+    :return: interferogram width and number of lines
+    """
+    igram_param_dict = pg.ParFile(par_path).par_dict
+    return (int(igram_param_dict['interferogram_width'][0]),
+            int(igram_param_dict['interferogram_azimuth_lines'][0]))
+
+
+def dem_size(par_path: str) -> tuple:
+    """
+    DEM segment dimensions
+    :param par_path: absolute path to the DEM segment parameter file
+    :return: DEM segment width and number of lines
+    """
+    dem_param_dict = pg.ParFile(par_path).par_dict
+    return int(dem_param_dict['width'][0]), int(dem_param_dict['nlines'][0])
+
+
+def gamma_threads() -> int:
+    """
+    OpenMP threads of the GAMMA programs - OMP_NUM_THREADS, set for each
+    driver by pair_scheduler.py --gamma_threads
+    :return: number of threads [def. 1]
+    """
+    return max(int(os.environ.get('OMP_NUM_THREADS', 1)), 1)
+
+
+def raster_ram(intf_par: str, intf_bytes: int, dem_par: str = None,
+               dem_bytes: int = 0) -> float:
+    """
+    Memory of a GAMMA raster step - the input and output rasters are held
+    in memory
+    :param intf_par: absolute path to the interferogram parameter file
+    :param intf_bytes: bytes per pixel of the rasters in radar geometry
+    :param dem_par: absolute path to the DEM segment parameter file
+    :param dem_bytes: bytes per pixel of the rasters in DEM geometry
+    :return: memory [GB]
+    """
+    interf_width, interf_lines = interf_size(intf_par)
+    n_bytes = intf_bytes * interf_width * interf_lines
+    if dem_bytes:
+        dem_width, dem_nlines = dem_size(dem_par)
+        n_bytes += dem_bytes * dem_width * dem_nlines
+    return n_bytes / 1024 ** 3
+
+
+def slc_ram(slc_path: str) -> float:
+    """
+    Memory of a GAMMA SLC resampling step (SLC_interp, SLC_interp_map) -
+    the input and the output SLC are held in memory
+    :param slc_path: absolute path to the input SLC
+    :return: memory [GB]
+    """
+    return 2 * os.path.getsize(slc_path) / 1024 ** 3
+
+
+def profile_targets(pipe, profile: str) -> list:
+    """
+    Optional products of a processing profile registered in the pipeline
+    - e.g. the filter quicklooks exist only with the adf filter
+    :param pipe: utils.pipeline.Pipeline
+    :param profile: processing profile - see PROFILES
+    :return: names of the lazy steps to run
+    """
+    return [name for name in PROFILES[profile] if name in pipe.steps]
+
+
+def add_interf_steps(pipe, data_dir: str, ref: str, sec2: str, dem: str,
+                     dem_of: int = 1, nrlks: int = 15, nazlks: int = 15,
+                     adf_filter: bool = False, work_dir: str = None,
+                     pub_dir: str = None, geo_cache: str = None,
+                     mli_cache: str = None, ras=pg) -> None:
+    """
+    Add the interferogram and geocoding steps to a pipeline
+    :param pipe: pipeline - see utils.pipeline.Pipeline
+    :param data_dir: absolute path to data directory
+    :param ref: reference SLC
+    :param sec2: secondary SLC resampled to the reference geometry
+    :param dem: DEM name - see path_to_dem
+    :param dem_of: DEM oversampling factor
+    :param nrlks: number of interferogram range looks
+    :param nazlks: number of interferogram azimuth looks
+    :param adf_filter: smooth the differential interferograms with adf
+    :param work_dir: absolute path to the pair workspace - see
+                     utils.workspace.pair_workspace
+    :param pub_dir: directory where the lookup table (gc_icemap) and the
+                    DEM segment parameter file (DEM_gc_par) are published
+                    - a per-pair directory, e.g. the output directory
+                    [def. None - data_dir]
+    :param geo_cache: absolute path to the geocoding products cache
+                      directory [def. None - no cache]
+    :param mli_cache: absolute path to the MLI cache directory
+                      [def. None - no cache]
+    :param ras: module providing the GAMMA raster functions (raspwr,
+                rasmph_pwr) - py_gamma or py_gamma2019
+    :return: None
+    """
+    pub_dir = data_dir if pub_dir is None else pub_dir
+
+    def d_path(name: str) -> str:
+        return os.path.join(data_dir, name)
+
+    def w_path(name: str) -> str:
+        return os.path.join(work_dir, name)
+
+    ref_par = d_path(f'{ref}.par')
+    sec2_par = d_path(f'{sec2}.par')
+    intf_par = d_path(f'{ref}-{sec2}.par')
+    base = d_path(f'base{ref}-{sec2}.dat')
+    intf = d_path(f'coco{ref}-{sec2}.intf')
+    flat = f'{intf}.flat'
+    topo_off = f'{flat}.topo_off'
+    mli = d_path(f'{ref}.mli')
+    dem_info = path_to_dem(dem, oversample=dem_of)
+    dem_par = os.path.join(dem_info['path'], dem_info['par'])
+    dem_bin = os.path.join(dem_info['path'], dem_info['dem'])
+    # - Geocoding products - pair workspace
+    gc_lut = w_path('gc_icemap')
+    dem_seg_par = w_path(dem_info['par'])
+    dem_seg = w_path('DEMice_gc')
+    inc_geo = w_path('inc.geo')
+    hgt = w_path('hgt_icemap')
+
+    # - GAMMA steps run gamma_threads() OpenMP threads
+    n_threads = gamma_threads()
+
+    def ram(intf_bytes: int, dem_bytes: int = 0):
+        # - Memory of a raster step - evaluated when the step starts
+        return lambda: raster_ram(intf_par, intf_bytes, dem_seg_par,
+                                  dem_bytes)
+
+    def geo_key() -> str:
+        # - Geocoding cache key - geometry of the reference
+        return geometry_key(ref_par, intf_par, dem_par, dem_bin,
+                            dem_info['oversample'], ls_mode=2)
+
+    # - Interferogram parameter file
+    pipe.add('intf_par',
+             lambda: create_isp_par(data_dir, ref, sec2),
+             inputs=[ref_par, sec2_par], outputs=[intf_par])
+
+    def interferogram() -> None:
+        # - Compute Interferogram
+        pg.SLC_intf(d_path(f'{ref}.slc'), d_path(f'{sec2}.slc'),
+                    ref_par, sec2_par, intf_par, intf,
+                    nrlks, nazlks,      # number of range/azimuth looks
+                    )
+    pipe.add('interferogram', interferogram,
+             inputs=[d_path(f'{ref}.slc'), d_path(f'{sec2}.slc'), ref_par,
+                     sec2_par, intf_par],
+             outputs=[intf], params={'nrlks': nrlks, 'nazlks': nazlks},
+             cores=n_threads, io=1)
+
+    # - Estimate baseline from orbit state vectors
+    pipe.add('baseline', lambda: pg.base_orbit(ref_par, sec2_par, base),
+             inputs=[ref_par, sec2_par], outputs=[base])
+
+    # - Estimate and Remove Flat Earth Contribution from the Interferogram
+    pipe.add('flatten',
+             lambda: pg.ph_slope_base(intf, ref_par, intf_par, base, flat),
+             inputs=[intf, ref_par, intf_par, base], outputs=[flat],
+             cores=n_threads, ram=ram(2 * FCOMPLEX_BYTES))
+
+    # - Calculate a multi-look intensity (MLI) image from the reference SLC
+    pipe.add('mli',
+             lambda: multi_look(d_path(f'{ref}.slc'), ref_par, mli,
+                                f'{mli}.par', nrlks, nazlks,
+                                cache_dir=mli_cache),
+             inputs=[d_path(f'{ref}.slc'), ref_par],
+             outputs=[mli, f'{mli}.par'],
+             params={'nrlks': nrlks, 'nazlks': nazlks}, cores=n_threads,
+             io=1)
+
+    # - Generate 8-bit greyscale raster image of intensity multi-looked SLC
+    pipe.add('mli_bmp',
+             lambda: ras.raspwr(mli, interf_size(intf_par)[0]),
+             inputs=[mli, intf_par], outputs=[f'{mli}.bmp'], lazy=True)
+
+    # - Adaptive interferogram filter using the power spectral density
+    pipe.add('adf_flat',
+             lambda: pg.adf(flat, f'{flat}.filt', f'{flat}.coh',
+                            interf_size(intf_par)[0]),
+             inputs=[flat, intf_par],
+             outputs=[f'{flat}.filt', f'{flat}.coh'], cores=n_threads,
+             ram=ram(2 * FCOMPLEX_BYTES + FLOAT_BYTES))
+
+    # - Show Output Interferogram
+    pipe.add('adf_flat_ql',
+             lambda: ras.rasmph_pwr(f'{flat}.filt', f'{mli}.bmp',
+                                    interf_size(intf_par)[0]),
+             inputs=[f'{flat}.filt', f'{mli}.bmp', intf_par],
+             outputs=[f'{flat}.filt.bmp'], lazy=True)
+
+    # - Geocoding lookup table and DEM segment in radar geometry
+    def gc_map() -> None:
+        def esc(path: str) -> str:
+            return path.replace(' ', r'\ ')
+
+        def run_gc_map() -> None:
+            pg.gc_map(
+                esc(ref_par), esc(intf_par),
+                esc(dem_par),  # - DEM/MAP parameter file
+                esc(dem_bin),  # - DEM data file
+                esc(dem_seg_par),  # - DEM segment used...
+                esc(dem_seg),  # - DEM segment used for output products...
+                esc(gc_lut),  # - geocoding lookup table (fcomplex)
+                dem_info['oversample'], dem_info['oversample'],
+                esc(w_path('sar_map_in_dem_geometry')),
+                '-', '-', esc(inc_geo), '-', '-', '-', '-', '2', '-'
+            )
+        cached_geo_call(geo_cache, geo_key(), 'gc_map',
+                        [dem_seg_par, dem_seg, gc_lut, inc_geo,
+                         w_path('sar_map_in_dem_geometry')], run_gc_map)
+        print('# - DEM Size: {1} x {0}'.format(*dem_size(dem_seg_par)))
+    pipe.add('gc_map', gc_map,
+             inputs=[ref_par, intf_par, dem_par, dem_bin],
+             outputs=[dem_seg_par, dem_seg, gc_lut, inc_geo],
+             params={'dem': dem, 'oversample': dem_info['oversample']},
+             cores=n_threads, io=1)
+
+    def publish_gc_map() -> None:
+        # - Lookup table and DEM segment parameters read by the double
+        # - difference scripts from the pair directory
+        publish(gc_lut, os.path.join(pub_dir, 'gc_icemap'))
+        publish(dem_seg_par, os.path.join(pub_dir, dem_info['par']))
+    pipe.add('publish_gc_map', publish_gc_map,
+             inputs=[gc_lut, dem_seg_par],
+             outputs=[os.path.join(pub_dir, 'gc_icemap'),
+                      os.path.join(pub_dir, dem_info['par'])])
+
+    def geocode() -> None:
+        # - Forward geocoding transformation using a lookup table
+        dem_width = dem_size(dem_seg_par)[0]
+        interf_width, interf_lines = interf_size(intf_par)
+
+        cached_geo_call(geo_cache, geo_key(), 'geocode', [hgt],
+                        lambda: pg.geocode(gc_lut, dem_seg, dem_width, hgt,
+                                           interf_width, interf_lines))
+    pipe.add('geocode', geocode,
+             inputs=[gc_lut, dem_seg, dem_seg_par, intf_par],
+             outputs=[hgt], cores=n_threads,
+             ram=ram(FLOAT_BYTES, FCOMPLEX_BYTES + FLOAT_BYTES))
+
+    def incidence() -> None:
+        # - Local incidence angle in radar geometry
+        dem_width = dem_size(dem_seg_par)[0]
+        interf_width, interf_lines = interf_size(intf_par)
+        cached_geo_call(geo_cache, geo_key(), 'incidence', [w_path('inc')],
+                        lambda: pg.geocode(gc_lut, inc_geo, dem_width,
+                                           w_path('inc'), interf_width,
+                                           interf_lines))
+    pipe.add('incidence', incidence,
+             inputs=[gc_lut, inc_geo, dem_seg_par, intf_par],
+             outputs=[w_path('inc')], cores=n_threads,
+             ram=ram(FLOAT_BYTES, FCOMPLEX_BYTES + FLOAT_BYTES), lazy=True)
+
+    def gc_map_inversion() -> None:
+        # - Invert geocoding lookup table
+        interf_width, interf_lines = interf_size(intf_par)
+        cached_geo_call(geo_cache, geo_key(), 'gc_map_inversion',
+                        [w_path('gc_map_invert')],
+                        lambda: pg.gc_map_inversion(
+                            gc_lut, dem_size(dem_seg_par)[0],
+                            w_path('gc_map_invert'), interf_width,
+                            interf_lines
+                        ))
+    pipe.add('gc_map_inversion', gc_map_inversion,
+             inputs=[gc_lut, dem_seg_par, intf_par],
+             outputs=[w_path('gc_map_invert')], cores=n_threads,
+             ram=ram(FCOMPLEX_BYTES, FCOMPLEX_BYTES), lazy=True)
+
+    def geocode_mli() -> None:
+        # - Geocoding of Reference SLC power using a geocoding lookup table
+        dem_width, dem_nlines = dem_size(dem_seg_par)
+        pg.geocode_back(mli, interf_size(intf_par)[0], gc_lut,
+                        f'{mli}.geo', dem_width, dem_nlines)
+        ras.raspwr(f'{mli}.geo', dem_width)
+    pipe.add('geocode_mli', geocode_mli,
+             inputs=[mli, gc_lut, dem_seg_par, intf_par],
+             outputs=[f'{mli}.geo', f'{mli}.geo.bmp'], cores=n_threads,
+             ram=ram(FLOAT_BYTES, FCOMPLEX_BYTES + FLOAT_BYTES))
+
+    def topo_phase() -> None:
+        # - Remove Interferometric Phase component due to surface
+        # - Topography. Simulate unwrapped interferometric phase using
+        # - DEM height.
+        pg.phase_sim(ref_par, intf_par, base, hgt,
+                     w_path('sim_phase'), 1, 0, '-')
+        # - Create DIFF/GEO parameter file for geocoding and
+        # - differential interferometry
+        pg.create_diff_par(intf_par, intf_par, w_path('DIFF_par'), '-', 0)
+        # - Subtract topographic phase from interferogram
+        pg.sub_phase(flat, w_path('sim_phase'), w_path('DIFF_par'),
+                     topo_off, 1)
+    pipe.add('topo_phase', topo_phase,
+             inputs=[ref_par, intf_par, base, hgt, flat],
+             outputs=[w_path('sim_phase'), w_path('DIFF_par'), topo_off],
+             cores=n_threads, ram=ram(2 * FCOMPLEX_BYTES + FLOAT_BYTES))
+
+    # - Show interferogram w/o topographic phase
+    pipe.add('topo_phase_ql',
+             lambda: ras.rasmph_pwr(topo_off, mli, interf_size(intf_par)[0]),
+             inputs=[topo_off, mli, intf_par], outputs=[f'{topo_off}.bmp'],
+             lazy=True)
+
+    def geocode_intf() -> None:
+        # - Geocode Output interferogram
+        dem_width, dem_nlines = dem_size(dem_seg_par)
+        pg.geocode_back(topo_off, interf_size(intf_par)[0], gc_lut,
+                        f'{topo_off}.geo', dem_width, dem_nlines, '-', 1)
+    pipe.add('geocode_intf', geocode_intf,
+             inputs=[topo_off, gc_lut, dem_seg_par, intf_par],
+             outputs=[f'{topo_off}.geo'], cores=n_threads,
+             ram=ram(FCOMPLEX_BYTES, 2 * FCOMPLEX_BYTES))
+
+    # - Show Geocoded interferogram
+    pipe.add('geocode_intf_ql',
+             lambda: ras.rasmph_pwr(f'{topo_off}.geo', f'{mli}.geo',
+                                    dem_size(dem_seg_par)[0]),
+             inputs=[f'{topo_off}.geo', f'{mli}.geo', dem_seg_par],
+             outputs=[f'{topo_off}.geo.bmp'], lazy=True)
+
+    if adf_filter:
+        def filter_intf() -> None:
+            # - Smooth the obtained interferogram with pg.adf
+            # - Adaptive interferogram filter using the power spectral
+            # - density.
+            dem_width = dem_size(dem_seg_par)[0]
+            pg.adf(topo_off, f'{topo_off}.filt', f'{topo_off}.filt.coh',
+                   dem_width)
+            # - Smooth Geocoded Interferogram
+            pg.adf(f'{topo_off}.geo', f'{topo_off}.geo.filt',
+                   f'{topo_off}.geo.filt.coh', dem_width)
+        pipe.add('filter', filter_intf,
+                 inputs=[topo_off, f'{topo_off}.geo', mli, f'{mli}.geo',
+                         dem_seg_par, intf_par],
+                 outputs=[f'{topo_off}.filt', f'{topo_off}.filt.coh',
+                          f'{topo_off}.geo.filt',
+                          f'{topo_off}.geo.filt.coh'], cores=n_threads,
+                 # - The two adf runs are sequential
+                 ram=lambda: max(
+                     raster_ram(intf_par, 2 * FCOMPLEX_BYTES + FLOAT_BYTES),
+                     raster_ram(intf_par, 0, dem_seg_par,
+                                2 * FCOMPLEX_BYTES + FLOAT_BYTES)))
+
+        # - Show filtered interferogram
+        pipe.add('filter_ql',
+                 lambda: ras.rasmph_pwr(f'{topo_off}.filt', mli,
+                                        interf_size(intf_par)[0]),
+                 inputs=[f'{topo_off}.filt', mli, intf_par],
+                 outputs=[f'{topo_off}.filt.bmp'], lazy=True)
+
+        # - Show filtered geocoded interferogram
+        pipe.add('geocode_filter_ql',
+                 lambda: ras.rasmph_pwr(f'{topo_off}.geo.filt', f'{mli}.geo',
+                                        dem_size(dem_seg_par)[0]),
+                 inputs=[f'{topo_off}.geo.filt', f'{mli}.geo', dem_seg_par],
+                 outputs=[f'{topo_off}.geo.filt.bmp'], lazy=True)
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+"""
+Lease-based job queue stored on a shared filesystem. Any number of worker
+processes, on any node that mounts the queue directory, can drain it - no
+batch scheduler is required.
+
+Queue layout - one JSON file per job:
+    queue.json      queue parameters (lease time, maximum attempts)
+    pending/        jobs waiting for a worker: <name>.json
+    leased/         jobs leased by a worker: <name>.json@<worker id>
+    done/           completed jobs with their result: <name>.json
+    failed/         jobs that failed max_attempts times: <name>.json
+
+All state transitions are single os.rename calls, atomic on POSIX and NFS
+filesystems: a job is leased by the worker that renames it from pending/
+to leased/ first. Workers renew their leases (heartbeat) by updating the
+modification time of the leased files. Leases not renewed for lease_time
+seconds - e.g. the worker node crashed - are returned to pending/ by any
+worker or waiting process. Lease expiry relies on the node clocks, so
+lease_time must be much longer than their skew.
+Temporary files are hidden (dot prefix) and never listed as jobs.
+"""
+# - Python Dependencies
+import os
+import json
+import time
+import socket
+from utils.executor import run_jobs
+
+# - Queue sub-directories
+QUEUE_STATES = ('pending', 'leased', 'done', 'failed')
+# - Default lease time [s]
+LEASE_TIME = 120.
+# - Default maximum number of attempts of a job
+MAX_ATTEMPTS = 2
+# - Default polling interval of the idle workers and waiting processes [s]
+QUEUE_POLL = 5.
+
+
+def _write_json(path: str, content: dict) -> None:
+    """
+    Atomically write a JSON file - hidden temporary file and rename
+    :param path: absolute path to the JSON file
+    :param content: file content
+    :return: None
+    """
+    tmp_name = f'.{os.path.basename(path)}.{socket.gethostname()}' \
+        f'.{os.getpid()}.tmp'
+    tmp_path = os.path.join(os.path.dirname(path), tmp_name)
+    with open(tmp_path, 'w', encoding='utf8') as fid:
+        json.dump(content, fid, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _list_jobs(queue_dir: str, state: str) -> list:
+    """
+    List the job files in a queue state
+    :param queue_dir: absolute path to the queue directory
+    :param state: queue state - see QUEUE_STATES
+    :return: sorted list of job file names
+    """
+    return sorted(f for f in os.listdir(os.path.join(queue_dir, state))
+                  if not f.startswith('.'))
+
+
+def init_queue(queue_dir: str, lease_time: float = LEASE_TIME,
+               max_attempts: int = MAX_ATTEMPTS) -> None:
+    """
+    Create the queue directory - an existing queue keeps its parameters
+    :param queue_dir: absolute path to the queue directory
+    :param lease_time: lease time [s]
+    :param max_attempts: maximum number of attempts of a job
+    :return: None
+    """
+    for state in QUEUE_STATES:
+        os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+    if not os.path.isfile(os.path.join(queue_dir, 'queue.json')):
+        _write_json(os.path.join(queue_dir, 'queue.json'),
+                    {'lease_time': lease_time,
+                     'max_attempts': max_attempts})
+
+
+def queue_config(queue_dir: str) -> dict:
+    """
+    Read the queue parameters
+    :param queue_dir: absolute path to the queue directory
+    :return: Python dictionary containing the queue parameters
+    """
+    with open(os.path.join(queue_dir, 'queue.json'), 'r',
+              encoding='utf8') as fid:
+        return json.load(fid)
+
+
+def submit_jobs(queue_dir: str, jobs: list) -> None:
+    """
+    Add jobs to the queue. Previous results of jobs with the same name
+    are removed, so that resubmitted jobs are run again.
+    :param queue_dir: absolute path to the queue directory
+    :param jobs: list of jobs - see executor.run_jobs. The working
+                 directory (cwd) must be an absolute path visible from
+                 all the worker nodes.
+    :return: None
+    """
+    for job in jobs:
+        f_name = f"{job['name']}.json"
+        for state in ('done', 'failed'):
+            if os.path.isfile(os.path.join(queue_dir, state, f_name)):
+                os.remove(os.path.join(queue_dir, state, f_name))
+        _write_json(os.path.join(queue_dir, 'pending', f_name),
+                    {**job, 'queue_attempt': 1})
+
+
+def claim_job(queue_dir: str, worker_id: str) -> dict:
+    """
+    Lease the first pending job
+    :param queue_dir: absolute path to the queue directory
+    :param worker_id: worker identifier
+    :return: leased job - the lease file path is stored in 'lease'.
+             None if no job is pending.
+    """
+    for f_name in _list_jobs(queue_dir, 'pending'):
+        pending_path = os.path.join(queue_dir, 'pending', f_name)
+        lease_path = os.path.join(queue_dir, 'leased',
+                                  f'{f_name}@{worker_id}')
+        try:
+            # - The lease starts now - not at the submission time. Touched
+            # - before the rename: a lease file carrying the submission time
+            # - would be reaped at once by the other workers
+            os.utime(pending_path)
+            os.rename(pending_path, lease_path)
+            with open(lease_path, 'r', encoding='utf8') as fid:
+                return {**json.load(fid), 'lease': lease_path}
+        except FileNotFoundError:
+            # - Leased by another worker - or the lease was lost
+            continue
+    return None
+
+
+def renew_lease(lease_path: str) -> bool:
+    """
+    Renew a lease - heartbeat
+    :param lease_path: absolute path to the lease file
+    :return: False if the lease has been lost (expired and reclaimed)
+    """
+    try:
+        os.utime(lease_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def complete_job(queue_dir: str, job: dict, result: dict,
+                 worker_id: str) -> bool:
+    """
+    Release a leased job: failed jobs are returned to pending/ until
+    max_attempts is reached, the others are moved to done/ or failed/
+    together with their result.
+    :param queue_dir: absolute path to the queue directory
+    :param job: leased job - see claim_job
+    :param result: job result - see executor.run_jobs
+    :param worker_id: worker identifier
+    :return: False if the lease had been lost
+    """
+    f_name = f"{job['name']}.json"
+    max_attempts = queue_config(queue_dir)['max_attempts']
+    if result['returncode'] == 0:
+        state = 'done'
+    elif job['queue_attempt'] < max_attempts:
+        state = 'pending'
+    else:
+        state = 'failed'
+    # - Take the lease file out of leased/ before writing the result
+    tmp_path = os.path.join(queue_dir, state, f'.{f_name}.{worker_id}')
+    try:
+        os.rename(job['lease'], tmp_path)
+    except FileNotFoundError:
+        return False
+    content = {k: v for k, v in job.items() if k != 'lease'}
+    if state == 'pending':
+        content['queue_attempt'] += 1
+    else:
+        content['result'] = {**result, 'attempts': job['queue_attempt'],
+                             'worker': worker_id}
+    with open(tmp_path, 'w', encoding='utf8') as fid:
+        json.dump(content, fid, indent=1)
+    os.rename(tmp_path, os.path.join(queue_dir, state, f_name))
+    return True
+
+
+def reap_expired(queue_dir: str) -> list:
+    """
+    Return the expired leases to pending/ - the jobs of crashed workers
+    :param queue_dir: absolute path to the queue directory
+    :return: list of names of the reaped jobs
+    """
+    lease_time = queue_config(queue_dir)['lease_time']
+    reaped = []
+    for l_name in _list_jobs(queue_dir, 'leased'):
+        lease_path = os.path.join(queue_dir, 'leased', l_name)
+        try:
+            expired = time.time() - os.stat(lease_path).st_mtime \
+                > lease_time
+            if expired:
+                os.rename(lease_path, os.path.join(
+                    queue_dir, 'pending', l_name.rsplit('@', 1)[0]))
+                reaped.append(l_name.rsplit('.json@', 1)[0])
+        except FileNotFoundError:
+            # - Released or reaped by another process
+            continue
+    return reaped
+
+
+def queue_status(queue_dir: str) -> dict:
+    """
+    Number of jobs in each queue state
+    :param queue_dir: absolute path to the queue directory
+    :return: Python dictionary containing the number of jobs per state
+    """
+    return {state: len(_list_jobs(queue_dir, state))
+            for state in QUEUE_STATES}
+
+
+def queue_complete(queue_dir: str) -> bool:
+    """
+    Check if all the jobs of the queue have terminated
+    :param queue_dir: absolute path to the queue directory
+    :return: True if no job is pending or leased
+    """
+    # - Hidden files in pending/ are jobs being returned by a worker
+    return not any(os.listdir(os.path.join(queue_dir, state))
+                   for state in ('pending', 'leased'))
+
+
+def queue_results(queue_dir: str) -> dict:
+    """
+    Results of the terminated jobs
+    :param queue_dir: absolute path to the queue directory
+    :return: Python dictionary containing the result of each job - see
+             executor.run_jobs
+    """
+    results = {}
+    for state in ('done', 'failed'):
+        for f_name in _list_jobs(queue_dir, state):
+            with open(os.path.join(queue_dir, state, f_name), 'r',
+                      encoding='utf8') as fid:
+                job = json.load(fid)
+            results[job['name']] = job['result']
+    return results
+
+
+def wait_queue(queue_dir: str, poll: float = QUEUE_POLL,
+               timeout: float = None) -> dict:
+    """
+    Wait for all the jobs of the queue to terminate. Expired leases are
+    reaped while waiting.
+    :param queue_dir: absolute path to the queue directory
+    :param poll: polling interval [s]
+    :param timeout: maximum waiting time [s] - def. None, no limit
+    :return: queue status - see queue_status
+    """
+    t_start = time.monotonic()
+    while True:
+        reap_expired(queue_dir)
+        if queue_complete(queue_dir):
+            return queue_status(queue_dir)
+        if timeout is not None and time.monotonic() - t_start > timeout:
+            raise TimeoutError(f'# - Queue not completed: {queue_dir} - '
+                               f'{queue_status(queue_dir)}')
+        time.sleep(poll)
+
+
+def queue_worker(queue_dir: str, n_proc: int = 1, log_dir: str = None,
+                 timeout: float = None, poll: float = QUEUE_POLL,
+                 exit_when_idle: bool = False, worker_id: str = None,
+                 **kwargs) -> dict:
+    """
+    Drain the queue running at most n_proc jobs at a time. The leases of
+    the running jobs are renewed every lease_time / 4 seconds; jobs whose
+    lease has been lost are killed.
+    :param queue_dir: absolute path to the queue directory
+    :param n_proc: number of concurrent jobs
+    :param log_dir: directory of the per-job log files
+                    [def. None - queue_dir/logs]
+    :param timeout: per-job wall-time limit [s] - def. None, no limit
+    :param poll: polling interval while waiting for jobs [s]
+    :param exit_when_idle: return as soon as no job is pending, instead of
+                           waiting for all the queue jobs to terminate
+    :param worker_id: worker identifier [def. <hostname>-<pid>]
+    :param kwargs: other executor.run_jobs parameters (e.g. affinity)
+    :return: Python dictionary containing the result of each job run by
+             this worker - see executor.run_jobs
+    """
+    if worker_id is None:
+        worker_id = f'{socket.gethostname()}-{os.getpid()}'
+    if log_dir is None:
+        log_dir = os.path.join(queue_dir, 'logs')
+    heartbeat = queue_config(queue_dir)['lease_time'] / 4.
+    leases = {}
+
+    def feed():
+        job = claim_job(queue_dir, worker_id)
+        if job is not None:
+            leases[job['name']] = {'job': job, 'beat': time.monotonic()}
+        return job
+
+    def on_poll(names):
+        lost = []
+        for name in names:
+            lease = leases[name]
+            if time.monotonic() - lease['beat'] > heartbeat:
+                if not renew_lease(lease['job']['lease']):
+                    lost.append(name)
+                lease['beat'] = time.monotonic()
+        return lost
+
+    def callback(name, result):
+        lease = leases.pop(name)
+        if not result['cancelled'] \
+                and not complete_job(queue_dir, lease['job'], result,
+                                     worker_id):
+            print(f'# - {worker_id}: lease lost - {name}')
+
+    results = {}
+    while True:
+        reap_expired(queue_dir)
+        results.update(run_jobs([], max_workers=n_proc, timeout=timeout,
+                                log_dir=log_dir, feed=feed,
+                                on_poll=on_poll, callback=callback,
+                                **kwargs))
+        if queue_complete(queue_dir):
+            break
+        if exit_when_idle and not _list_jobs(queue_dir, 'pending'):
+            break
+        time.sleep(poll)
+    return results
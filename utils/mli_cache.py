@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+Per-SLC cache of the multi-looked intensity (MLI) images. In a stack each
+acquisition appears in many pairs: its MLI is computed by the first pair
+and reused by the following ones.
+The cache key is a hash of the fingerprints of the SLC and of its
+parameter file (see utils.pipeline.fingerprint) and of the look factors.
+Products are returned as hard links - see utils.product_cache.
+"""
+# - Python Dependencies
+import json
+import hashlib
+# - GAMMA's Python integration with the py_gamma module
+import py_gamma as pg
+from utils.pipeline import fingerprint
+from utils.product_cache import cached_call
+
+
+def mli_key(slc_path: str, par_path: str, rlks: int, azlks: int) -> str:
+    """
+    Cache key of a multi-looked intensity image
+    :param slc_path: absolute path to the SLC
+    :param par_path: absolute path to the SLC parameter file
+    :param rlks: number of range looks
+    :param azlks: number of azimuth looks
+    :return: cache key
+    """
+    key = {'slc': fingerprint(slc_path), 'par': fingerprint(par_path),
+           'rlks': rlks, 'azlks': azlks}
+    return hashlib.sha256(json.dumps(key, sort_keys=True)
+                          .encode('utf8')).hexdigest()
+
+
+def multi_look(slc_path: str, par_path: str, mli_path: str,
+               mli_par_path: str, rlks: int, azlks: int,
+               cache_dir: str = None) -> bool:
+    """
+    Calculate a multi-looked intensity image (GAMMA - multi_look) or link
+    it from the cache
+    :param slc_path: absolute path to the SLC
+    :param par_path: absolute path to the SLC parameter file
+    :param mli_path: absolute path to the output MLI
+    :param mli_par_path: absolute path to the output MLI parameter file
+    :param rlks: number of range looks
+    :param azlks: number of azimuth looks
+    :param cache_dir: absolute path to the cache directory [def. None -
+                      the MLI is always computed]
+    :return: True if the MLI was found in the cache
+    """
+    return cached_call(cache_dir, mli_key(slc_path, par_path, rlks, azlks),
+                       [mli_path, mli_par_path],
+                       lambda: pg.multi_look(slc_path, par_path, mli_path,
+                                             mli_par_path, rlks, azlks),
+                       label='MLI cache')
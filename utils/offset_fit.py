@@ -0,0 +1,482 @@
+#!/usr/bin/env python
+"""
+Weighted least-squares estimation of the range and azimuth offset
+polynomials and subtraction of the fitted polynomials from an offsets map.
+
+NumPy implementation of GAMMA's offset_fit/offset_sub. Polynomial
+coefficients follow GAMMA's convention:
+    npoly = 1: a0
+    npoly = 3: a0 + a1*x + a2*y
+    npoly = 4: a0 + a1*x + a2*y + a3*x*y
+    npoly = 6: a0 + a1*x + a2*y + a3*x*y + a4*x^2 + a5*y^2
+with x the range sample and y the azimuth line of the reference SLC.
+"""
+# - Python Dependencies
+import numpy as np
+
+# - Powers of (x, y) associated with each polynomial coefficient
+POLY_TERMS = ((0, 0), (1, 0), (0, 1), (1, 1), (2, 0), (0, 2))
+
+
+def poly_design(x: np.ndarray, y: np.ndarray, npoly: int = 3,
+                x_scale: float = 1., y_scale: float = 1.) -> np.ndarray:
+    """
+    Polynomial design matrix evaluated at the selected coordinates
+    :param x: range coordinates [numpy ndarray - 1D]
+    :param y: azimuth coordinates [numpy ndarray - 1D]
+    :param npoly: number of polynomial coefficients [1, 3, 4, 6]
+    :param x_scale: range coordinates normalization factor
+    :param y_scale: azimuth coordinates normalization factor
+    :return: design matrix [len(x), npoly]
+    """
+    if npoly not in (1, 3, 4, 6):
+        raise ValueError(f'# - Invalid number of polynomial '
+                         f'coefficients: {npoly}. Must be 1, 3, 4 or 6.')
+    xn = np.asarray(x, dtype=np.float64) / x_scale
+    yn = np.asarray(y, dtype=np.float64) / y_scale
+    return np.stack([xn ** px * yn ** py
+                     for px, py in POLY_TERMS[:npoly]], axis=1)
+
+
+def offset_grid(off_shape: tuple, x_start: int, rgsp: int,
+                y_start: int, azsp: int) -> tuple:
+    """
+    Range and azimuth coordinates of the offsets map nodes
+    :param off_shape: offsets map shape [nrec, npix]
+    :param x_start: offsets starting range [pixels]
+    :param rgsp: offsets range spacing [pixels]
+    :param y_start: offsets starting azimuth [pixels]
+    :param azsp: offsets azimuth spacing [pixels]
+    :return: range coordinates [1, npix], azimuth coordinates [nrec, 1]
+    """
+    n_rec, n_pix = off_shape
+    x = x_start + np.arange(n_pix, dtype=np.float64)[np.newaxis, :] * rgsp
+    y = y_start + np.arange(n_rec, dtype=np.float64)[:, np.newaxis] * azsp
+    return x, y
+
+
+def eval_offset_poly(coeff: np.ndarray, x: np.ndarray,
+                     y: np.ndarray) -> np.ndarray:
+    """
+    Evaluate an offset polynomial - GAMMA coefficient convention
+    :param coeff: polynomial coefficients
+    :param x: range coordinates (broadcastable with y)
+    :param y: azimuth coordinates (broadcastable with x)
+    :return: polynomial values
+    """
+    poly = np.zeros(np.broadcast(x, y).shape, dtype=np.float64)
+    for c, (px, py) in zip(coeff, POLY_TERMS):
+        if c != 0:
+            poly += c * x ** px * y ** py
+    return poly
+
+
+def solve_poly(ata: np.ndarray, atb: np.ndarray,
+               x_scale: float, y_scale: float, npoly: int) -> np.ndarray:
+    """
+    Solve the (normalized) normal equations and return the polynomial
+    coefficients expressed in pixel coordinates.
+    :param ata: normal matrix [npoly, npoly]
+    :param atb: right-hand side [npoly] or [npoly, k]
+    :param x_scale: range coordinates normalization factor
+    :param y_scale: azimuth coordinates normalization factor
+    :param npoly: number of polynomial coefficients
+    :return: polynomial coefficients
+    """
+    coeff = np.linalg.lstsq(ata, atb, rcond=None)[0]
+    scale = np.array([x_scale ** px * y_scale ** py
+                      for px, py in POLY_TERMS[:npoly]])
+    if coeff.ndim == 2:
+        scale = scale[:, np.newaxis]
+    return coeff / scale
+
+
+def fit_nodes(off_map: np.ndarray, weights: np.ndarray,
+              x_start: int, rgsp: int, y_start: int, azsp: int,
+              npoly: int = 3, thresh: float = 0.) -> dict:
+    """
+    Extract the offsets map nodes used in the polynomial fit
+    :param off_map: complex offsets map [numpy ndarray - complex]
+    :param weights: fit weights - cross-correlation or SNR
+    :param x_start: offsets starting range [pixels]
+    :param rgsp: offsets range spacing [pixels]
+    :param y_start: offsets starting azimuth [pixels]
+    :param azsp: offsets azimuth spacing [pixels]
+    :param npoly: number of polynomial coefficients [1, 3, 4, 6]
+    :param thresh: minimum weight of the offsets used in the fit
+    :return: Python dictionary containing the fit mask, the nodes
+             coordinates, weights and observations.
+    """
+    # - Nodes used in the fit: valid offsets above the weight threshold
+    mask = ((weights > thresh) & np.isfinite(weights)
+            & np.isfinite(off_map) & (off_map.real != 0)
+            & (off_map.imag != 0))
+    n_valid = int(np.count_nonzero(mask))
+    if n_valid < npoly:
+        raise ValueError(f'# - Too few valid offsets ({n_valid}) to '
+                         f'estimate a {npoly} coefficients polynomial.')
+
+    # - Node coordinates
+    row_ind, col_ind = np.nonzero(mask)
+    x = x_start + col_ind * float(rgsp)
+    y = y_start + row_ind * float(azsp)
+    return {'mask': mask, 'x': x, 'y': y,
+            'x_scale': max(float(np.abs(x).max()), 1.),
+            'y_scale': max(float(np.abs(y).max()), 1.),
+            'w': weights[mask].astype(np.float64),
+            'obs': np.stack([off_map.real[mask], off_map.imag[mask]],
+                            axis=1).astype(np.float64)}
+
+
+def normal_equations(nodes: dict, w: np.ndarray, npoly: int = 3,
+                     block_size: int = 2 ** 20) -> tuple:
+    """
+    Accumulate the weighted normal equations block by block so that the
+    full design matrix is never allocated.
+    :param nodes: fit nodes - see fit_nodes
+    :param w: fit weights of each node
+    :param npoly: number of polynomial coefficients [1, 3, 4, 6]
+    :param block_size: number of nodes processed per block
+    :return: normal matrix [npoly, npoly], right-hand side [npoly, 2]
+    """
+    ata = np.zeros((npoly, npoly))
+    atb = np.zeros((npoly, nodes['obs'].shape[1]))
+    for b_start in range(0, len(w), block_size):
+        blk = slice(b_start, b_start + block_size)
+        a_mat = poly_design(nodes['x'][blk], nodes['y'][blk], npoly=npoly,
+                            x_scale=nodes['x_scale'],
+                            y_scale=nodes['y_scale'])
+        aw_mat = a_mat * w[blk, np.newaxis]
+        ata += aw_mat.T @ a_mat
+        atb += aw_mat.T @ nodes['obs'][blk]
+    return ata, atb
+
+
+def poly_residuals(nodes: dict, coeff: np.ndarray) -> np.ndarray:
+    """
+    Range and azimuth residuals of the fit nodes
+    :param nodes: fit nodes - see fit_nodes
+    :param coeff: polynomial coefficients [npoly, 2]
+    :return: fit residuals [n_nodes, 2]
+    """
+    return nodes['obs'] - np.stack(
+        [eval_offset_poly(coeff[:, 0], nodes['x'], nodes['y']),
+         eval_offset_poly(coeff[:, 1], nodes['x'], nodes['y'])], axis=1)
+
+
+def offset_fit(off_map: np.ndarray, weights: np.ndarray,
+               x_start: int, rgsp: int, y_start: int, azsp: int,
+               npoly: int = 3, thresh: float = 0.) -> dict:
+    """
+    Range and azimuth offset polynomial estimation by weighted least squares
+    :param off_map: complex offsets map [numpy ndarray - complex]
+    :param weights: fit weights - cross-correlation or SNR
+    :param x_start: offsets starting range [pixels]
+    :param rgsp: offsets range spacing [pixels]
+    :param y_start: offsets starting azimuth [pixels]
+    :param azsp: offsets azimuth spacing [pixels]
+    :param npoly: number of polynomial coefficients [1, 3, 4, 6]
+    :param thresh: minimum weight of the offsets used in the fit
+    :return: Python dictionary containing the range (xoff) and azimuth (yoff)
+             polynomial coefficients, the mask of the nodes used in the fit
+             and the fit residuals standard deviation.
+    """
+    nodes = fit_nodes(off_map, weights, x_start, rgsp, y_start, azsp,
+                      npoly=npoly, thresh=thresh)
+    # - Weighted normal equations - solved for both offset components
+    ata, atb = normal_equations(nodes, nodes['w'], npoly=npoly)
+    coeff = solve_poly(ata, atb, nodes['x_scale'], nodes['y_scale'], npoly)
+
+    # - Fit residuals standard deviation
+    res = poly_residuals(nodes, coeff)
+    return {'xoff': coeff[:, 0], 'yoff': coeff[:, 1], 'mask': nodes['mask'],
+            'x_std': float(np.std(res[:, 0])),
+            'y_std': float(np.std(res[:, 1]))}
+
+
+def robust_scale(res: np.ndarray) -> np.ndarray:
+    """
+    Robust standard deviation of the fit residuals (normalized MAD)
+    :param res: fit residuals [n_nodes, 2]
+    :return: residuals scale for each offset component
+    """
+    mad = np.median(np.abs(res - np.median(res, axis=0)), axis=0)
+    return np.maximum(1.4826 * mad, np.finfo(np.float64).eps)
+
+
+def irls_weights(u_res: np.ndarray, method: str) -> np.ndarray:
+    """
+    IRLS robust weights
+    :param u_res: residuals normalized by scale and tuning constant
+    :param method: weight function [huber, tukey]
+    :return: robust weights
+    """
+    if method == 'huber':
+        return np.minimum(1., 1. / np.maximum(u_res, 1e-12))
+    return np.where(u_res < 1., (1. - u_res ** 2) ** 2, 0.)
+
+
+def irls_pass(nodes: dict, coeff_n: np.ndarray, scale: np.ndarray,
+              c_tune: float, method: str, npoly: int = 3,
+              block_size: int = 2 ** 20) -> tuple:
+    """
+    One IRLS iteration in a single pass over the nodes: the residuals of
+    the current model, the robust weights and the weighted normal
+    equations are computed block by block - see normal_equations.
+    :param nodes: fit nodes - see fit_nodes
+    :param coeff_n: polynomial coefficients in normalized coordinates
+                    [npoly, 2]
+    :param scale: residuals scale for each offset component
+    :param c_tune: IRLS tuning constant
+    :param method: weight function [huber, tukey]
+    :param npoly: number of polynomial coefficients [1, 3, 4, 6]
+    :param block_size: number of nodes processed per block
+    :return: normal matrix [npoly, npoly], right-hand side [npoly, 2],
+             normalized residuals [n_nodes], robust weights [n_nodes]
+    """
+    n_nodes = len(nodes['w'])
+    ata = np.zeros((npoly, npoly))
+    atb = np.zeros((npoly, nodes['obs'].shape[1]))
+    u_res = np.empty(n_nodes)
+    w_rob = np.empty(n_nodes)
+    for b_start in range(0, n_nodes, block_size):
+        blk = slice(b_start, b_start + block_size)
+        a_mat = poly_design(nodes['x'][blk], nodes['y'][blk], npoly=npoly,
+                            x_scale=nodes['x_scale'],
+                            y_scale=nodes['y_scale'])
+        # - Joint normalized residual of the two offset components
+        res = (nodes['obs'][blk] - a_mat @ coeff_n) / scale
+        u_res[blk] = np.hypot(res[:, 0], res[:, 1]) / c_tune
+        w_rob[blk] = irls_weights(u_res[blk], method)
+        aw_mat = a_mat * (nodes['w'][blk] * w_rob[blk])[:, np.newaxis]
+        ata += aw_mat.T @ a_mat
+        atb += aw_mat.T @ nodes['obs'][blk]
+    return ata, atb, u_res, w_rob
+
+
+def robust_offset_fit(off_map: np.ndarray, weights: np.ndarray,
+                      x_start: int, rgsp: int, y_start: int, azsp: int,
+                      npoly: int = 3, thresh: float = 0.,
+                      method: str = 'huber', c_tune: float = None,
+                      max_iter: int = 5, w_tol: float = 0.01,
+                      n_sample: int = 20000, n_trials: int = 200,
+                      ransac_thresh: float = None, seed: int = 0) -> dict:
+    """
+    Robust range and azimuth offset polynomial estimation.
+    Offsets over fast-moving areas (e.g. the glacier itself) are treated
+    as outliers and down-weighted, so that no manual masking is needed.
+    methods:
+        huber/tukey - Iteratively Reweighted Least Squares (IRLS) with
+                      Huber or Tukey bi-square weights. Residuals are
+                      normalized by their MAD-based scale, estimated on a
+                      subsample of the nodes. The iterations start on the
+                      subsample; each iteration on all the nodes is a
+                      single pass (see irls_pass). Iterations stop when
+                      the robust weights change by less than w_tol.
+        ransac - RANSAC (least median of squares) on a random subsample
+                 of the nodes followed by a weighted least squares refit
+                 on all the inliers. The inlier threshold is scaled from
+                 the MAD of the residuals of the best model.
+    :param off_map: complex offsets map [numpy ndarray - complex]
+    :param weights: fit weights - cross-correlation or SNR
+    :param x_start: offsets starting range [pixels]
+    :param rgsp: offsets range spacing [pixels]
+    :param y_start: offsets starting azimuth [pixels]
+    :param azsp: offsets azimuth spacing [pixels]
+    :param npoly: number of polynomial coefficients [1, 3, 4, 6]
+    :param thresh: minimum weight of the offsets used in the fit
+    :param method: robust estimation method [huber, tukey, ransac]
+    :param c_tune: IRLS tuning constant [def. 1.345 Huber, 4.685 Tukey]
+    :param max_iter: maximum number of IRLS iterations
+    :param w_tol: IRLS convergence tolerance - mean change of the
+                  robust weights between two iterations
+    :param n_sample: number of nodes sampled by RANSAC and by the IRLS
+                     scale estimate
+    :param n_trials: number of RANSAC trials
+    :param ransac_thresh: RANSAC inlier threshold [pixels] - def. None:
+                          2.5 times the robust residuals scale
+    :param seed: random number generator seed
+    :return: Python dictionary containing the range (xoff) and azimuth (yoff)
+             polynomial coefficients, the mask of the nodes used in the fit,
+             the inliers mask and the inliers residuals standard deviation.
+    """
+    nodes = fit_nodes(off_map, weights, x_start, rgsp, y_start, azsp,
+                      npoly=npoly, thresh=thresh)
+    x_scale = nodes['x_scale']
+    y_scale = nodes['y_scale']
+    w_fit = nodes['w']
+    rng = np.random.default_rng(seed)
+    n_nodes = len(w_fit)
+    s_ind = rng.choice(n_nodes, size=min(n_sample, n_nodes), replace=False)
+    a_smp = poly_design(nodes['x'][s_ind], nodes['y'][s_ind], npoly=npoly,
+                        x_scale=x_scale, y_scale=y_scale)
+    obs_smp = nodes['obs'][s_ind]
+
+    if method in ('huber', 'tukey'):
+        if c_tune is None:
+            c_tune = 1.345 if method == 'huber' else 4.685
+        # - Initial solution - IRLS on the subsample of the nodes
+        w_smp = w_fit[s_ind]
+        w_rob = np.ones(len(s_ind))
+        for _ in range(4 * max_iter):
+            aw_smp = a_smp * (w_smp * w_rob)[:, np.newaxis]
+            coeff_n = np.linalg.lstsq(aw_smp.T @ a_smp, aw_smp.T @ obs_smp,
+                                      rcond=None)[0]
+            res = obs_smp - a_smp @ coeff_n
+            w_new = irls_weights(np.hypot(*(res / robust_scale(res)).T)
+                                 / c_tune, method)
+            if np.abs(w_new - w_rob).mean() < w_tol / 10.:
+                break
+            w_rob = w_new
+        # - IRLS on all the nodes - stopped when the robust weights no
+        # - longer change
+        w_prev = None
+        for _ in range(max_iter):
+            scale = robust_scale(obs_smp - a_smp @ coeff_n)
+            ata, atb, u_res, w_rob = irls_pass(nodes, coeff_n, scale,
+                                               c_tune, method, npoly=npoly)
+            coeff_n = np.linalg.lstsq(ata, atb, rcond=None)[0]
+            if w_prev is not None \
+                    and np.abs(w_rob - w_prev).mean() < w_tol:
+                break
+            w_prev = w_rob
+        coeff = solve_poly(ata, atb, x_scale, y_scale, npoly)
+        # - Huber: inliers within 2.5 tuning constants (~3.4 sigma)
+        inl = u_res < (1. if method == 'tukey' else 2.5)
+
+    elif method == 'ransac':
+        # - Candidate models estimated from minimal random subsets - the
+        # - model with the least median residual is selected
+        best_med = np.inf
+        best_res = None
+        m_size = max(2 * npoly, npoly + 1)
+        for _ in range(n_trials):
+            t_ind = rng.choice(len(s_ind), size=min(m_size, len(s_ind)),
+                               replace=False)
+            c_trial = np.linalg.lstsq(a_smp[t_ind], obs_smp[t_ind],
+                                      rcond=None)[0]
+            r_trial = np.hypot(*(obs_smp - a_smp @ c_trial).T)
+            med = np.median(r_trial)
+            if med < best_med:
+                best_med = med
+                best_res = r_trial
+        # - Inlier threshold - robust scale of the best model residuals
+        if ransac_thresh is None:
+            sigma = 1.4826 * (1. + 5. / max(len(s_ind) - npoly, 1)) \
+                * best_med
+            ransac_thresh = max(2.5 * sigma, np.finfo(np.float64).eps)
+        best_inl = best_res < ransac_thresh
+        # - Consensus model - refit on the subsample inliers
+        c_best = solve_poly(a_smp[best_inl].T @ a_smp[best_inl],
+                            a_smp[best_inl].T @ obs_smp[best_inl],
+                            x_scale, y_scale, npoly)
+        # - Final weighted least squares refit on all the inliers
+        inl = np.hypot(*poly_residuals(nodes, c_best).T) < ransac_thresh
+        if np.count_nonzero(inl) < npoly:
+            raise ValueError('# - RANSAC: too few inliers found.')
+        coeff = solve_poly(*normal_equations(nodes, w_fit * inl,
+                                             npoly=npoly),
+                           x_scale, y_scale, npoly)
+    else:
+        raise ValueError(f'# - Unknown robust fit method: {method}')
+
+    # - Inliers mask on the offsets grid
+    res = poly_residuals(nodes, coeff)
+    inliers = np.zeros(nodes['mask'].shape, dtype=bool)
+    inliers[nodes['mask']] = inl
+    return {'xoff': coeff[:, 0], 'yoff': coeff[:, 1], 'mask': nodes['mask'],
+            'inliers': inliers,
+            'x_std': float(np.std(res[inl, 0])),
+            'y_std': float(np.std(res[inl, 1]))}
+
+
+def offset_sub(off_map: np.ndarray, xoff: np.ndarray, yoff: np.ndarray,
+               x_start: int, rgsp: int, y_start: int,
+               azsp: int) -> np.ndarray:
+    """
+    Subtract the range and azimuth offset polynomials from the offsets map.
+    NoData offsets (zero) are left unchanged.
+    :param off_map: complex offsets map [numpy ndarray - complex]
+    :param xoff: range offset polynomial coefficients
+    :param yoff: azimuth offset polynomial coefficients
+    :param x_start: offsets starting range [pixels]
+    :param rgsp: offsets range spacing [pixels]
+    :param y_start: offsets starting azimuth [pixels]
+    :param azsp: offsets azimuth spacing [pixels]
+    :return: offsets residuals [numpy ndarray - complex64]
+    """
+    x, y = offset_grid(off_map.shape, x_start, rgsp, y_start, azsp)
+    off_res = (off_map - eval_offset_poly(xoff, x, y)
+               - 1j * eval_offset_poly(yoff, x, y)).astype(np.complex64)
+    off_res[off_map == 0] = 0
+    return off_res
+
+
+def poly_to_par(coeff: np.ndarray) -> list:
+    """
+    Format polynomial coefficients as a GAMMA parameter file entry
+    (six coefficients, zero padded).
+    :param coeff: polynomial coefficients
+    :return: list of formatted coefficients
+    """
+    coeff_par = np.zeros(6)
+    coeff_par[:len(coeff)] = coeff
+    return [f'{c:.5e}' for c in coeff_par]
+
+
+def par_value(off_par, key: str):
+    """
+    Return the first value associated with a parameter file keyword
+    :param off_par: parameter file [py_gamma ParFile]
+    :param key: parameter file keyword
+    :return: keyword value
+    """
+    value = off_par.par_dict[key]
+    if isinstance(value, (list, tuple)):
+        value = value[0]
+    return value
+
+
+def offset_fit_par(off_map: np.ndarray, weights: np.ndarray, off_par,
+                   npoly: int = 3, thresh: float = None,
+                   method: str = 'wls') -> np.ndarray:
+    """
+    Fit and subtract the offset polynomials using the geometry stored in
+    the offsets parameter file. The range_offset_polynomial and
+    azimuth_offset_polynomial entries of the in-memory parameter file are
+    updated with the estimated coefficients.
+    :param off_map: complex offsets map [numpy ndarray - complex]
+    :param weights: fit weights - cross-correlation or SNR
+    :param off_par: offsets parameter file [py_gamma ParFile]
+    :param npoly: number of polynomial coefficients [1, 3, 4, 6]
+    :param thresh: minimum fit weight [def. offset_estimation_threshhold]
+    :param method: fit method [wls, huber, tukey, ransac]
+    :return: offsets residuals [numpy ndarray - complex64]
+    """
+    x_start = int(par_value(off_par, 'offset_estimation_starting_range'))
+    y_start = int(par_value(off_par, 'offset_estimation_starting_azimuth'))
+    rgsp = int(par_value(off_par, 'offset_estimation_range_spacing'))
+    azsp = int(par_value(off_par, 'offset_estimation_azimuth_spacing'))
+    if thresh is None:
+        thresh = float(par_value(off_par, 'offset_estimation_threshhold'))
+
+    if method == 'wls':
+        fit = offset_fit(off_map, weights, x_start, rgsp, y_start, azsp,
+                         npoly=npoly, thresh=thresh)
+    else:
+        fit = robust_offset_fit(off_map, weights, x_start, rgsp,
+                                y_start, azsp, npoly=npoly, thresh=thresh,
+                                method=method)
+    print(f'# - Offsets used in the fit: {np.count_nonzero(fit["mask"])}')
+    if 'inliers' in fit:
+        print(f'# - Inliers ({method}): '
+              f'{np.count_nonzero(fit["inliers"])}')
+    print(f'# - Final model fit std. dev. (samples) range: '
+          f'{fit["x_std"]:.4f}  azimuth: {fit["y_std"]:.4f}')
+
+    # - Update the in-memory parameter file
+    off_par.set_value('range_offset_polynomial', poly_to_par(fit['xoff']))
+    off_par.set_value('azimuth_offset_polynomial', poly_to_par(fit['yoff']))
+
+    return offset_sub(off_map, fit['xoff'], fit['yoff'],
+                      x_start, rgsp, y_start, azsp)
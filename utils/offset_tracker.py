@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+"""
+Native amplitude offset tracking - FFT cross-correlation of detected SLC
+chips. Together with the range and azimuth offsets and the normalized
+cross-correlation peak (CCP), the tracker returns per-node quality
+surfaces computed from the correlation surface it already holds:
+    - snr: correlation peak over the mean correlation (GAMMA definition)
+    - ptsr: peak-to-second-peak ratio
+    - sig_x/sig_y: range/azimuth offset standard deviation derived from
+      the peak curvature [pixels]
+    - vfrac: fraction of valid (non-zero) pixels in the chip
+"""
+# - Python Dependencies
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy import fft
+from utils.cpu_affinity import ThreadPinner
+
+# - Quality bands written next to the offsets map: {offmap}.{band}
+QUALITY_BANDS = ('ptsr', 'sigx', 'sigy', 'vfrac')
+# - Per-node tracker outputs
+TRACKER_KEYS = ('ccp', 'snr', 'ptsr', 'sig_x', 'sig_y', 'vfrac')
+# - SLC block margin used by the FFT oversampling [pixels]
+OVS_MARGIN = 16
+
+
+def slc_memmap(slc_path: str, width: int,
+               image_format: str = 'FCOMPLEX') -> np.memmap:
+    """
+    Memory-map a GAMMA SLC (big-endian) without loading it
+    :param slc_path: absolute path to the SLC
+    :param width: SLC range samples
+    :param image_format: GAMMA image format [FCOMPLEX, SCOMPLEX]
+    :return: memory-mapped SLC [lines, width] or [lines, width, 2]
+    """
+    if image_format == 'FCOMPLEX':
+        slc = np.memmap(slc_path, dtype='>c8', mode='r')
+        return slc.reshape(-1, width)
+    if image_format == 'SCOMPLEX':
+        slc = np.memmap(slc_path, dtype='>i2', mode='r')
+        return slc.reshape(-1, width, 2)
+    raise ValueError(f'# - Unsupported SLC image format: {image_format}')
+
+
+def read_block(slc: np.memmap, y_start: int, n_rows: int,
+               x_start: int, n_cols: int) -> np.ndarray:
+    """
+    Read an SLC block. Samples outside the SLC are set to 0.
+    :param slc: memory-mapped SLC - see slc_memmap
+    :param y_start: first azimuth line
+    :param n_rows: number of azimuth lines
+    :param x_start: first range sample
+    :param n_cols: number of range samples
+    :return: SLC block [numpy ndarray - complex64]
+    """
+    blk = np.zeros((n_rows, n_cols), dtype=np.complex64)
+    ys0, ys1 = max(y_start, 0), min(y_start + n_rows, slc.shape[0])
+    xs0, xs1 = max(x_start, 0), min(x_start + n_cols, slc.shape[1])
+    if ys1 <= ys0 or xs1 <= xs0:
+        return blk
+    if slc.ndim == 3:
+        s_blk = np.asarray(slc[ys0:ys1, xs0:xs1], dtype=np.float32)
+        s_blk = s_blk[..., 0] + 1j * s_blk[..., 1]
+    else:
+        s_blk = slc[ys0:ys1, xs0:xs1]
+    blk[ys0 - y_start:ys1 - y_start, xs0 - x_start:xs1 - x_start] = s_blk
+    return blk
+
+
+def detect(blk: np.ndarray, ovr: int = 1) -> np.ndarray:
+    """
+    Oversample an SLC block by FFT zero-padding and detect it.
+    Oversampling before detection avoids the aliasing of the amplitude
+    spectrum, which is twice as wide as the SLC spectrum, and the
+    resulting bias of the sub-pixel offsets.
+    :param blk: SLC block [numpy ndarray - complex]
+    :param ovr: oversampling factor
+    :return: amplitude block [n_rows * ovr, n_cols * ovr] - float32
+    """
+    if ovr == 1:
+        return np.abs(blk).astype(np.float32)
+    n_rows, n_cols = blk.shape
+    spec = np.fft.fftshift(fft.fft2(blk))
+    pad_y = ((ovr - 1) * n_rows // 2, (ovr - 1) * n_rows
+             - (ovr - 1) * n_rows // 2)
+    pad_x = ((ovr - 1) * n_cols // 2, (ovr - 1) * n_cols
+             - (ovr - 1) * n_cols // 2)
+    spec = np.pad(spec, (pad_y, pad_x))
+    amp = np.abs(fft.ifft2(np.fft.ifftshift(spec))).astype(np.float32)
+    amp *= ovr ** 2
+    # - Preserve the NoData samples of the input block
+    nodata = np.repeat(np.repeat(blk == 0, ovr, axis=0), ovr, axis=1)
+    amp[nodata] = 0
+    return amp
+
+
+def refine_peak(x_spec: np.ndarray, py: np.ndarray, px: np.ndarray,
+                ovs: int = 8) -> tuple:
+    """
+    Upsampled cross-correlation around the integer correlation peak
+    computed by matrix-multiply DFT (Guizar-Sicairos et al., 2008) on a
+    local +/- 1.5 pixels grid, without oversampling the whole surface.
+    :param x_spec: cross-power spectrum [n_nodes, n_fft, n_fft]
+    :param py: integer azimuth lag of the peak
+    :param px: integer range lag of the peak
+    :param ovs: upsampling factor
+    :return: sub-pixel azimuth and range lags, azimuth and range peak
+             curvature [1/pixels^2] (unnormalized correlation)
+    """
+    n_fft = x_spec.shape[1]
+    m_fine = 3 * ovs + 1
+    f_k = np.fft.fftfreq(n_fft) * n_fft
+    u_fine = (np.arange(m_fine) - m_fine // 2) / ovs
+    ly = py[:, None] + u_fine[None, :]
+    lx = px[:, None] + u_fine[None, :]
+    k_y = np.exp(2j * np.pi * ly[:, :, None] * f_k[None, None, :] / n_fft)
+    k_x = np.exp(2j * np.pi * lx[:, None, :] * f_k[None, :, None] / n_fft)
+    c_fine = (k_y.astype(np.complex64) @ x_spec
+              @ k_x.astype(np.complex64)).real / n_fft ** 2
+
+    # - Fine peak - kept away from the local grid border
+    n_nodes = x_spec.shape[0]
+    inner = np.full(c_fine.shape, -np.inf, dtype=c_fine.dtype)
+    inner[:, 1:-1, 1:-1] = c_fine[:, 1:-1, 1:-1]
+    fy, fx = np.unravel_index(inner.reshape(n_nodes, -1).argmax(axis=1),
+                              (m_fine, m_fine))
+    nd = np.arange(n_nodes)
+    c0 = c_fine[nd, fy, fx]
+    cxm, cxp = c_fine[nd, fy, fx - 1], c_fine[nd, fy, fx + 1]
+    cym, cyp = c_fine[nd, fy - 1, fx], c_fine[nd, fy + 1, fx]
+
+    # - Parabolic interpolation on the upsampled grid
+    eps = np.finfo(np.float32).eps
+    crv_x = 2 * c0 - cxm - cxp
+    crv_y = 2 * c0 - cym - cyp
+    sx = 0.5 * (cxp - cxm) / np.where(crv_x > eps, crv_x, np.inf)
+    sy = 0.5 * (cyp - cym) / np.where(crv_y > eps, crv_y, np.inf)
+    return (ly[nd, fy] + sy / ovs, lx[nd, fx] + sx / ovs,
+            crv_y * ovs ** 2, crv_x * ovs ** 2)
+
+
+def correlate_chips(ref_chips: np.ndarray, sec_chips: np.ndarray,
+                    excl: int = 2, min_valid: float = 0.5) -> dict:
+    """
+    Normalized cross-correlation of a batch of amplitude chips.
+    The secondary chip offset is searched within +/- win/2 pixels.
+    :param ref_chips: reference chips [n_nodes, win, win]
+    :param sec_chips: secondary chips [n_nodes, win, win]
+    :param excl: radius excluded around the main peak when searching
+                 for the second peak [pixels]
+    :param min_valid: minimum fraction of valid pixels per chip
+    :return: Python dictionary containing the sub-pixel offsets (dx, dy)
+             and the quality surfaces of each node (ccp, snr, ptsr,
+             sig_x, sig_y, vfrac).
+    """
+    n_nodes, win, _ = ref_chips.shape
+    h_win = win // 2
+    valid = (ref_chips > 0) & (sec_chips > 0)
+    vfrac = valid.mean(axis=(1, 2))
+
+    # - Zero-mean chips over the valid pixels
+    n_vld = np.maximum(valid.sum(axis=(1, 2)), 1)[:, None, None]
+    ref_c = np.where(valid, ref_chips - (ref_chips * valid)
+                     .sum(axis=(1, 2), keepdims=True) / n_vld, 0.)
+    sec_c = np.where(valid, sec_chips - (sec_chips * valid)
+                     .sum(axis=(1, 2), keepdims=True) / n_vld, 0.)
+    norm = np.sqrt((ref_c ** 2).sum(axis=(1, 2))
+                   * (sec_c ** 2).sum(axis=(1, 2)))
+    norm[norm == 0] = np.inf
+
+    # - Linear cross-correlation - zero-padded to avoid wrap-around
+    f_shape = (2 * win, 2 * win)
+    x_spec = np.conj(fft.fft2(ref_c.astype(np.float32), s=f_shape)) \
+        * fft.fft2(sec_c.astype(np.float32), s=f_shape)
+    xcorr = np.fft.fftshift(fft.ifft2(x_spec).real, axes=(1, 2))
+    # - Search region: lags within +/- win/2 - lag = index - h_win
+    xcorr = xcorr[:, win - h_win:win + h_win + 1,
+                  win - h_win:win + h_win + 1] / norm[:, None, None]
+    n_lag = xcorr.shape[1]
+
+    # - Integer correlation peak - kept away from the search region border
+    inner = np.full(xcorr.shape, -np.inf)
+    inner[:, 1:-1, 1:-1] = xcorr[:, 1:-1, 1:-1]
+    pk_ind = inner.reshape(n_nodes, -1).argmax(axis=1)
+    py, px = np.unravel_index(pk_ind, (n_lag, n_lag))
+    nd = np.arange(n_nodes)
+    c0 = xcorr[nd, py, px]
+
+    # - Sub-pixel peak location and curvature - upsampled correlation
+    eps = np.finfo(np.float32).eps
+    dy, dx, k_y, k_x = refine_peak(x_spec, py - h_win, px - h_win)
+    k_x = k_x / norm
+    k_y = k_y / norm
+
+    # - Offsets standard deviation from the peak curvature
+    # - sigma^2 = (1 - ccp) / (N * ccp * curvature)
+    rho = np.clip(c0, eps, 1.)
+    n_eff = n_vld[:, 0, 0]
+    sig_x = np.sqrt((1. - rho) / (n_eff * rho * np.maximum(k_x, eps)))
+    sig_y = np.sqrt((1. - rho) / (n_eff * rho * np.maximum(k_y, eps)))
+
+    # - Second correlation peak - outside the main peak neighbourhood
+    lag = np.arange(n_lag)
+    excl_mask = ((np.abs(lag[None, :, None] - py[:, None, None]) <= excl)
+                 & (np.abs(lag[None, None, :] - px[:, None, None]) <= excl))
+    c1 = np.where(excl_mask, -np.inf, xcorr).reshape(n_nodes, -1).max(axis=1)
+    ptsr = c0 / np.maximum(c1, eps)
+    snr = c0 / np.maximum(np.abs(xcorr).mean(axis=(1, 2)), eps)
+
+    # - Discard nodes without enough valid pixels or correlation
+    bad = (vfrac < min_valid) | (c0 <= 0) | ~np.isfinite(c0)
+    out = {'dx': dx, 'dy': dy, 'ccp': c0, 'snr': snr, 'ptsr': ptsr,
+           'sig_x': sig_x, 'sig_y': sig_y, 'vfrac': vfrac}
+    for key, val in out.items():
+        out[key] = np.where(bad, 0., val).astype(np.float32)
+    out['vfrac'] = vfrac.astype(np.float32)
+    return out
+
+
+def track_tile(ref_slc: np.memmap, sec_slc: np.memmap, out: dict,
+               az_nodes: slice, rn_nodes: slice, win: int, skip: int,
+               x_start: int, y_start: int, x_off: int, y_off: int,
+               ovr: int) -> None:
+    """
+    Estimate the offsets of a tile of nodes. The reference and secondary
+    tile blocks, including the correlation window halo, are read and
+    oversampled once and all the tile chips are strided views of them.
+    Tiles cover disjoint nodes, so the results are written in place.
+    :param ref_slc: memory-mapped reference SLC - see slc_memmap
+    :param sec_slc: memory-mapped secondary SLC - see slc_memmap
+    :param out: output arrays - see track_offsets
+    :param az_nodes: azimuth nodes of the tile
+    :param rn_nodes: range nodes of the tile
+    :param win: correlation window size [pixels]
+    :param skip: nodes spacing [pixels]
+    :param x_start: first node range [pixels]
+    :param y_start: first node azimuth [pixels]
+    :param x_off: initial range offset [pixels]
+    :param y_off: initial azimuth offset [pixels]
+    :param ovr: SLC oversampling factor
+    :return: None
+    """
+    h_win = win // 2
+    n_az = az_nodes.stop - az_nodes.start
+    n_rn = rn_nodes.stop - rn_nodes.start
+    y_blk = y_start + az_nodes.start * skip - h_win
+    x_blk = x_start + rn_nodes.start * skip - h_win
+    n_rows = (n_az - 1) * skip + win
+    n_cols = (n_rn - 1) * skip + win
+    # - Blocks are read with an extra margin, cropped after oversampling,
+    # - so that FFT wrap-around does not reach the tile chips.
+    crop = (slice(OVS_MARGIN * ovr, -OVS_MARGIN * ovr),) * 2
+    ref_amp = detect(read_block(ref_slc, y_blk - OVS_MARGIN,
+                                n_rows + 2 * OVS_MARGIN, x_blk - OVS_MARGIN,
+                                n_cols + 2 * OVS_MARGIN), ovr=ovr)[crop]
+    sec_amp = detect(read_block(sec_slc, y_blk + y_off - OVS_MARGIN,
+                                n_rows + 2 * OVS_MARGIN,
+                                x_blk + x_off - OVS_MARGIN,
+                                n_cols + 2 * OVS_MARGIN), ovr=ovr)[crop]
+    win_o = win * ovr
+    skip_o = skip * ovr
+    ref_chips = np.lib.stride_tricks.sliding_window_view(
+        ref_amp, (win_o, win_o))[::skip_o, ::skip_o]
+    sec_chips = np.lib.stride_tricks.sliding_window_view(
+        sec_amp, (win_o, win_o))[::skip_o, ::skip_o]
+
+    # - Correlate the tile one node row at a time to bound the memory
+    # - used by the correlation surfaces.
+    for i_t in range(n_az):
+        i_az = az_nodes.start + i_t
+        # - Note: sig_x/sig_y are already expressed in SLC pixels, the
+        # - oversampled curvature and number of samples scale as 1/ovr^2
+        # - and ovr^2 respectively.
+        corr = correlate_chips(ref_chips[i_t], sec_chips[i_t])
+        valid = corr['ccp'] > 0
+        out['off_map'][i_az, rn_nodes] = np.where(
+            valid, (x_off + corr['dx'] / ovr)
+            + 1j * (y_off + corr['dy'] / ovr), 0)
+        for k in TRACKER_KEYS:
+            out[k][i_az, rn_nodes] = corr[k]
+
+
+def track_offsets(ref_slc: np.memmap, sec_slc: np.memmap, win: int,
+                  skip: int, n_rn: int, n_az: int,
+                  x_start: int = 0, y_start: int = 0,
+                  x_off: int = 0, y_off: int = 0, ovr: int = 2,
+                  n_threads: int = None, tile_az: int = 16,
+                  tile_rn: int = 32, affinity: bool = False) -> dict:
+    """
+    Estimate the range and azimuth offsets on a regular grid of nodes.
+    Node (i, j) is centered at range x_start + j * skip and azimuth
+    y_start + i * skip of the reference SLC.
+    The grid is split in tiles of tile_az x tile_rn nodes processed by a
+    pool of threads - scipy.fft releases the GIL.
+    :param ref_slc: memory-mapped reference SLC - see slc_memmap
+    :param sec_slc: memory-mapped secondary SLC - see slc_memmap
+    :param win: correlation window size [pixels]
+    :param skip: nodes spacing [pixels]
+    :param n_rn: number of range nodes
+    :param n_az: number of azimuth nodes
+    :param x_start: first node range [pixels]
+    :param y_start: first node azimuth [pixels]
+    :param x_off: initial range offset [pixels]
+    :param y_off: initial azimuth offset [pixels]
+    :param ovr: SLC oversampling factor [def. 2]
+    :param n_threads: number of threads [def. os.cpu_count()]
+    :param tile_az: tile size in azimuth [nodes]
+    :param tile_rn: tile size in range [nodes]
+    :param affinity: pin the threads to cores spread across NUMA nodes
+    :return: Python dictionary containing the offsets map (complex64) and
+             the float32 quality surfaces (ccp, snr, ptsr, sig_x, sig_y,
+             vfrac), each of shape [n_az, n_rn].
+    """
+    out = {k: np.zeros((n_az, n_rn), dtype=np.float32)
+           for k in TRACKER_KEYS}
+    out['off_map'] = np.zeros((n_az, n_rn), dtype=np.complex64)
+    tiles = [(slice(i, min(i + tile_az, n_az)),
+              slice(j, min(j + tile_rn, n_rn)))
+             for i in range(0, n_az, tile_az)
+             for j in range(0, n_rn, tile_rn)]
+    if n_threads is None:
+        n_threads = os.cpu_count()
+
+    initializer = ThreadPinner(n_threads) if affinity else None
+    with ThreadPoolExecutor(max_workers=n_threads,
+                            initializer=initializer) as executor:
+        futures = [executor.submit(track_tile, ref_slc, sec_slc, out,
+                                   az_nodes, rn_nodes, win, skip,
+                                   x_start, y_start, x_off, y_off, ovr)
+                   for az_nodes, rn_nodes in tiles]
+        # - Propagate worker exceptions
+        for future in futures:
+            future.result()
+    return out
+
+
+def quality_mask(quality: dict, min_ccp: float = 0.1,
+                 min_ptsr: float = 1.1, max_sigma: float = 0.5,
+                 min_valid: float = 0.9) -> np.ndarray:
+    """
+    One-pass outliers mask computed from the tracker quality surfaces.
+    :param quality: quality surfaces - see track_offsets
+    :param min_ccp: minimum cross-correlation peak
+    :param min_ptsr: minimum peak-to-second-peak ratio
+    :param max_sigma: maximum offset standard deviation [pixels]
+    :param min_valid: minimum fraction of valid pixels per chip
+    :return: outliers mask [numpy ndarray - bool]
+    """
+    return ((quality['ccp'] < min_ccp) | (quality['ptsr'] < min_ptsr)
+            | (quality['sig_x'] > max_sigma) | (quality['sig_y'] > max_sigma)
+            | (quality['vfrac'] < min_valid))
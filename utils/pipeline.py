@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+"""
+Step-graph pipeline engine with cached steps.
+Each step declares its input files, its parameters and its output files.
+The dependencies between steps follow from the files: a step depends on
+the steps producing its inputs (plus the steps listed in after).
+A step is skipped when its cache key - a hash of the step parameters and
+of the fingerprints of its input files - matches the key recorded the
+last time the step succeeded and its outputs are unchanged. Changing a
+late parameter (e.g. the interferogram filter) therefore reruns only the
+steps downstream of it.
+File fingerprints: SHA-256 of the content for files up to HASH_LIMIT
+bytes (parameter files, offsets tables), size and modification time for
+larger rasters. A rerun step that rewrites an identical parameter file
+does not invalidate the steps that read it.
+The cache manifest is a JSON file updated atomically after each step.
+Independent steps run concurrently (threads - each step typically waits
+on a GAMMA or AMPCOR subprocess) within a core budget; every step
+declares the number of cores it uses. When several pipelines share a
+node, their steps are also granted cores, memory and disk-bandwidth
+tokens by a node-level pool - see utils.resource_pool.
+Lazy steps (optional products - quicklooks, auxiliary maps) are not
+part of the default targets: they run only when requested as targets or
+when a requested step depends on them.
+Changes of the code of a step are not tracked - use force.
+"""
+# - Python Dependencies
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# - Files up to HASH_LIMIT bytes are fingerprinted by content
+HASH_LIMIT = 2 ** 23
+
+
+def log(message: str) -> None:
+    """
+    Print a message as a single write - steps log from several threads
+    :param message: message
+    :return: None
+    """
+    sys.stdout.write(message + '\n')
+    sys.stdout.flush()
+
+
+def fingerprint(path: str) -> str:
+    """
+    Fingerprint of a file
+    :param path: absolute path to the file
+    :return: content hash (small files), size and modification time
+             (large files) or None if the file does not exist
+    """
+    try:
+        f_stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if f_stat.st_size > HASH_LIMIT:
+        return f'stat:{f_stat.st_size}:{f_stat.st_mtime_ns}'
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fid:
+        sha.update(fid.read())
+    return f'sha256:{sha.hexdigest()}'
+
+
+class Step:
+    """
+    Pipeline step
+    :param name: step name
+    :param func: callable running the step - called without arguments
+    :param inputs: absolute paths to the input files
+    :param outputs: absolute paths to the output files
+    :param params: step parameters - JSON serializable
+    :param after: names of steps that must run before this step - for
+                  dependencies not expressed by files
+    :param cores: number of cores used by the step
+    :param ram: memory used by the step [GB] - or a callable returning it,
+                evaluated when the step is ready to start (e.g. from the
+                size of the rasters produced upstream)
+    :param io: disk-bandwidth tokens used by the step - 1 for steps
+               streaming full SLCs or rasters
+    :param lazy: optional step - run only on request, see Pipeline.run
+    """
+    def __init__(self, name: str, func, inputs: list = (),
+                 outputs: list = (), params: dict = None,
+                 after: list = (), cores: int = 1, ram: float = 0.,
+                 io: int = 0, lazy: bool = False):
+        self.name = name
+        self.func = func
+        self.inputs = [os.path.abspath(p) for p in inputs]
+        self.outputs = [os.path.abspath(p) for p in outputs]
+        self.params = params if params is not None else {}
+        self.after = list(after)
+        self.cores = cores
+        self.ram = ram
+        self.io = io
+        self.lazy = lazy
+
+    def cache_key(self) -> str:
+        """
+        Cache key of the step - hash of the parameters and of the input
+        files fingerprints
+        :return: cache key
+        """
+        key = {'step': self.name, 'params': self.params,
+               'inputs': {p: fingerprint(p) for p in self.inputs}}
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str)
+                              .encode('utf8')).hexdigest()
+
+
+class Pipeline:
+    """
+    Pipeline of cached steps
+    :param cache_path: absolute path to the JSON cache manifest
+    """
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self.steps = {}
+        self.producers = {}
+        self.cache = {}
+        self.lock = threading.Lock()
+        if os.path.isfile(cache_path):
+            with open(cache_path, 'r', encoding='utf8') as fid:
+                self.cache = json.load(fid)
+
+    def add(self, name: str, func, **kwargs) -> Step:
+        """
+        Add a step to the pipeline - steps must be added after the steps
+        they depend on
+        :param name: step name
+        :param func: callable running the step
+        :param kwargs: step inputs, outputs, params, after, cores, ram, io
+                       and lazy - see Step
+        :return: pipeline step
+        """
+        if name in self.steps:
+            raise ValueError(f'Duplicated pipeline step: {name}')
+        step = Step(name, func, **kwargs)
+        for dep in step.after:
+            if dep not in self.steps:
+                raise ValueError(f'Step {name}: unknown step {dep}')
+        for out_path in step.outputs:
+            if out_path in self.producers:
+                raise ValueError(f'Step {name}: {out_path} is already an '
+                                 f'output of {self.producers[out_path]}')
+            self.producers[out_path] = name
+        self.steps[name] = step
+        return step
+
+    def dependencies(self, name: str) -> list:
+        """
+        Steps a step depends on
+        :param name: step name
+        :return: names of the steps producing the inputs of the step and
+                 of the steps listed in its after attribute
+        """
+        step = self.steps[name]
+        deps = [self.producers[p] for p in step.inputs
+                if p in self.producers] + step.after
+        return sorted(set(deps) - {name}, key=list(self.steps).index)
+
+    def upstream(self, targets: list) -> list:
+        """
+        Steps needed to produce the targets
+        :param targets: target step names
+        :return: names of the target steps and of all their upstream
+                 steps - in pipeline order
+        """
+        needed = set()
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in self.steps:
+                raise ValueError(f'Unknown pipeline step: {name}')
+            if name not in needed:
+                needed.add(name)
+                stack.extend(self.dependencies(name))
+        return [name for name in self.steps if name in needed]
+
+    def default_targets(self) -> list:
+        """
+        Steps run when no targets are given
+        :return: names of the steps that are not lazy - in pipeline order
+        """
+        return [name for name, step in self.steps.items() if not step.lazy]
+
+    def is_cached(self, name: str) -> bool:
+        """
+        Check if the cached result of a step is up to date
+        :param name: step name
+        :return: True if the step can be skipped
+        """
+        step = self.steps[name]
+        entry = self.cache.get(name)
+        # - Outputs deleted, overwritten or moved after the step ran
+        # - invalidate it
+        return entry is not None and entry['key'] == step.cache_key() \
+            and set(entry['outputs']) == set(step.outputs) \
+            and all(entry['outputs'][p] == fingerprint(p)
+                    for p in step.outputs)
+
+    def _record(self, name: str, wall_time: float) -> None:
+        """
+        Record a completed step in the cache manifest
+        :param name: step name
+        :param wall_time: step wall time [s]
+        :return: None
+        """
+        step = self.steps[name]
+        entry = {'key': step.cache_key(), 'time': time.time(),
+                 'wall_time': wall_time,
+                 'outputs': {p: fingerprint(p) for p in step.outputs}}
+        with self.lock:
+            self.cache[name] = entry
+            self._save()
+
+    def _save(self) -> None:
+        """
+        Save the cache manifest - atomic replacement. The caller holds the
+        lock.
+        :return: None
+        """
+        tmp_path = f'{self.cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf8') as fid:
+            json.dump(self.cache, fid, indent=1)
+        os.replace(tmp_path, self.cache_path)
+
+    def _skip(self, name: str, force: list, assume_done: list) -> str:
+        """
+        Check if a step can be skipped
+        :param name: step name
+        :param force: names of the steps to rerun - see run
+        :param assume_done: names of the steps assumed done - see run
+        :return: assumed, cached or None if the step must run
+        """
+        step = self.steps[name]
+        if name in assume_done and name not in self.cache \
+                and all(os.path.exists(p) for p in step.outputs):
+            log(f'# - Step {name}: outputs found - recorded as done.')
+            self._record(name, 0.)
+            return 'assumed'
+        if 'all' not in force and name not in force \
+                and self.is_cached(name):
+            log(f'# - Step {name}: up to date - skipped.')
+            return 'cached'
+        return None
+
+    def _execute(self, name: str) -> None:
+        """
+        Run a step and record it in the cache manifest
+        :param name: step name
+        :return: None
+        """
+        step = self.steps[name]
+        log(f'# - Step {name}: running.')
+        # - Invalidate the cache entry before running the step - an
+        # - interrupted step is never considered up to date
+        with self.lock:
+            if self.cache.pop(name, None) is not None:
+                self._save()
+        t_start = time.monotonic()
+        step.func()
+        missing = [p for p in step.outputs if not os.path.exists(p)]
+        if missing:
+            raise RuntimeError(f'Step {name} did not produce: {missing}')
+        w_time = time.monotonic() - t_start
+        self._record(name, w_time)
+        log(f'# - Step {name}: completed in {w_time:.1f} s.')
+
+    def run(self, targets: list = None, force: list = (),
+            assume_done: list = (), n_cores: int = 1,
+            pool=None) -> dict:
+        """
+        Run the pipeline - a step starts as soon as the steps it depends on
+        are completed and enough cores of the budget are free; up to date
+        steps are skipped. Ready steps are started in pipeline order - a
+        step that does not fit the free cores is not overtaken by the
+        following ones. With a node-level resource pool, a step also waits
+        for its cores, memory and disk-bandwidth tokens to be granted.
+        :param targets: target step names [def. None - all the steps
+                        that are not lazy]. Lazy steps upstream of the
+                        targets are run.
+        :param force: names of the steps to rerun even if cached - 'all'
+                      reruns every step
+        :param assume_done: names of the steps to record as completed
+                            without running them, if their outputs exist -
+                            e.g. steps completed before the cache existed
+        :param n_cores: core budget - 1: steps run one at a time
+        :param pool: node-level resource pool shared with other pipelines
+                     - see utils.resource_pool.ResourcePool
+        :return: Python dictionary containing the status of each step:
+                 run, cached or assumed
+        """
+        names = self.upstream(targets if targets
+                              else self.default_targets())
+        n_cores = max(n_cores, 1)
+        status = {}
+        pending = list(names)
+        to_run = set()
+        running = {}
+        n_used = 0
+        error = None
+        with ThreadPoolExecutor(max_workers=n_cores) as executor:
+            while pending or running:
+                # - Start the ready steps
+                blocked = False
+                for name in list(pending):
+                    if error is not None:
+                        break
+                    if any(dep in names and dep not in status
+                           for dep in self.dependencies(name)):
+                        continue
+                    if name not in to_run:
+                        skip = self._skip(name, force, assume_done)
+                        if skip is not None:
+                            status[name] = skip
+                            pending.remove(name)
+                            continue
+                        to_run.add(name)
+                    step = self.steps[name]
+                    cores = min(step.cores, n_cores)
+                    if n_used + cores > n_cores:
+                        break
+                    request_id = f'{os.getpid()}:{self.cache_path}:{name}'
+                    if pool is not None and not pool.try_acquire(
+                            request_id, cores=cores, ram=step.ram()
+                            if callable(step.ram) else step.ram,
+                            io=step.io):
+                        blocked = True
+                        break
+                    pending.remove(name)
+                    n_used += cores
+                    running[executor.submit(self._execute, name)] \
+                        = (name, cores, request_id)
+                if not running:
+                    if not blocked:
+                        break
+                    # - Blocked by the node-level pool: poll it
+                    time.sleep(pool.poll)
+                    continue
+                done, _ = wait(running,
+                               timeout=pool.poll if blocked else None,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, cores, request_id = running.pop(future)
+                    n_used -= cores
+                    if pool is not None:
+                        pool.release(request_id)
+                    try:
+                        future.result()
+                        status[name] = 'run'
+                    except Exception as exc:
+                        # - Let the running steps complete, start no others
+                        if error is None:
+                            error = exc
+        if error is not None:
+            raise error
+        return status
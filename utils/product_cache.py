@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Content-addressed store of processing products shared by the pairs of a
+stack - see utils.geo_cache (geocoding products) and utils.mli_cache
+(multi-looked intensities).
+Cache entries are directories <cache_dir>/<key[:2]>/<key> created
+atomically, where key is the hash of the caller key and of the sorted
+file names of the products (see entry_key): callers storing a different
+set of products under the same key use different entries. The products
+of an entry are saved under their file names, so that their order does
+not matter.
+Products are returned as hard links (copies if the cache and the pair
+workspace are on different file systems) - use a cache directory on the
+same file system as the outputs. Entries are never modified: the
+products are unlinked before being recomputed.
+"""
+# - Python Dependencies
+import os
+import json
+import shutil
+import hashlib
+import threading
+from utils.workspace import publish
+
+
+def entry_key(key: str, paths: list) -> str:
+    """
+    Key of the cache entry holding a set of products
+    :param key: cache key
+    :param paths: absolute paths to the products
+    :return: hash of the cache key and of the sorted product file names
+    """
+    names = sorted(os.path.basename(p) for p in paths)
+    if len(set(names)) != len(names):
+        raise ValueError(f'# - Cached products must have distinct file '
+                         f'names: {names}')
+    return hashlib.sha256(json.dumps([key, names]).encode('utf8')) \
+        .hexdigest()
+
+
+def entry_dir(cache_dir: str, key: str, paths: list) -> str:
+    """
+    Directory of a cache entry
+    :param cache_dir: absolute path to the cache directory
+    :param key: cache key
+    :param paths: absolute paths to the products
+    :return: absolute path to the entry directory
+    """
+    e_key = entry_key(key, paths)
+    return os.path.join(cache_dir, e_key[:2], e_key)
+
+
+def entry_paths(cache_dir: str, key: str, paths: list) -> list:
+    """
+    Products of a cache entry
+    :param cache_dir: absolute path to the cache directory
+    :param key: cache key
+    :param paths: absolute paths to the products
+    :return: absolute paths to the products of the entry - in the order
+             of paths
+    """
+    e_dir = entry_dir(cache_dir, key, paths)
+    return [os.path.join(e_dir, os.path.basename(p)) for p in paths]
+
+
+def fetch(cache_dir: str, key: str, paths: list) -> bool:
+    """
+    Link the products of a cache entry
+    :param cache_dir: absolute path to the cache directory
+    :param key: cache key
+    :param paths: absolute paths to the products
+    :return: True if the entry was found
+    """
+    c_paths = entry_paths(cache_dir, key, paths)
+    if not all(os.path.isfile(p) for p in c_paths):
+        return False
+    for c_path, path in zip(c_paths, paths):
+        publish(c_path, path)
+    return True
+
+
+def store(cache_dir: str, key: str, paths: list) -> None:
+    """
+    Add products to the cache - the entry directory is created atomically;
+    an entry stored concurrently by another pair is kept
+    :param cache_dir: absolute path to the cache directory
+    :param key: cache key
+    :param paths: absolute paths to the products
+    :return: None
+    """
+    e_dir = entry_dir(cache_dir, key, paths)
+    if os.path.isdir(e_dir):
+        return
+    os.makedirs(os.path.dirname(e_dir), exist_ok=True)
+    tmp_dir = f'{e_dir}.{os.getpid()}.{threading.get_ident()}.tmp'
+    os.makedirs(tmp_dir)
+    try:
+        for path in paths:
+            publish(path, os.path.join(tmp_dir, os.path.basename(path)))
+        os.rename(tmp_dir, e_dir)
+    except OSError:
+        if not os.path.isdir(e_dir):
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def cached_call(cache_dir: str, key: str, paths: list, func,
+                label: str = 'Cache') -> bool:
+    """
+    Link the products from the cache or compute and store them
+    :param cache_dir: absolute path to the cache directory - None: the
+                      products are always computed
+    :param key: cache key
+    :param paths: absolute paths to the products
+    :param func: callable computing the products - called without arguments
+    :param label: cache name printed on a hit
+    :return: True if the products were found in the cache
+    """
+    if cache_dir is not None and fetch(cache_dir, key, paths):
+        print(f'# - {label}: {key[:12]} - {len(paths)} products linked.')
+        return True
+    # - Unlink the previous products - they can be hard links to entries
+    for path in paths:
+        if os.path.lexists(path):
+            os.remove(path)
+    func()
+    if cache_dir is not None:
+        store(cache_dir, key, paths)
+    return False
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Resample a complex offsets map to a new range/azimuth posting using
+vectorized bilinear interpolation. Zero-valued offsets are treated as
+NoData and excluded from the interpolation weights.
+"""
+# - Python Dependencies
+import numpy as np
+
+
+def resample_grid(n_samples: int, spacing: int, new_spacing: int) -> tuple:
+    """
+    Compute the output grid obtained by resampling an offsets axis
+    to a new posting while preserving its starting coordinate.
+    :param n_samples: number of offset samples along the axis
+    :param spacing: input offsets spacing [pixels]
+    :param new_spacing: output offsets spacing [pixels]
+    :return: number of output samples, fractional input index of each
+             output sample
+    """
+    # - Keep the output nodes inside the input axis extent
+    n_out = int((n_samples - 1) * spacing // new_spacing) + 1
+    s_ind = np.arange(n_out, dtype=np.float64) * new_spacing / spacing
+    return n_out, s_ind
+
+
+def resample_offsets(off_map: np.ndarray, y_ind: np.ndarray,
+                     x_ind: np.ndarray, nodata: complex = 0) -> np.ndarray:
+    """
+    Bilinear resampling of a complex offsets map on a separable grid
+    :param off_map: input offsets map [numpy ndarray - complex]
+    :param y_ind: fractional input row index of each output row
+    :param x_ind: fractional input column index of each output column
+    :param nodata: NoData value [def. 0]
+    :return: resampled offsets map [numpy ndarray - complex64]
+    """
+    n_rec, n_pix = off_map.shape
+    # - Lower-left corner index and fractional distance along each axis
+    y_ind = np.clip(np.asarray(y_ind, dtype=np.float64), 0, n_rec - 1)
+    x_ind = np.clip(np.asarray(x_ind, dtype=np.float64), 0, n_pix - 1)
+    i0 = np.minimum(np.floor(y_ind).astype(int), max(n_rec - 2, 0))
+    j0 = np.minimum(np.floor(x_ind).astype(int), max(n_pix - 2, 0))
+    i1 = np.minimum(i0 + 1, n_rec - 1)
+    j1 = np.minimum(j0 + 1, n_pix - 1)
+    fy = (y_ind - i0)[:, np.newaxis]
+    fx = (x_ind - j0)[np.newaxis, :]
+
+    # - Bilinear weights of the four surrounding nodes
+    corners = ((i0, j0, (1 - fy) * (1 - fx)), (i0, j1, (1 - fy) * fx),
+               (i1, j0, fy * (1 - fx)), (i1, j1, fy * fx))
+
+    num = np.zeros((len(y_ind), len(x_ind)), dtype=np.complex128)
+    den = np.zeros((len(y_ind), len(x_ind)), dtype=np.float64)
+    for r_ind, c_ind, w in corners:
+        val = off_map[np.ix_(r_ind, c_ind)]
+        # - Exclude NoData nodes and renormalize the remaining weights
+        w_valid = np.where((val != nodata) & np.isfinite(val), w, 0.)
+        num += w_valid * np.nan_to_num(val)
+        den += w_valid
+
+    out_map = np.full(den.shape, nodata, dtype=np.complex64)
+    valid = den > 0
+    out_map[valid] = num[valid] / den[valid]
+    return out_map
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""
+Node-level resource pool shared by the pair pipelines running on a node -
+see pair_scheduler.py. The pool tracks three resources:
+    cores   CPU cores (e.g. AMPCOR processes, GAMMA threads);
+    ram     memory [GB];
+    io      disk-bandwidth tokens - steps streaming full SLCs or rasters
+            hold one token, so that only a few of them read the disk at
+            the same time.
+Each pipeline step is granted its resources before it starts and releases
+them when it completes (see utils.pipeline.Pipeline.run). CPU-bound,
+I/O-bound and memory-heavy steps of different pairs therefore interleave
+without oversubscribing the node.
+
+The pool state is a JSON file updated under an exclusive lock (fcntl);
+grants of dead processes are reclaimed. A request larger than the pool
+capacity is clipped to it - it runs alone. Smaller requests can overtake
+a waiting one (backfilling) until the latter has waited STARVE_TIME
+seconds: resources are then reserved for it.
+"""
+# - Python Dependencies
+import os
+import json
+import time
+import fcntl
+
+# - Pool resources
+RESOURCES = ('cores', 'ram', 'io')
+# - Waiting time after which a request stops being overtaken [s]
+STARVE_TIME = 60.
+# - Waiting requests not renewed for WAIT_EXPIRY seconds are dropped [s]
+WAIT_EXPIRY = 30.
+# - Default polling interval of the blocked pipelines [s]
+POOL_POLL = 2.
+
+
+def alive(pid: int) -> bool:
+    """
+    Check if a process is alive
+    :param pid: process id
+    :return: True if the process exists
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def init_pool(pool_path: str, cores: int, ram: float, io: int) -> None:
+    """
+    Create a resource pool - existing grants are discarded
+    :param pool_path: absolute path to the pool state file (JSON)
+    :param cores: number of cores
+    :param ram: memory [GB]
+    :param io: number of disk-bandwidth tokens
+    :return: None
+    """
+    state = {'capacity': {'cores': cores, 'ram': ram, 'io': io},
+             'grants': {}, 'waiting': {}}
+    tmp_path = f'{pool_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf8') as fid:
+        json.dump(state, fid, indent=1)
+    os.replace(tmp_path, pool_path)
+
+
+class ResourcePool:
+    """
+    Client of a node-level resource pool
+    :param pool_path: absolute path to the pool state file - see init_pool
+    :param poll: polling interval of the blocked requests [s]
+    """
+    def __init__(self, pool_path: str, poll: float = POOL_POLL):
+        self.pool_path = pool_path
+        self.lock_path = f'{pool_path}.lock'
+        self.poll = poll
+
+    def _update(self, func):
+        """
+        Read, update and save the pool state under the exclusive lock
+        :param func: callable updating the state in place - returns the
+                     result of the update
+        :return: result of func
+        """
+        with open(self.lock_path, 'a', encoding='utf8') as l_fid:
+            fcntl.flock(l_fid, fcntl.LOCK_EX)
+            with open(self.pool_path, 'r', encoding='utf8') as fid:
+                state = json.load(fid)
+            # - Reclaim the grants of dead processes and the expired waits
+            now = time.time()
+            state['grants'] = {k: g for k, g in state['grants'].items()
+                               if alive(g['pid'])}
+            state['waiting'] = {k: w for k, w in state['waiting'].items()
+                                if alive(w['pid'])
+                                and now - w['seen'] < WAIT_EXPIRY}
+            result = func(state, now)
+            tmp_path = f'{self.pool_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf8') as fid:
+                json.dump(state, fid, indent=1)
+            os.replace(tmp_path, self.pool_path)
+        return result
+
+    def try_acquire(self, request_id: str, cores: int = 1, ram: float = 0.,
+                    io: int = 0) -> bool:
+        """
+        Try to acquire resources - non blocking. A denied request is
+        recorded as waiting; call again (at least every WAIT_EXPIRY
+        seconds) until it is granted.
+        :param request_id: unique request id - e.g. <pid>:<pair>:<step>
+        :param cores: number of cores
+        :param ram: memory [GB]
+        :param io: number of disk-bandwidth tokens
+        :return: True if the resources were granted
+        """
+        def acquire(state: dict, now: float) -> bool:
+            capacity = state['capacity']
+            # - Requests larger than the pool run alone
+            request = {'cores': min(cores, capacity['cores']),
+                       'ram': min(ram, capacity['ram']),
+                       'io': min(io, capacity['io'])}
+            wait = state['waiting'].setdefault(
+                request_id, {'pid': os.getpid(), 'since': now, **request})
+            wait['seen'] = now
+            used = {r: sum(g[r] for g in state['grants'].values())
+                    for r in RESOURCES}
+            free = {r: capacity[r] - used[r] for r in RESOURCES}
+            # - Resources reserved for the oldest starving request
+            starving = sorted((w['since'], k)
+                              for k, w in state['waiting'].items()
+                              if now - w['since'] > STARVE_TIME)
+            if starving and starving[0][1] != request_id:
+                reserved = state['waiting'][starving[0][1]]
+                free = {r: free[r] - reserved[r] for r in RESOURCES}
+            if any(request[r] > free[r] for r in RESOURCES):
+                return False
+            del state['waiting'][request_id]
+            state['grants'][request_id] = {'pid': os.getpid(),
+                                           'time': now, **request}
+            return True
+        return self._update(acquire)
+
+    def release(self, request_id: str) -> None:
+        """
+        Release the resources of a granted request
+        :param request_id: request id - see try_acquire
+        :return: None
+        """
+        def release(state: dict, now: float) -> None:
+            state['grants'].pop(request_id, None)
+            state['waiting'].pop(request_id, None)
+        self._update(release)
+
+    def status(self) -> dict:
+        """
+        Pool status
+        :return: Python dictionary containing the pool capacity, the
+                 resources in use and the number of granted and waiting
+                 requests
+        """
+        def status(state: dict, now: float) -> dict:
+            return {'capacity': state['capacity'],
+                    'used': {r: sum(g[r] for g in state['grants'].values())
+                             for r in RESOURCES},
+                    'n_granted': len(state['grants']),
+                    'n_waiting': len(state['waiting'])}
+        return self._update(status)
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+"""
+Node-local staging area (NVMe scratch or /dev/shm) for the pair
+processing. At pair start the input SLCs and parameter files are copied
+from the shared storage to the staging area, and the pair is processed in
+a staging directory: the intermediates (registered and resampled SLCs,
+interferograms, ...) are written to local storage and only the products
+left at the end of the run are copied back to the data directory.
+
+The staging area is shared by the pairs processed on the node. It holds
+two kinds of entries, i.e. directories <scratch>/stage_<name>:
+    stage_in_<key>      staged input file - key: hash of the path and of
+                        the fingerprint of the file (see
+                        utils.pipeline.fingerprint). A reference SLC used
+                        by many pairs is staged once.
+    stage_pair_<pair>   staging directory of a pair - the staged inputs
+                        are hard-linked into it.
+Entries in use are pinned by the processes using them (<entry>/.pins/
+<pid>). The pin of a pair staging directory records the space reserved
+for its intermediates, the pin of an input being staged the size of the
+input: the reservation not yet used by the files written to the entry is
+counted as used space, so that the pairs staged concurrently do not
+commit the same free space. When staging, the least
+recently used unpinned entries are evicted until the inputs and the
+reserved space fit the space budget. The budget is enforced when staging
+- intermediates growing beyond the reserved space are not evicted.
+"""
+# - Python Dependencies
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+from utils.pipeline import fingerprint
+from utils.workspace import publish
+from utils.resource_pool import alive
+
+# - Prefix of the staging area entries
+ENTRY_PREFIX = 'stage_'
+# - Default space budget - fraction of the scratch file system size
+BUDGET_FRACTION = 0.5
+
+
+def _reservation(e_dir: str) -> int:
+    """
+    Space reserved by the running processes pinning an entry
+    :param e_dir: absolute path to the entry directory
+    :return: reserved space [bytes]
+    """
+    pins_dir = os.path.join(e_dir, '.pins')
+    reserve = 0
+    for pid in (os.listdir(pins_dir) if os.path.isdir(pins_dir) else []):
+        if not pid.isdigit() or not alive(int(pid)):
+            continue
+        try:
+            with open(os.path.join(pins_dir, pid), 'r',
+                      encoding='utf8') as fid:
+                reserve += int(fid.read() or 0)
+        except (FileNotFoundError, ValueError):
+            continue
+    return reserve
+
+
+def area_usage(scratch_dir: str) -> int:
+    """
+    Space used by the staging area entries - hard-linked files are counted
+    once. The space reserved by the pins of the entries (intermediates of
+    the pairs being processed, inputs being staged) is counted, less the
+    space already used by the files written to them.
+    :param scratch_dir: absolute path to the scratch directory
+    :return: used space [bytes]
+    """
+    entries = {}
+    for name in os.listdir(scratch_dir):
+        if not name.startswith(ENTRY_PREFIX):
+            continue
+        e_inodes = entries[name] = {}
+        for root, _, files in os.walk(os.path.join(scratch_dir, name)):
+            for f_name in files:
+                try:
+                    f_stat = os.lstat(os.path.join(root, f_name))
+                except FileNotFoundError:
+                    continue
+                e_inodes[(f_stat.st_dev, f_stat.st_ino)] = f_stat.st_size
+    inodes = {key: size for e_inodes in entries.values()
+              for key, size in e_inodes.items()}
+    # - Files linked into several entries - the staged inputs linked into
+    # - the pair staging directories - do not use the reserved space
+    n_links = {}
+    for e_inodes in entries.values():
+        for key in e_inodes:
+            n_links[key] = n_links.get(key, 0) + 1
+    reserved = 0
+    for name, e_inodes in entries.items():
+        reserve = _reservation(os.path.join(scratch_dir, name))
+        if reserve:
+            used = sum(size for key, size in e_inodes.items()
+                       if n_links[key] == 1)
+            reserved += max(reserve - used, 0)
+    return sum(inodes.values()) + reserved
+
+
+def copy_back(stage_dir: str, data_dir: str, exclude: list = (),
+              products: list = None) -> list:
+    """
+    Copy the products of a staging directory back to the data directory -
+    subdirectories are copied recursively, hidden files are skipped
+    :param stage_dir: absolute path to the pair staging directory
+    :param data_dir: absolute path to the data directory
+    :param exclude: file names not copied - e.g. the staged inputs
+    :param products: names of the files copied [def. None - every file
+                     not excluded]
+    :return: relative paths to the copied files
+    """
+    copied = []
+    names = sorted(os.listdir(stage_dir)) if products is None \
+        else [name for name in products
+              if os.path.isfile(os.path.join(stage_dir, name))]
+    for name in names:
+        path = os.path.join(stage_dir, name)
+        if name.startswith('.') or name in exclude:
+            continue
+        if os.path.isdir(path):
+            os.makedirs(os.path.join(data_dir, name), exist_ok=True)
+            copied += [os.path.join(name, c_name) for c_name
+                       in copy_back(path, os.path.join(data_dir, name))]
+        elif os.path.isfile(path):
+            # - Copied - never linked: the staged products can be rewritten
+            # - in place by a following run
+            dst_path = os.path.join(data_dir, name)
+            tmp_path = f'{dst_path}.{os.getpid()}.tmp'
+            shutil.copy2(path, tmp_path)
+            os.replace(tmp_path, dst_path)
+            copied.append(name)
+    return copied
+
+
+class ScratchArea:
+    """
+    Node-local staging area shared by the pairs processed on the node
+    :param scratch_dir: absolute path to the scratch directory - e.g. a
+                        NVMe mount point or /dev/shm
+    :param budget: space budget [GB] - def. None: BUDGET_FRACTION of the
+                   scratch file system size
+    """
+    def __init__(self, scratch_dir: str, budget: float = None):
+        self.scratch_dir = scratch_dir
+        os.makedirs(scratch_dir, exist_ok=True)
+        if budget is None:
+            self.budget \
+                = int(shutil.disk_usage(scratch_dir).total * BUDGET_FRACTION)
+        else:
+            self.budget = int(budget * 1024 ** 3)
+        self.lock_path = os.path.join(scratch_dir, f'.{ENTRY_PREFIX}lock')
+        self.pinned = []
+
+    def entry_dir(self, name: str) -> str:
+        """
+        Directory of a staging area entry
+        :param name: entry name
+        :return: absolute path to the entry directory
+        """
+        return os.path.join(self.scratch_dir, f'{ENTRY_PREFIX}{name}')
+
+    def _lock(self):
+        """
+        Exclusive lock of the staging area
+        :return: open lock file - the lock is released when it is closed
+        """
+        l_fid = open(self.lock_path, 'a', encoding='utf8')
+        fcntl.flock(l_fid, fcntl.LOCK_EX)
+        return l_fid
+
+    def _pin(self, e_dir: str, reserve: int = 0) -> None:
+        """
+        Pin an entry - and mark it as used
+        :param e_dir: absolute path to the entry directory
+        :param reserve: space reserved for the files written to the entry
+                        [bytes] - counted by area_usage until released
+        :return: None
+        """
+        pins_dir = os.path.join(e_dir, '.pins')
+        os.makedirs(pins_dir, exist_ok=True)
+        with open(os.path.join(pins_dir, str(os.getpid())), 'w',
+                  encoding='utf8') as fid:
+            fid.write(str(reserve))
+        os.utime(e_dir)
+        self.pinned.append(e_dir)
+
+    @staticmethod
+    def _is_pinned(e_dir: str) -> bool:
+        """
+        Check if an entry is pinned by a running process
+        :param e_dir: absolute path to the entry directory
+        :return: True if the entry is in use
+        """
+        pins_dir = os.path.join(e_dir, '.pins')
+        if not os.path.isdir(pins_dir):
+            return False
+        return any(alive(int(pid)) for pid in os.listdir(pins_dir)
+                   if pid.isdigit())
+
+    def _evict(self, n_bytes: int) -> bool:
+        """
+        Evict the least recently used unpinned entries until n_bytes fit
+        the space budget - call with the staging area locked
+        :param n_bytes: space needed [bytes]
+        :return: True if the space needed fits the budget
+        """
+        entries = []
+        for name in os.listdir(self.scratch_dir):
+            e_dir = os.path.join(self.scratch_dir, name)
+            if not name.startswith(ENTRY_PREFIX) or not os.path.isdir(e_dir):
+                continue
+            if name.endswith('.tmp'):
+                # - Inputs being staged - removed if the process died
+                if not alive(int(name.split('.')[-2])):
+                    shutil.rmtree(e_dir, ignore_errors=True)
+            elif not self._is_pinned(e_dir):
+                entries.append((os.path.getmtime(e_dir), e_dir))
+        used = area_usage(self.scratch_dir)
+        for _, e_dir in sorted(entries):
+            if used + n_bytes <= self.budget:
+                break
+            shutil.rmtree(e_dir, ignore_errors=True)
+            print(f'# - Staging area: {os.path.basename(e_dir)} evicted.')
+            used = area_usage(self.scratch_dir)
+        return used + n_bytes <= self.budget
+
+    def _input_entry(self, path: str) -> str:
+        """
+        Staging area entry of an input file
+        :param path: absolute path to the input file
+        :return: absolute path to the entry directory
+        """
+        key = {'path': path, 'fingerprint': fingerprint(path)}
+        return self.entry_dir('in_' + hashlib.sha256(
+            json.dumps(key, sort_keys=True).encode('utf8')).hexdigest())
+
+    def stage_pair(self, pair_name: str, data_dir: str, inputs: list,
+                   reserve: int = 0) -> str:
+        """
+        Stage the inputs of a pair and create its staging directory
+        :param pair_name: pair name - <ref>-<sec>
+        :param data_dir: absolute path to the data directory
+        :param inputs: names of the input files in the data directory
+        :param reserve: space reserved for the intermediates [bytes]
+        :return: absolute path to the pair staging directory - None if the
+                 inputs and the reserved space do not fit the budget
+        """
+        in_paths = [os.path.join(data_dir, name) for name in inputs]
+        in_entries = [self._input_entry(path) for path in in_paths]
+        l_fid = self._lock()
+        try:
+            # - Pin the entries - they can not be evicted to make room for
+            # - the missing ones
+            # - The reservation is recorded in the pin of the staging
+            # - directory - counted by area_usage from now on
+            stage_dir = self.entry_dir(f'pair_{pair_name}')
+            self._pin(stage_dir, reserve=reserve)
+            for e_dir in in_entries:
+                if os.path.isdir(e_dir):
+                    self._pin(e_dir)
+            n_bytes = sum(os.path.getsize(path) for path, e_dir
+                          in zip(in_paths, in_entries)
+                          if not os.path.isdir(e_dir))
+            if not self._evict(n_bytes):
+                n_gb = (n_bytes + reserve) / 1024 ** 3
+                print(f'# - Staging area: {n_gb:.1f} GB needed by '
+                      f'{pair_name} do not fit the budget.')
+                self.release()
+                return None
+            # - Reserve the space of the missing inputs - recorded in the
+            # - pins of the entries being staged until they are copied
+            for path, e_dir in zip(in_paths, in_entries):
+                if not os.path.isdir(e_dir):
+                    tmp_dir = f'{e_dir}.{os.getpid()}.tmp'
+                    os.makedirs(tmp_dir)
+                    self._pin(tmp_dir, reserve=os.path.getsize(path))
+        finally:
+            l_fid.close()
+
+        # - Copy the missing inputs - one sequential read each
+        t_start = time.time()
+        for path, e_dir in zip(in_paths, in_entries):
+            tmp_dir = f'{e_dir}.{os.getpid()}.tmp'
+            if os.path.isdir(tmp_dir):
+                shutil.copy2(path, os.path.join(tmp_dir, 'input'))
+                try:
+                    os.rename(tmp_dir, e_dir)
+                except OSError:
+                    # - Staged concurrently by another pair
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                # - Pinned again - releases the reservation of the input
+                self._pin(e_dir)
+            publish(os.path.join(e_dir, 'input'),
+                    os.path.join(stage_dir, os.path.basename(path)))
+        print(f'# - Staging area: {len(inputs)} inputs of {pair_name} '
+              f'staged in {time.time() - t_start:.1f} s.')
+        return stage_dir
+
+    def release(self) -> None:
+        """
+        Unpin the entries pinned by this process - they become evictable
+        :return: None
+        """
+        for e_dir in self.pinned:
+            pin_path = os.path.join(e_dir, '.pins', str(os.getpid()))
+            if os.path.isfile(pin_path):
+                os.remove(pin_path)
+            if os.path.isdir(e_dir):
+                os.utime(e_dir)
+        self.pinned = []
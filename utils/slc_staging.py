@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+Per-chunk SLC slab staging. Instead of letting each AMPCOR process seek
+into the full reference and secondary SLCs on shared storage, the azimuth
+slab needed by a chunk - padded by the correlation window and search
+margins - is copied from each SLC to node-local scratch with a single
+sequential read.
+The chunk .in file is rewritten for the slabs: the azimuth lines and the
+initial azimuth offset are expressed in slab coordinates. The offsets
+written by AMPCOR are converted back to full scene coordinates:
+    y = y_slab + ref_start
+    azimuth_offset = azimuth_offset_slab + sec_start - ref_start
+where ref_start/sec_start are the first lines of the reference/secondary
+slabs.
+"""
+# - Python Dependencies
+import os
+import re
+import sys
+from utils.ampcor_chunks import read_ampcor_in, is_offset_line
+
+# - Bytes per pixel of the SLCs read by AMPCOR (complex float)
+PIXEL_BYTES = 8
+# - Sequential read block size [bytes]
+COPY_BLOCK = 2 ** 24
+# - Staging wrapper of the AMPCOR chunks
+SLAB_WRAPPER = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'ampcor_slab.py')
+
+
+def slab_extent(first: int, last: int, n_lines: int, pad: int) -> tuple:
+    """
+    Padded azimuth extent of a slab, clipped to the image
+    :param first: first needed line
+    :param last: last needed line
+    :param n_lines: image azimuth lines
+    :param pad: padding [lines]
+    :return: first line and number of lines of the slab
+    """
+    start = min(max(first - pad, 0), n_lines - 1)
+    stop = min(max(last + pad + 1, start + 1), n_lines)
+    return start, stop - start
+
+
+def copy_slab(slc_path: str, slab_path: str, width: int, start: int,
+              n_lines: int) -> int:
+    """
+    Copy an azimuth slab of an SLC - one sequential read
+    :param slc_path: absolute path to the SLC
+    :param slab_path: absolute path to the slab
+    :param width: SLC range samples
+    :param start: first slab line
+    :param n_lines: number of slab lines
+    :return: number of bytes copied
+    """
+    line_bytes = width * PIXEL_BYTES
+    n_bytes = n_lines * line_bytes
+    copied = 0
+    with open(slc_path, 'rb') as r_fid, open(slab_path, 'wb') as w_fid:
+        r_fid.seek(start * line_bytes)
+        while copied < n_bytes:
+            block = r_fid.read(min(COPY_BLOCK, n_bytes - copied))
+            if not block:
+                break
+            w_fid.write(block)
+            copied += len(block)
+    return copied
+
+
+def stage_chunk(in_path: str, stage_dir: str, pad: int = None) -> dict:
+    """
+    Copy the reference and secondary slabs of a chunk to the staging
+    directory and write the chunk .in file for the slabs (chunk.in). The
+    staged .in file uses file names relative to the staging directory.
+    :param in_path: absolute path to the chunk .in file
+    :param stage_dir: staging directory (node-local scratch)
+    :param pad: slab padding [lines] - def. reference window + search
+                window heights
+    :return: Python dictionary containing the staged .in and output
+             paths, the first lines of the slabs (ref_start, sec_start)
+             and the number of bytes read
+    """
+    params = read_ampcor_in(in_path)
+    in_dir = os.path.dirname(in_path)
+    with open(in_path, 'r', encoding='utf8') as fid:
+        lines = fid.readlines()
+    n_pix_ref, n_pix_sec = (int(v) for v in lines[3].split()[:2])
+    search_h = int(lines[7].split()[1])
+    x_off, y_off = (int(v) for v in lines[9].split()[:2])
+    if pad is None:
+        pad = params['window'][1] + search_h
+
+    # - Slabs: reference lines needed by the chunk and secondary lines
+    # - shifted by the initial azimuth offset
+    slc_paths = [os.path.join(in_dir, params['ref_slc']),
+                 os.path.join(in_dir, params['sec_slc'])]
+    widths = [n_pix_ref, n_pix_sec]
+    shifts = [0, y_off]
+    slabs = []
+    n_read = 0
+    for i_s, (slc_path, width, shift) in enumerate(zip(slc_paths, widths,
+                                                       shifts)):
+        n_lines = os.path.getsize(slc_path) // (width * PIXEL_BYTES)
+        start, count = slab_extent(params['y_first'] + shift,
+                                   params['y_last'] + shift, n_lines, pad)
+        slab_name = ('ref', 'sec')[i_s] + '.slc'
+        n_read += copy_slab(slc_path, os.path.join(stage_dir, slab_name),
+                            width, start, count)
+        slabs.append((slab_name, start))
+    (ref_name, ref_start), (sec_name, sec_start) = slabs
+
+    # - Chunk .in file in slab coordinates
+    lines[0] = ref_name + '\n'
+    lines[1] = sec_name + '\n'
+    lines[2] = 'chunk.off\n'
+    lines[4] = '{:6} {:8} {:3}\n'.format(params['y_first'] - ref_start,
+                                         params['y_last'] - ref_start,
+                                         params['line_spacing'])
+    lines[9] = '{:5} {:6}\n'.format(x_off, y_off - sec_start + ref_start)
+    staged_in = os.path.join(stage_dir, 'chunk.in')
+    with open(staged_in, 'w', encoding='utf8') as fid:
+        fid.writelines(lines)
+    return {'in_path': staged_in,
+            'out_path': os.path.join(stage_dir, 'chunk.off'),
+            'ref_start': ref_start, 'sec_start': sec_start,
+            'bytes': n_read}
+
+
+def staged_job(job: dict, scratch: str = None) -> dict:
+    """
+    Wrap the command of an AMPCOR chunk job with the staging wrapper
+    (ampcor_slab.py)
+    :param job: chunk job - see ampcor_chunks.ampcor_jobs
+    :param scratch: node-local scratch directory [def. None - $TMPDIR]
+    :return: staged chunk job
+    """
+    wrapper = [sys.executable, SLAB_WRAPPER]
+    if scratch:
+        wrapper += ['--scratch', scratch]
+    return {**job, 'cmd': wrapper + job['cmd']}
+
+
+def shift_field(line: str, index: int, delta: float) -> str:
+    """
+    Add a constant to a whitespace-separated field of a line, preserving
+    the field width - so that the line length is unchanged
+    :param line: text line
+    :param index: field index
+    :param delta: constant
+    :return: updated line
+    """
+    fields = list(re.finditer(r'\s*\S+', line))
+    field = fields[index].group()
+    token = field.strip()
+    if re.fullmatch(r'[+-]?\d+', token):
+        new_token = str(int(token) + int(delta))
+    else:
+        n_dec = len(token.split('.')[1]) if '.' in token else 0
+        new_token = f'{float(token) + delta:.{n_dec}f}'
+    new_field = new_token.rjust(len(field))
+    return line[:fields[index].start()] + new_field \
+        + line[fields[index].end():]
+
+
+def unstage_lines(lines: list, ref_start: int, sec_start: int) -> list:
+    """
+    Convert AMPCOR output lines from slab to full scene coordinates
+    :param lines: AMPCOR output lines
+    :param ref_start: first line of the reference slab
+    :param sec_start: first line of the secondary slab
+    :return: converted lines - lines without a valid offset are unchanged
+    """
+    out_lines = []
+    for line in lines:
+        if is_offset_line(line):
+            # - Columns: x, range offset, y, azimuth offset, ...
+            line = shift_field(line, 2, ref_start)
+            line = shift_field(line, 3, sec_start - ref_start)
+        out_lines.append(line)
+    return out_lines
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""
+Per-pair working directories. The GAMMA geocoding and topographic phase
+steps write products with fixed names (gc_icemap, DEM_gc_par, DEMice_gc,
+inc.geo, hgt_icemap, inc, gc_map_invert, sim_phase, DIFF_par). These are
+written with absolute paths inside a workspace unique to the pair, so
+that several pairs can be processed concurrently - as threads or
+processes - from the same directory, and the process working directory
+is never changed.
+The products read by the double difference scripts (gc_icemap,
+DEM_gc_par) are then published to the pair directory with an atomic
+hard link.
+"""
+# - Python Dependencies
+import os
+import shutil
+import threading
+
+
+def pair_workspace(out_dir: str, pair_name: str) -> str:
+    """
+    Create the workspace of a pair
+    :param out_dir: absolute path to the output directory
+    :param pair_name: pair name - <ref>-<sec>
+    :return: absolute path to the pair workspace
+    """
+    work_dir = os.path.join(os.path.abspath(out_dir), f'work_{pair_name}')
+    os.makedirs(work_dir, exist_ok=True)
+    return work_dir
+
+
+def publish(src_path: str, dst_path: str) -> None:
+    """
+    Publish a workspace product - hard link (copy across file systems)
+    replacing the destination atomically
+    :param src_path: absolute path to the workspace product
+    :param dst_path: absolute path to the published product
+    :return: None
+    """
+    tmp_path = f'{dst_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        os.link(src_path, tmp_path)
+    except OSError:
+        shutil.copy2(src_path, tmp_path)
+    os.replace(tmp_path, dst_path)